@@ -121,6 +121,12 @@ INTERNAL_IPS = [
     '127.0.0.1',
 ]
 
+# A second database to test the routing to a read replica
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': str(BASE_DIR) + '/replica.sqlite3',
+}
+
 EOF
 
   cat << EOF >> "${SITE_DIR}/urls.py"
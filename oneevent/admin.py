@@ -1,4 +1,4 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from .models import (
     Event,
     Session,
@@ -6,12 +6,16 @@ from .models import (
     Option,
     Booking,
     BookingOption,
+    BookingLogEntry,
     Category,
+    EventSeries,
+    OutboxMessage,
 )
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 from django.utils import timezone
 from django.contrib.admin.utils import unquote
+from . import bulk, cloning, series
 
 
 class EditLinkToInlineObjectMixin(object):
@@ -55,16 +59,29 @@ class LimitedAdminInlineMixin(object):
         This function fetches the queryset with available choices for a given
         `field` and filters it based on the criteria specified in filters,
         unless `empty=True`. In this case, no choices will be made available.
+
+        The choices are evaluated when the first form of the formset is rendered
+        and shared by all the others, instead of querying the database for each
+        of them.
         """
         assert field in formset.form.base_fields
 
-        qs = formset.form.base_fields[field].queryset
+        form_field = formset.form.base_fields[field]
+        qs = form_field.queryset
         if empty:
-            formset.form.base_fields[field].queryset = qs.none()
+            form_field.queryset = qs.none()
         else:
-            qs = qs.filter(**filters)
+            form_field.queryset = qs.filter(**filters)
+            iterator = form_field.choices
+            cache = []
+
+            def cached_choices():
+                if not cache:
+                    cache.extend(iter(iterator))
+                return cache
 
-            formset.form.base_fields[field].queryset = qs
+            # The function is shared, not copied, by the copies of the field
+            form_field.choices = cached_choices
 
     def get_formset(self, request, obj=None, **kwargs):
         """
@@ -144,7 +161,7 @@ class EventAdmin(admin.ModelAdmin):
         ("location_name", "location_address"),
         ("owner", "organisers"),
         ("booking_close", "choices_close"),
-        "max_participant",
+        ("max_participant", "admission_rate"),
         "price_currency",
     )
     inlines = (
@@ -152,23 +169,68 @@ class EventAdmin(admin.ModelAdmin):
         CategoryInline,
         ChoiceInline,
     )
-    list_display = ("title", "timezone", "start_local", "end_local")
+    list_display = ("title", "owner", "pub_status", "start_local", "end_local")
+    list_select_related = ("owner",)
+    list_filter = ("pub_status",)
+    search_fields = ("^title",)
+    date_hierarchy = "start"
+    raw_id_fields = ("owner",)
+    show_full_result_count = False
+    actions = ("clone_next_year",)
 
     dt_format = "%a, %d %b %Y %H:%M:%S %Z"
 
+    def clone_next_year(self, request, queryset):
+        """
+        Clone the configuration of the events to the same local date and time of the
+        following year, as unpublished events
+        """
+        cloned = 0
+        for event in queryset:
+            tz = event.timezone
+            local_start = event.start.astimezone(tz)
+            try:
+                local_start = local_start.replace(year=local_start.year + 1)
+            except ValueError:
+                # 29th of February
+                local_start = local_start.replace(year=local_start.year + 1, day=28)
+            start = tz.localize(local_start.replace(tzinfo=None))
+            title = "{0} ({1})".format(event.title, local_start.year)
+            if Event.objects.filter(title=title).exists():
+                self.message_user(
+                    request,
+                    "Event {0} already exists".format(title),
+                    level=messages.ERROR,
+                )
+                continue
+            cloning.clone_event(event, title, start, owner=request.user)
+            cloned += 1
+        self.message_user(request, "{0} event(s) cloned".format(cloned))
+
+    clone_next_year.short_description = "Clone the selected events one year later"
+
+    def _format_local(self, event, dt):
+        """
+        Format a datetime of an event in its local timezone, in memory for the rows
+        of the page only
+        """
+        return timezone.localtime(dt, event.timezone).strftime(self.dt_format)
+
     def start_local(self, event):
         """ Display the start datetime in its local timezone """
-        tz = event.timezone
-        dt = event.start.astimezone(tz)
-        return dt.strftime(self.dt_format)
+        return self._format_local(event, event.start)
+
+    start_local.short_description = "Start"
+    start_local.admin_order_field = "start"
 
     def end_local(self, event):
         """ Display the end datetime in its local timezone """
         if event.end is None:
             return None
-        tz = event.timezone
-        dt = event.end.astimezone(tz)
-        return dt.strftime(self.dt_format)
+        return self._format_local(event, event.end)
+
+    end_local.short_description = "End"
+    end_local.admin_order_field = "end"
 
     def add_view(self, request, form_url="", extra_context=None):
         """
@@ -212,11 +274,128 @@ class BookingOptionInline(LimitedAdminInlineMixin, admin.TabularInline):
         return []
 
 
+class CancelledListFilter(admin.SimpleListFilter):
+    title = "cancelled"
+    parameter_name = "cancelled"
+
+    def lookups(self, request, model_admin):
+        return (("yes", "Cancelled"), ("no", "Active"))
+
+    def queryset(self, request, queryset):
+        if self.value() == "yes":
+            return queryset.filter(cancelledOn__isnull=False)
+        if self.value() == "no":
+            return queryset.filter(cancelledOn__isnull=True)
+        return queryset
+
+
+class PaidListFilter(admin.SimpleListFilter):
+    title = "payment"
+    parameter_name = "paid"
+
+    def lookups(self, request, model_admin):
+        return (("paid", "Paid"), ("exempt", "Exempt"), ("unpaid", "Not paid"))
+
+    def queryset(self, request, queryset):
+        if self.value() == "paid":
+            return queryset.filter(paidTo__isnull=False, exempt_of_payment=False)
+        if self.value() == "exempt":
+            return queryset.filter(exempt_of_payment=True)
+        if self.value() == "unpaid":
+            return queryset.filter(paidTo__isnull=True, exempt_of_payment=False)
+        return queryset
+
+
 class BookingAdmin(admin.ModelAdmin):
     inlines = (BookingOptionInline,)
     list_display = ("event", "person", "cancelledBy", "cancelledOn", "confirmedOn")
+    list_select_related = ("event", "person", "cancelledBy")
+    list_filter = ("event", CancelledListFilter, PaidListFilter)
+    # Searches match the beginning of the fields only, case-insensitively. The
+    # migration 0023_user_search_indexes adds the matching indexes on the users for
+    # PostgreSQL and MySQL, the other databases scan them
+    search_fields = ("^person__username", "^person__last_name", "^person__email")
+    date_hierarchy = "created_at"
+    raw_id_fields = ("event", "person", "session", "cancelledBy", "paidTo")
+    # Counting all the bookings on each page load is slow on large tables
+    show_full_result_count = False
+    actions = ("confirm_payments", "exempt_of_payment", "cancel_bookings")
+
+    def _bulk_update(self, request, queryset, action):
+        """
+        Apply a change of state to the selected bookings, then report the result
+        """
+        ids = queryset.values_list("id", flat=True)
+        summary = bulk.update_bookings(request.user, action, ids)
+        self.message_user(
+            request, "{0} booking(s) updated".format(len(summary["updated"]))
+        )
+        for booking_id, error in sorted(summary["errors"].items()):
+            self.message_user(
+                request,
+                "Booking {0}: {1}".format(booking_id, error),
+                level=messages.WARNING,
+            )
+
+    def confirm_payments(self, request, queryset):
+        self._bulk_update(request, queryset, bulk.ACTION_PAY)
+
+    confirm_payments.short_description = "Confirm the payment of the selected bookings"
+
+    def exempt_of_payment(self, request, queryset):
+        self._bulk_update(request, queryset, bulk.ACTION_EXEMPT)
+
+    exempt_of_payment.short_description = "Exempt the selected bookings of payment"
+
+    def cancel_bookings(self, request, queryset):
+        self._bulk_update(request, queryset, bulk.ACTION_CANCEL)
+
+    cancel_bookings.short_description = "Cancel the selected bookings"
+
+
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("booking", "kind", "status", "attempts", "next_attempt_at")
+    list_filter = ("status", "kind")
+    readonly_fields = ("booking", "created_at", "sent_at", "last_error")
+
+
+class BookingLogEntryAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "event", "booking_id", "person", "action", "actor")
+    list_filter = ("action",)
+    list_select_related = ("event", "person", "actor")
+
+    # The log is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class EventSeriesAdmin(admin.ModelAdmin):
+    list_display = ("title", "prototype", "frequency", "interval", "count", "until")
+    readonly_fields = ("next_index",)
+    raw_id_fields = ("prototype",)
+    actions = ("expand_next",)
+
+    # Number of occurrences created by the admin action
+    expand_count = 4
+
+    def expand_next(self, request, queryset):
+        created = 0
+        for event_series in queryset:
+            created += len(series.expand(event_series, self.expand_count))
+        self.message_user(request, "{0} occurrence(s) created".format(created))
+
+    expand_next.short_description = "Create the next occurrences of the selected series"
 
 
 admin.site.register(Event, EventAdmin)
 admin.site.register(Choice, ChoiceAdmin)
 admin.site.register(Booking, BookingAdmin)
+admin.site.register(OutboxMessage, OutboxMessageAdmin)
+admin.site.register(BookingLogEntry, BookingLogEntryAdmin)
+admin.site.register(EventSeries, EventSeriesAdmin)
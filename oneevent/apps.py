@@ -11,6 +11,9 @@ class OneEventConfig(AppConfig):
     default_auto_field = 'django.db.models.AutoField'
 
     def ready(self):
+        # Connect the signal handlers
+        from . import signals  # noqa: F401
+
         # Default customisable settings
         site_brand = getattr(settings, "ONEEVENT_SITE_BRAND", self.verbose_name)
         setattr(settings, "ONEEVENT_SITE_BRAND", site_brand)
@@ -21,6 +24,59 @@ class OneEventConfig(AppConfig):
         calendar_invite_from = getattr(settings, "ONEEVENT_CALENDAR_INVITE_FROM", None)
         setattr(settings, "ONEEVENT_CALENDAR_INVITE_FROM", calendar_invite_from)
 
+        metrics_enabled = getattr(settings, "ONEEVENT_METRICS_ENABLED", False)
+        setattr(settings, "ONEEVENT_METRICS_ENABLED", metrics_enabled)
+
+        export_cache_dir = getattr(settings, "ONEEVENT_EXPORT_CACHE_DIR", None)
+        setattr(settings, "ONEEVENT_EXPORT_CACHE_DIR", export_cache_dir)
+
+        export_cache_max_size = getattr(
+            settings, "ONEEVENT_EXPORT_CACHE_MAX_SIZE", 100 * 1024 * 1024
+        )
+        setattr(settings, "ONEEVENT_EXPORT_CACHE_MAX_SIZE", export_cache_max_size)
+
+        page_cache_timeout = getattr(settings, "ONEEVENT_PAGE_CACHE_TIMEOUT", None)
+        setattr(settings, "ONEEVENT_PAGE_CACHE_TIMEOUT", page_cache_timeout)
+
+        page_cache_stale_timeout = getattr(
+            settings, "ONEEVENT_PAGE_CACHE_STALE_TIMEOUT", 10
+        )
+        setattr(settings, "ONEEVENT_PAGE_CACHE_STALE_TIMEOUT", page_cache_stale_timeout)
+
+        fragment_cache_timeout = getattr(
+            settings, "ONEEVENT_FRAGMENT_CACHE_TIMEOUT", None
+        )
+        setattr(settings, "ONEEVENT_FRAGMENT_CACHE_TIMEOUT", fragment_cache_timeout)
+
+        read_replica = getattr(settings, "ONEEVENT_READ_REPLICA", None)
+        setattr(settings, "ONEEVENT_READ_REPLICA", read_replica)
+
+        read_replica_pin_seconds = getattr(
+            settings, "ONEEVENT_READ_REPLICA_PIN_SECONDS", 10
+        )
+        setattr(settings, "ONEEVENT_READ_REPLICA_PIN_SECONDS", read_replica_pin_seconds)
+
+        idempotency_key_ttl = getattr(
+            settings, "ONEEVENT_IDEMPOTENCY_KEY_TTL", 24 * 60 * 60
+        )
+        setattr(settings, "ONEEVENT_IDEMPOTENCY_KEY_TTL", idempotency_key_ttl)
+
+        idempotency_lease_seconds = getattr(
+            settings, "ONEEVENT_IDEMPOTENCY_LEASE_SECONDS", 60
+        )
+        setattr(
+            settings, "ONEEVENT_IDEMPOTENCY_LEASE_SECONDS", idempotency_lease_seconds
+        )
+
+        waiting_room_admission_seconds = getattr(
+            settings, "ONEEVENT_WAITING_ROOM_ADMISSION_SECONDS", 5 * 60
+        )
+        setattr(
+            settings,
+            "ONEEVENT_WAITING_ROOM_ADMISSION_SECONDS",
+            waiting_room_admission_seconds,
+        )
+
         # add context processors
         template_engines = getattr(settings, "TEMPLATES", [])
         for template_engine in template_engines:
@@ -0,0 +1,98 @@
+"""
+Archival of the bookings of long-ended events.
+
+The bookings and booking options of archived events are moved from the Booking and
+BookingOption tables to ArchivedBooking and ArchivedBookingOption, so the hot tables
+and their indexes only hold the bookings of live events. Bookings are moved in
+batches, each in its own transaction, keeping their IDs. Event.get_bookings() reads
+them from the right table.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.db.models.query_utils import Q
+from django.utils import timezone
+
+from . import page_cache
+from .models import (
+    Event,
+    Booking,
+    BookingOption,
+    ArchivedBooking,
+    ArchivedBookingOption,
+)
+from .signals import tombstones_disabled, versions_disabled
+
+
+def _copied_fields(model):
+    return [
+        field.attname
+        for field in model._meta.concrete_fields
+        if field.name != "archived_on"
+    ]
+
+
+def archivable_events(ended_before):
+    """
+    The events that ended before a datetime and are not archived yet
+    """
+    ended = Q(end__lt=ended_before) | Q(end=None, start__lt=ended_before)
+    return Event.objects.filter(ended, archived_on__isnull=True)
+
+
+def _move_batch(event, batch_size, archived_on):
+    """
+    Move a batch of bookings of an event to the archive tables, in one transaction
+    @return: the number of bookings moved
+    """
+    with transaction.atomic():
+        ids = list(
+            Booking.objects.filter(event=event)
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+
+        bookings = Booking.objects.filter(id__in=ids).order_by("id")
+        ArchivedBooking.objects.bulk_create(
+            ArchivedBooking(archived_on=archived_on, **values)
+            for values in bookings.values(*_copied_fields(ArchivedBooking))
+        )
+        booking_options = BookingOption.objects.filter(booking__in=ids).order_by("id")
+        ArchivedBookingOption.objects.bulk_create(
+            ArchivedBookingOption(**values)
+            for values in booking_options.values(*_copied_fields(ArchivedBookingOption))
+        )
+        with tombstones_disabled(), versions_disabled():
+            bookings.delete()
+        return len(ids)
+
+
+def archive_event(event, batch_size=500, progress=None):
+    """
+    Move all the bookings of an event to the archive tables, then mark it as archived
+    @param batch_size: the maximum number of bookings moved in each transaction
+    @param progress: if given, called with the number of bookings moved after each
+    batch
+    @return: the number of bookings moved
+    """
+    archived_on = timezone.now()
+    total = 0
+    while True:
+        moved = _move_batch(event, batch_size, archived_on)
+        if not moved:
+            break
+        total += moved
+        if progress is not None:
+            progress(total)
+
+    Event.objects.filter(id=event.id).update(
+        archived_on=archived_on,
+        pub_status="ARCH",
+        content_version=F("content_version") + 1,
+        content_updated_at=timezone.now(),
+    )
+    page_cache.events_changed([event.id])
+    event.archived_on = archived_on
+    event.pub_status = "ARCH"
+    return total
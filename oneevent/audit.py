@@ -0,0 +1,113 @@
+"""
+Append-only log of the changes of state of the bookings.
+
+Views record the changes with log(). Within a buffered() block, typically a whole
+request, the entries are kept in memory and written with a single bulk_create()
+when the block exits, instead of one INSERT per change.
+"""
+import datetime
+import threading
+from contextlib import contextmanager
+
+from django.db.models.aggregates import Count, Max
+from django.db.models.functions import TruncMinute
+
+from .models import BookingLogEntry
+
+
+# Maximum number of minutes in a series of booking_rate()
+MAX_RATE_MINUTES = 24 * 60
+
+_local = threading.local()
+
+
+@contextmanager
+def buffered():
+    """
+    Context manager (or decorator) buffering the log entries of its block.
+    Nested blocks share the buffer of the outermost one. Entries are discarded if
+    the block raises an exception, as the changes they describe are usually rolled
+    back as well.
+    """
+    if getattr(_local, "entries", None) is not None:
+        yield
+        return
+
+    _local.entries = []
+    try:
+        yield
+        entries = _local.entries
+    finally:
+        _local.entries = None
+    if entries:
+        BookingLogEntry.objects.bulk_create(entries)
+
+
+def log(booking, action, actor=None, details=""):
+    """
+    Record a change of state of a booking
+    @param action: one of the BookingLogEntry.ACTION_* values
+    @param actor: the user making the change, if any
+    @param details: a short description of the change, e.g. the new session
+    @return: the BookingLogEntry, which is only saved when the buffer is flushed
+    """
+    if actor is not None and not actor.is_authenticated:
+        actor = None
+    entry = BookingLogEntry(
+        event_id=booking.event_id,
+        booking_id=booking.id,
+        person_id=booking.person_id,
+        actor=actor,
+        action=action,
+        details=details[:256],
+    )
+    entries = getattr(_local, "entries", None)
+    if entries is None:
+        entry.save()
+    else:
+        entries.append(entry)
+    return entry
+
+
+def booking_rate(event, action=BookingLogEntry.ACTION_CONFIRM, start=None, end=None):
+    """
+    Compute the number of booking changes per minute for an event, e.g. to analyse
+    the registration rushes
+    @param action: the action to count, confirmations by default
+    @param start: if given, ignore the changes before this datetime, else count the
+    last MAX_RATE_MINUTES minutes up to the last change
+    @param end: if given, ignore the changes after this datetime
+    @return: a list of (minute, count) sorted by minute, including the minutes
+    without any change between the first and the last counted ones, over
+    MAX_RATE_MINUTES minutes at most up to the last one
+    """
+    entries = BookingLogEntry.objects.filter(event=event, action=action)
+    if end is not None:
+        entries = entries.filter(created_at__lte=end)
+    if start is None:
+        last = entries.aggregate(last=Max("created_at"))["last"]
+        if last is None:
+            return []
+        start = last.replace(second=0, microsecond=0) - datetime.timedelta(
+            minutes=MAX_RATE_MINUTES - 1
+        )
+    entries = entries.filter(created_at__gte=start)
+    counts = (
+        entries.annotate(minute=TruncMinute("created_at"))
+        .values_list("minute")
+        .annotate(count=Count("id"))
+        .order_by("minute")
+    )
+    counts = dict(counts)
+    if not counts:
+        return []
+
+    series = []
+    last_minute = max(counts)
+    minute = max(
+        min(counts), last_minute - datetime.timedelta(minutes=MAX_RATE_MINUTES - 1)
+    )
+    while minute <= last_minute:
+        series.append((minute, counts.get(minute, 0)))
+        minute += datetime.timedelta(minutes=1)
+    return series
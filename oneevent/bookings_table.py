@@ -0,0 +1,187 @@
+"""
+Paginated table of the bookings of an event, on its management page.
+
+The bookings are filtered in SQL (active or cancelled, payment status, category,
+session and name) and paged with a keyset paginator: each page starts right after
+the sort key of the last row of the previous page, kept in an opaque cursor, so a
+page costs the same whatever its position in the table. Sorting by creation uses
+the (event, created_at, id) index of the bookings.
+"""
+import base64
+import json
+
+from django.db.models import prefetch_related_objects
+from django.db.models.query_utils import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import Category
+
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+STATUS_ACTIVE = "active"
+STATUS_CANCELLED = "cancelled"
+PAID = "paid"
+EXEMPT = "exempt"
+UNPAID = "unpaid"
+
+# Sort name: fields of the sort key, before the ID of the bookings
+SORTS = {
+    "created": ("created_at",),
+    "name": ("person__last_name", "person__first_name"),
+}
+DEFAULT_SORT = "created"
+
+
+def _parse_sort(sort):
+    """
+    @return: a tuple (sort key fields, descending)
+    @raise ValueError: if the sort is not valid
+    """
+    descending = sort.startswith("-")
+    fields = SORTS.get(sort.lstrip("-"))
+    if fields is None:
+        raise ValueError("Invalid sort: {0}".format(sort))
+    return fields, descending
+
+
+def encode_cursor(sort, values, booking_id):
+    """
+    Encode the position after a booking as an opaque string
+    @param values: the values of the sort key fields for the booking
+    """
+    values = [v.isoformat() if hasattr(v, "isoformat") else v for v in values]
+    text = json.dumps([sort, values, booking_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, sort):
+    """
+    Decode a cursor returned by encode_cursor() for the same sort
+    @return: a tuple (values of the sort key fields, booking ID)
+    @raise ValueError: if the cursor is not valid
+    """
+    fields, _ = _parse_sort(sort)
+    try:
+        cursor_sort, values, booking_id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode("ascii"))
+        )
+        if (
+            cursor_sort != sort
+            or len(values) != len(fields)
+            or not isinstance(booking_id, int)
+        ):
+            raise ValueError
+        if fields == SORTS["created"]:
+            values = [parse_datetime(values[0])]
+            if values[0] is None:
+                raise ValueError
+    except (TypeError, ValueError, UnicodeError, AttributeError):
+        raise ValueError("Invalid cursor: {0}".format(cursor))
+    return values, booking_id
+
+
+def filter_bookings(bookings, status="", paid="", category=None, session=None, q=""):
+    """
+    Filter the bookings of an event
+    @param status: STATUS_ACTIVE, STATUS_CANCELLED or "" for all the bookings
+    @param paid: PAID, EXEMPT, UNPAID or "" for all the bookings
+    @param category: the Category of the participants, or None
+    @param session: the Session of the bookings, or None
+    @param q: the beginning of the username, first name, last name or email of the
+    participants
+    """
+    if status == STATUS_ACTIVE:
+        bookings = bookings.filter(cancelledOn__isnull=True)
+    elif status == STATUS_CANCELLED:
+        bookings = bookings.filter(cancelledOn__isnull=False)
+
+    if paid == PAID:
+        bookings = bookings.filter(paidTo__isnull=False, exempt_of_payment=False)
+    elif paid == EXEMPT:
+        bookings = bookings.filter(exempt_of_payment=True)
+    elif paid == UNPAID:
+        bookings = bookings.filter(paidTo__isnull=True, exempt_of_payment=False)
+
+    if category is not None:
+        # Participants get the first category matching them
+        bookings = bookings.filter(person__in=category.get_members())
+        previous_categories = Category.objects.filter(
+            event_id=category.event_id, order__lt=category.order
+        )
+        for previous in previous_categories:
+            bookings = bookings.exclude(person__in=previous.get_members())
+
+    if session is not None:
+        bookings = bookings.filter(session=session)
+
+    if q:
+        bookings = bookings.filter(
+            Q(person__username__istartswith=q)
+            | Q(person__first_name__istartswith=q)
+            | Q(person__last_name__istartswith=q)
+            | Q(person__email__istartswith=q)
+        )
+    return bookings
+
+
+def _after(bookings, fields, values, booking_id, descending):
+    """
+    Filter the bookings strictly after a position in the (fields..., id) order
+    """
+    lookup = "__lt" if descending else "__gt"
+    keys = list(zip(fields, values)) + [("id", booking_id)]
+    query = Q()
+    for index, (field, value) in enumerate(keys):
+        equal = dict(keys[:index])
+        query |= Q(**equal, **{field + lookup: value})
+    return bookings.filter(query)
+
+
+def get_page(event, filters=None, sort=DEFAULT_SORT, cursor=None, limit=DEFAULT_LIMIT):
+    """
+    Get a page of the bookings of an event
+    @param filters: a dict of keyword arguments of filter_bookings()
+    @param sort: one of SORTS, prefixed by "-" for the descending order
+    @param cursor: the next_cursor of the previous page, or None for the first page
+    @param limit: the maximum number of bookings in the page
+    @return: a dict with the "bookings" of the page, the "next_cursor" and whether
+    there are "more" bookings after this page
+    @raise ValueError: if the sort or the cursor is not valid
+    """
+    fields, descending = _parse_sort(sort)
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    bookings = filter_bookings(event.get_bookings(), **(filters or {}))
+    if cursor:
+        values, booking_id = decode_cursor(cursor, sort)
+        bookings = _after(bookings, fields, values, booking_id, descending)
+    order = list(fields) + ["id"]
+    if descending:
+        order = ["-" + field for field in order]
+    bookings = bookings.select_related("person", "session", "cancelledBy", "paidTo")
+    bookings = bookings.prefetch_related("options__option").order_by(*order)
+    bookings = list(bookings[: limit + 1])
+    more = len(bookings) > limit
+    bookings = bookings[:limit]
+
+    # The categories are prefetched so the payment status of the bookings only
+    # queries the users cache
+    prefetch_related_objects([event], "categories")
+    for booking in bookings:
+        booking.event = event
+
+    next_cursor = None
+    if bookings:
+        last = bookings[-1]
+        values = [_get_value(last, field) for field in fields]
+        next_cursor = encode_cursor(sort, values, last.id)
+    return {"bookings": bookings, "next_cursor": next_cursor, "more": more}
+
+
+def _get_value(booking, field):
+    value = booking
+    for name in field.split("__"):
+        value = getattr(value, name)
+    return value
@@ -0,0 +1,121 @@
+"""
+Changes of state applied to many bookings at once, e.g. to confirm the payments
+collected at the door of an event.
+
+The bookings are grouped by event, with one permission check per event, and
+validated in memory with the rules of Booking.clean(). The accepted changes are then
+applied with a single UPDATE and logged in bulk.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import audit, metrics
+from .models import Event, Booking, BookingLogEntry
+from .versions import bump_content_version
+
+
+ACTION_PAY = "pay"
+ACTION_EXEMPT = "exempt"
+ACTION_CANCEL = "cancel"
+ACTIONS = (ACTION_PAY, ACTION_EXEMPT, ACTION_CANCEL)
+
+
+def _check_pay(booking):
+    if booking.paidTo_id is not None:
+        return "Payment already confirmed"
+    if booking.must_pay() == 0:
+        return "{0} does not have to pay for {1}".format(
+            booking.person, booking.event
+        )
+    return None
+
+
+def _check_exempt(booking):
+    if booking.exempt_of_payment:
+        return "This booking is already exempt of payment"
+    return None
+
+
+def _check_cancel(booking):
+    if booking.is_cancelled():
+        return "This booking is already cancelled"
+    return None
+
+
+def _get_changes(action, user, now):
+    """
+    @return: a tuple (check function, updated values, log action) for an action
+    """
+    if action == ACTION_PAY:
+        values = {"paidTo": user, "datePaid": now}
+        return _check_pay, values, BookingLogEntry.ACTION_PAY
+    if action == ACTION_EXEMPT:
+        values = {"paidTo": user, "datePaid": now, "exempt_of_payment": True}
+        return _check_exempt, values, BookingLogEntry.ACTION_EXEMPT
+    if action == ACTION_CANCEL:
+        values = {"confirmedOn": None, "cancelledBy": user, "cancelledOn": now}
+        return _check_cancel, values, BookingLogEntry.ACTION_CANCEL
+    raise ValueError("Invalid action: {0}".format(action))
+
+
+@transaction.atomic
+def update_bookings(user, action, booking_ids, event=None):
+    """
+    Apply the same change of state to several bookings
+    @param user: the user making the change, who must be allowed to update the
+    events of the bookings
+    @param action: one of ACTIONS
+    @param booking_ids: the IDs of the bookings to update
+    @param event: if given, the bookings of other events are reported as not found
+    @return: a dict with the list of the "updated" booking IDs, and the "errors"
+    mapping the other booking IDs to the reason they were not updated
+    """
+    now = timezone.now()
+    check, values, log_action = _get_changes(action, user, now)
+    booking_ids = set(booking_ids)
+
+    bookings = (
+        Booking.objects.filter(id__in=booking_ids)
+        .select_related("person")
+        .select_for_update(of=("self",))
+        .order_by("id")
+    )
+    if event is not None:
+        bookings = bookings.filter(event=event)
+    bookings = list(bookings)
+    # The categories are prefetched so must_pay() only queries the users cache
+    events = Event.objects.filter(
+        id__in={booking.event_id for booking in bookings}
+    ).prefetch_related("categories")
+    events = {e.id: e for e in events}
+
+    allowed = {}
+    updated = []
+    errors = {}
+    for booking in bookings:
+        booking.event = events[booking.event_id]
+        if booking.event_id not in allowed:
+            allowed[booking.event_id] = booking.event.user_can_update(user)
+        if not allowed[booking.event_id]:
+            error = "You are not authorised to manage the bookings of this event"
+        else:
+            error = check(booking)
+        if error is None:
+            updated.append(booking)
+        else:
+            errors[booking.id] = error
+    for booking_id in booking_ids.difference(b.id for b in bookings):
+        errors[booking_id] = "Booking not found"
+
+    if updated:
+        Booking.objects.filter(id__in=[b.id for b in updated]).update(
+            updated_at=now, **values
+        )
+        bump_content_version({b.event_id for b in updated})
+        with audit.buffered():
+            for booking in updated:
+                audit.log(booking, log_action, user)
+        if action == ACTION_CANCEL:
+            metrics.BOOKINGS_CANCELLED.inc(len(updated))
+
+    return {"updated": [b.id for b in updated], "errors": errors}
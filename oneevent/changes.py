@@ -0,0 +1,157 @@
+"""
+Change feed of the bookings of an event, for the incremental sync of external systems.
+
+Consumers page through the bookings modified since their last sync, ordered by
+(updated_at, id), and through the tombstones of the bookings and booking options
+deleted meanwhile. The position in both streams is kept in an opaque cursor, so each
+page is an indexed range scan whatever the number of bookings of the event.
+"""
+import base64
+import json
+
+from django.db.models import Prefetch
+from django.db.models.query_utils import Q
+from django.utils.dateparse import parse_datetime
+
+from .models import Booking, BookingOption, BookingTombstone
+
+
+MAX_LIMIT = 1000
+
+BOOKING_FIELDS = (
+    "id",
+    "person_id",
+    "session_id",
+    "confirmedOn",
+    "cancelledBy_id",
+    "cancelledOn",
+    "paidTo_id",
+    "datePaid",
+    "exempt_of_payment",
+    "created_at",
+    "updated_at",
+)
+
+
+def encode_cursor(position):
+    """
+    Encode the position in the feed as an opaque string
+    @param position: a dict mapping the stream names to a (datetime, id) tuple
+    """
+    data = {
+        name: [timestamp.isoformat(), row_id]
+        for name, (timestamp, row_id) in position.items()
+    }
+    text = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return base64.urlsafe_b64encode(text.encode("ascii")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor returned by encode_cursor()
+    @return: a dict mapping the stream names to a (datetime, id) tuple
+    @raise ValueError: if the cursor is not valid
+    """
+    if not cursor:
+        return {}
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        position = {}
+        for name, (timestamp, row_id) in data.items():
+            timestamp = parse_datetime(timestamp)
+            if timestamp is None or not isinstance(row_id, int):
+                raise ValueError
+            position[name] = (timestamp, row_id)
+    except (TypeError, ValueError, UnicodeError, AttributeError):
+        raise ValueError("Invalid cursor: {0}".format(cursor))
+    return position
+
+
+def _after(queryset, field, position):
+    """
+    Filter the rows strictly after position in the (field, id) order
+    """
+    if position is None:
+        return queryset
+    timestamp, row_id = position
+    return queryset.filter(
+        Q(**{field + "__gt": timestamp}) | Q(**{field: timestamp, "id__gt": row_id})
+    )
+
+
+def _page(queryset, field, position, limit):
+    """
+    @return: (rows, has_more) for the page of rows after position
+    """
+    rows = list(_after(queryset, field, position).order_by(field, "id")[: limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+def get_changes(event, cursor=None, limit=100):
+    """
+    Get a page of the changes made to the bookings of an event
+    @param cursor: the next_cursor of the previous page, or None to start from the
+    beginning
+    @param limit: the maximum number of bookings and of deletions in the page
+    @return: a dict with the changed "bookings", the "deleted" bookings and options,
+    the "next_cursor" and whether there are "more" changes to fetch right away
+    @raise ValueError: if the cursor is not valid
+    """
+    position = decode_cursor(cursor)
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    bookings = Booking.objects.filter(event=event).prefetch_related(
+        Prefetch(
+            "options",
+            queryset=BookingOption.objects.order_by("id").only(
+                "id", "booking_id", "option_id", "created_at", "updated_at"
+            ),
+        )
+    )
+    bookings, more_bookings = _page(
+        bookings.only("event_id", *BOOKING_FIELDS),
+        "updated_at",
+        position.get("bookings"),
+        limit,
+    )
+    tombstones, more_tombstones = _page(
+        BookingTombstone.objects.filter(event_id=event.id),
+        "deleted_at",
+        position.get("deleted"),
+        limit,
+    )
+
+    if bookings:
+        position["bookings"] = (bookings[-1].updated_at, bookings[-1].id)
+    if tombstones:
+        position["deleted"] = (tombstones[-1].deleted_at, tombstones[-1].id)
+
+    return {
+        "bookings": [_booking_data(booking) for booking in bookings],
+        "deleted": [_tombstone_data(tombstone) for tombstone in tombstones],
+        "next_cursor": encode_cursor(position),
+        "more": more_bookings or more_tombstones,
+    }
+
+
+def _booking_data(booking):
+    data = {field: getattr(booking, field) for field in BOOKING_FIELDS}
+    data["options"] = [
+        {
+            "id": booking_option.id,
+            "option_id": booking_option.option_id,
+            "created_at": booking_option.created_at,
+            "updated_at": booking_option.updated_at,
+        }
+        for booking_option in booking.options.all()
+    ]
+    return data
+
+
+def _tombstone_data(tombstone):
+    return {
+        "booking_id": tombstone.booking_id,
+        "booking_option_id": tombstone.booking_option_id,
+        "option_id": tombstone.option_id,
+        "deleted_at": tombstone.deleted_at,
+    }
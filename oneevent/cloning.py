@@ -0,0 +1,189 @@
+"""
+Cloning of the configuration of events: categories with their groups, sessions,
+choices and options, but no bookings.
+
+Each related model is copied with a single bulk_create() whatever the number of
+clones and the size of the configuration. The new rows are then matched to their
+parents through the natural keys of the models (event title, category name, choice
+title), so the number of queries stays constant even on databases that do not
+return the IDs of bulk inserted rows.
+"""
+from django.db import transaction
+
+from . import page_cache
+from .models import Event, Category, Session, Choice, Option
+from .tz_utils import shift_local, tzdel
+
+
+# Event fields copied as-is, the others are set by the clone
+EVENT_COPIED_FIELDS = (
+    "timezone",
+    "description",
+    "location_name",
+    "location_address",
+    "max_participant",
+    "admission_rate",
+    "price_currency",
+)
+EVENT_SHIFTED_FIELDS = ("end", "booking_close", "choices_close")
+
+
+def local_delta(event, start):
+    """
+    The difference of local time between the start of an event and a datetime
+    @return: a timedelta to shift the local times of the event by
+    """
+    tz = event.timezone
+    return tzdel(start.astimezone(tz)) - tzdel(event.start.astimezone(tz))
+
+
+def clone_event(event, title, start, owner=None):
+    """
+    Create a new event with the configuration of an existing one
+    @param title: the title of the new event
+    @param start: the start of the new event. The other dates of the event and its
+    sessions are shifted by the same local time, so they keep the same time of day
+    in the timezone of the event
+    @param owner: the owner of the new event, by default the owner of event
+    @return: the new Event, unpublished
+    """
+    return clone_events(event, [(title, start)], owner)[0]
+
+
+@transaction.atomic
+def clone_events(event, occurrences, owner=None, pub_status="UNPUB", series=None):
+    """
+    Create several events with the configuration of an existing one, in a constant
+    number of queries
+    @param occurrences: an iterable of (title, start) for each new event, see
+    clone_event()
+    @param owner: the owner of the new events, by default the owner of event
+    @param pub_status: the publication status of the new events
+    @param series: the EventSeries the new events are occurrences of, if any
+    @return: the list of new Events, in the order of occurrences
+    """
+    occurrences = list(occurrences)
+    if not occurrences:
+        return []
+    tz = event.timezone
+
+    # Load the configuration of the source event
+    organiser_ids = list(event.organisers.values_list("id", flat=True))
+    categories = list(event.categories.all())
+    groups1 = list(
+        Category.groups1.through.objects.filter(category__event=event).values_list(
+            "category__name", "group_id"
+        )
+    )
+    groups2 = list(
+        Category.groups2.through.objects.filter(category__event=event).values_list(
+            "category__name", "group_id"
+        )
+    )
+    sessions = list(event.sessions.all())
+    choices = list(event.choices.all())
+    options = list(Option.objects.filter(choice__event=event).select_related("choice"))
+
+    # Create the events
+    clones = []
+    deltas = []
+    for title, start in occurrences:
+        delta = local_delta(event, start)
+        clone = Event(
+            title=title,
+            start=start,
+            owner_id=owner.id if owner is not None else event.owner_id,
+            pub_status=pub_status,
+            series=series,
+        )
+        for field in EVENT_COPIED_FIELDS:
+            setattr(clone, field, getattr(event, field))
+        for field in EVENT_SHIFTED_FIELDS:
+            setattr(clone, field, shift_local(getattr(event, field), delta, tz))
+        clones.append(clone)
+        deltas.append(delta)
+    Event.objects.bulk_create(clones)
+    ids = dict(
+        Event.objects.filter(title__in=[c.title for c in clones]).values_list(
+            "title", "id"
+        )
+    )
+    for clone in clones:
+        clone.id = ids[clone.title]
+
+    organisers_through = Event.organisers.through
+    user_field = Event.organisers.field.m2m_reverse_field_name()
+    organisers_through.objects.bulk_create(
+        organisers_through(event_id=clone.id, **{user_field + "_id": user_id})
+        for clone in clones
+        for user_id in organiser_ids
+    )
+
+    # Categories, with their groups
+    Category.objects.bulk_create(
+        Category(
+            event_id=clone.id,
+            order=category.order,
+            name=category.name,
+            price=category.price,
+        )
+        for clone in clones
+        for category in categories
+    )
+    if groups1 or groups2:
+        category_ids = {
+            (event_id, name): category_id
+            for category_id, event_id, name in Category.objects.filter(
+                event__in=clones
+            ).values_list("id", "event_id", "name")
+        }
+        for through, rows in (
+            (Category.groups1.through, groups1),
+            (Category.groups2.through, groups2),
+        ):
+            through.objects.bulk_create(
+                through(
+                    category_id=category_ids[(clone.id, name)], group_id=group_id
+                )
+                for clone in clones
+                for name, group_id in rows
+            )
+
+    Session.objects.bulk_create(
+        Session(
+            event_id=clone.id,
+            title=session.title,
+            start=shift_local(session.start, delta, tz),
+            end=shift_local(session.end, delta, tz),
+            max_participant=session.max_participant,
+        )
+        for clone, delta in zip(clones, deltas)
+        for session in sessions
+    )
+
+    # Choices, then their options
+    Choice.objects.bulk_create(
+        Choice(event_id=clone.id, title=choice.title)
+        for clone in clones
+        for choice in choices
+    )
+    if options:
+        choice_ids = {
+            (event_id, title): choice_id
+            for choice_id, event_id, title in Choice.objects.filter(
+                event__in=clones
+            ).values_list("id", "event_id", "title")
+        }
+        Option.objects.bulk_create(
+            Option(
+                choice_id=choice_ids[(clone.id, option.choice.title)],
+                title=option.title,
+                default=option.default,
+            )
+            for clone in clones
+            for option in options
+        )
+
+    # The new events may be published
+    page_cache.events_changed([clone.id for clone in clones])
+    return clones
@@ -0,0 +1,122 @@
+"""
+Routing of the read-only OneEvent views to a replica of the database.
+
+The views decorated with use_read_replica(), e.g. the lists of events and the
+exports, read from the database alias given by ONEEVENT_READ_REPLICA when it is
+set. ReadReplicaRouter must then be added to DATABASE_ROUTERS, and
+PinPrimaryMiddleware to MIDDLEWARE after the SessionMiddleware: after a request
+writing to the database, the session is pinned to the primary database for
+ONEEVENT_READ_REPLICA_PIN_SECONDS, so the users always see their own changes
+whatever the replication lag.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.http.response import FileResponse
+
+
+PIN_SESSION_KEY = "oneevent_primary_pinned_until"
+
+_local = threading.local()
+
+
+@contextmanager
+def reading_from(alias):
+    """
+    Send the reads made within this block to a database alias
+    """
+    previous = getattr(_local, "read_alias", None)
+    _local.read_alias = alias
+    try:
+        yield
+    finally:
+        _local.read_alias = previous
+
+
+def _stream_from(alias, content):
+    with reading_from(alias):
+        yield from content
+
+
+def _is_pinned(request):
+    session = getattr(request, "session", None)
+    return session is not None and session.get(PIN_SESSION_KEY, 0) > time.time()
+
+
+def use_read_replica(view):
+    """
+    Decorator of a read-only view, reading from ONEEVENT_READ_REPLICA for the GET
+    requests of the sessions not pinned to the primary database
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        alias = settings.ONEEVENT_READ_REPLICA
+        if (
+            alias is None
+            or request.method not in ("GET", "HEAD")
+            or _is_pinned(request)
+        ):
+            return view(request, *args, **kwargs)
+
+        # The session and the user are read from the primary, as they may have just
+        # been created
+        request.user.is_authenticated
+        with reading_from(alias):
+            response = view(request, *args, **kwargs)
+        if response.streaming and not isinstance(response, FileResponse):
+            response.streaming_content = _stream_from(alias, response.streaming_content)
+        return response
+
+    return wrapper
+
+
+class ReadReplicaRouter(object):
+    """
+    Database router reading from the replica within the views decorated with
+    use_read_replica(), and recording the writes for PinPrimaryMiddleware
+    """
+
+    def db_for_read(self, model, **hints):
+        return getattr(_local, "read_alias", None)
+
+    def db_for_write(self, model, **hints):
+        _local.writes = getattr(_local, "writes", 0) + 1
+        instance = hints.get("instance")
+        replica = settings.ONEEVENT_READ_REPLICA
+        if instance is not None and instance._state.db == replica:
+            # Objects read from the replica are written to the primary
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, settings.ONEEVENT_READ_REPLICA}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class PinPrimaryMiddleware(object):
+    """
+    Pin the session to the primary database after a request writing to it
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.writes = 0
+        response = self.get_response(request)
+        if (
+            settings.ONEEVENT_READ_REPLICA is not None
+            and _local.writes > 0
+            and hasattr(request, "session")
+        ):
+            request.session[PIN_SESSION_KEY] = (
+                time.time() + settings.ONEEVENT_READ_REPLICA_PIN_SECONDS
+            )
+        return response
@@ -0,0 +1,217 @@
+"""
+Deletion of user accounts with large booking histories.
+
+Deleting a user with user.delete() makes Django's collector load all the related
+bookings, booking options and owned events in memory, then delete them and clear the
+references to the user in a single transaction, locking the booking tables for as
+long as it takes. delete_user() processes the same cascade in bounded batches of
+primary keys instead, each in its own short transaction, before the final
+user.delete() which is left with little to do.
+
+The batches are deleted with raw DELETE queries, bypassing the signal handlers, so
+the tombstones of the change feed are written here in bulk.
+"""
+from django.db import transaction
+from django.db.models.query_utils import Q
+from django.utils import timezone
+
+from . import export_cache, page_cache
+from .models import (
+    Event,
+    Booking,
+    BookingOption,
+    BookingTombstone,
+    BookingLogEntry,
+    ArchivedBooking,
+    ArchivedBookingOption,
+    OutboxMessage,
+)
+from .signals import versions_disabled
+from .versions import bump_content_version
+
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def _pk_ranges(queryset, batch_size):
+    """
+    Yields the querysets of consecutive batches of rows, each limited to a range of
+    primary keys
+    """
+    last_pk = None
+    while True:
+        batch = queryset.order_by("pk")
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        pks = list(batch.values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return
+        yield queryset.filter(pk__gte=pks[0], pk__lte=pks[-1])
+        last_pk = pks[-1]
+
+
+def _update_batches(queryset, batch_size, **values):
+    """
+    Update the rows of a queryset in batches
+    @return: the number of rows updated
+    """
+    total = 0
+    for batch in _pk_ranges(queryset, batch_size):
+        with transaction.atomic():
+            total += batch.update(**values)
+    return total
+
+
+def _raw_delete(queryset):
+    return queryset._raw_delete(queryset.db)
+
+
+def _delete_bookings(bookings, batch_size, tombstones, progress=None):
+    """
+    Delete bookings in batches, along with their options and outbox messages
+    @param tombstones: whether to record the deletions in the change feed
+    @return: the number of bookings deleted
+    """
+    total = 0
+    for batch in _pk_ranges(bookings, batch_size):
+        with transaction.atomic():
+            booking_options = BookingOption.objects.filter(booking__in=batch)
+            if tombstones:
+                now = timezone.now()
+                deleted = [
+                    BookingTombstone(
+                        event_id=event_id,
+                        booking_id=booking_id,
+                        booking_option_id=booking_option_id,
+                        option_id=option_id,
+                        deleted_at=now,
+                    )
+                    for booking_option_id, option_id, booking_id, event_id in (
+                        booking_options.values_list(
+                            "id", "option_id", "booking_id", "booking__event"
+                        )
+                    )
+                ]
+                deleted.extend(
+                    BookingTombstone(
+                        event_id=event_id, booking_id=booking_id, deleted_at=now
+                    )
+                    for booking_id, event_id in batch.values_list("id", "event_id")
+                )
+                BookingTombstone.objects.bulk_create(deleted)
+            _raw_delete(booking_options)
+            _raw_delete(OutboxMessage.objects.filter(booking__in=batch))
+            total += _raw_delete(batch)
+        if progress is not None:
+            progress("bookings", total)
+    return total
+
+
+def _delete_archived_bookings(bookings, batch_size, progress=None):
+    """
+    Delete archived bookings in batches, along with their options
+    @return: the number of archived bookings deleted
+    """
+    total = 0
+    for batch in _pk_ranges(bookings, batch_size):
+        with transaction.atomic():
+            _raw_delete(ArchivedBookingOption.objects.filter(booking__in=batch))
+            total += _raw_delete(batch)
+        if progress is not None:
+            progress("archived bookings", total)
+    return total
+
+
+def delete_user(user, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """
+    Delete a user, with their bookings and the events they own
+    @param batch_size: the maximum number of rows deleted or updated in each
+    transaction
+    @param progress: if given, called with the name of the current step and the
+    number of rows processed so far in this step
+    @return: a dict with the number of rows processed by each step
+    """
+
+    def report(step, count):
+        stats[step] = count
+        if progress is not None:
+            progress(step, count)
+
+    stats = {}
+    # The other events whose bookings change, to bump their versions at the end
+    event_ids = set(
+        Booking.objects.filter(Q(person=user) | Q(cancelledBy=user) | Q(paidTo=user))
+        .exclude(event__owner=user)
+        .values_list("event_id", flat=True)
+        .distinct()
+    )
+
+    # Clear the references to the user in the records of other people
+    now = timezone.now()
+    for step, queryset, values in (
+        (
+            "cancellations",
+            Booking.objects.filter(cancelledBy=user),
+            {"cancelledBy": None, "updated_at": now},
+        ),
+        (
+            "payments",
+            Booking.objects.filter(paidTo=user),
+            {"paidTo": None, "updated_at": now},
+        ),
+        (
+            "archived cancellations",
+            ArchivedBooking.objects.filter(cancelledBy=user),
+            {"cancelledBy": None},
+        ),
+        (
+            "archived payments",
+            ArchivedBooking.objects.filter(paidTo=user),
+            {"paidTo": None},
+        ),
+        ("log actors", BookingLogEntry.objects.filter(actor=user), {"actor": None}),
+        ("log persons", BookingLogEntry.objects.filter(person=user), {"person": None}),
+    ):
+        report(step, _update_batches(queryset, batch_size, **values))
+
+    # The bookings of the user
+    stats["bookings"] = _delete_bookings(
+        Booking.objects.filter(person=user), batch_size, True, progress
+    )
+    stats["archived bookings"] = _delete_archived_bookings(
+        ArchivedBooking.objects.filter(person=user), batch_size, progress
+    )
+
+    # The events owned by the user, with all their bookings
+    events = 0
+    owned_ids = []
+    for event in Event.objects.filter(owner=user).order_by("id"):
+        stats["bookings"] += _delete_bookings(
+            Booking.objects.filter(event=event), batch_size, False
+        )
+        stats["archived bookings"] += _delete_archived_bookings(
+            ArchivedBooking.objects.filter(event=event), batch_size
+        )
+        for batch in _pk_ranges(event.booking_log.all(), batch_size):
+            with transaction.atomic():
+                _raw_delete(batch)
+        # The tombstones of a deleted event are of no use any more
+        for batch in _pk_ranges(
+            BookingTombstone.objects.filter(event_id=event.id), batch_size
+        ):
+            with transaction.atomic():
+                _raw_delete(batch)
+        owned_ids.append(event.id)
+        with versions_disabled():
+            event.delete()
+        events += 1
+        report("events", events)
+    stats.setdefault("events", 0)
+    bump_content_version(event_ids)
+    # The deleted events are no longer bumped, but may still be cached
+    page_cache.events_changed(owned_ids)
+    export_cache.events_changed(owned_ids)
+
+    # Only the small remaining relations are left to the collector
+    user.delete()
+    return stats
@@ -0,0 +1,164 @@
+"""
+Site-wide export of the OneEvent data in the JSON Lines format.
+
+Each line is a JSON object with a "type" key naming the exported model. Bookings of
+archived events are exported with the live ones. Records are
+read with values() and iterator() so the memory used stays constant whatever the
+size of the tables.
+"""
+import datetime
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.query_utils import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import (
+    Event,
+    Category,
+    Session,
+    Choice,
+    Option,
+    Booking,
+    BookingOption,
+    ArchivedBooking,
+    ArchivedBookingOption,
+)
+
+
+EVENT_FIELDS = (
+    "id",
+    "title",
+    "start",
+    "end",
+    "timezone",
+    "description",
+    "pub_status",
+    "location_name",
+    "location_address",
+    "owner_id",
+    "booking_close",
+    "choices_close",
+    "max_participant",
+    "price_currency",
+)
+CATEGORY_FIELDS = ("id", "event_id", "order", "name", "price")
+SESSION_FIELDS = ("id", "event_id", "title", "start", "end", "max_participant")
+CHOICE_FIELDS = ("id", "event_id", "title")
+OPTION_FIELDS = ("id", "choice_id", "title", "default")
+BOOKING_FIELDS = (
+    "id",
+    "event_id",
+    "person_id",
+    "session_id",
+    "confirmedOn",
+    "cancelledBy_id",
+    "cancelledOn",
+    "paidTo_id",
+    "datePaid",
+    "exempt_of_payment",
+    "created_at",
+    "updated_at",
+)
+BOOKING_OPTION_FIELDS = ("id", "booking_id", "option_id", "created_at", "updated_at")
+
+
+class ExportJSONEncoder(DjangoJSONEncoder):
+    """
+    JSON encoder also handling the timezones of events
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.tzinfo):
+            return str(o)
+        return super(ExportJSONEncoder, self).default(o)
+
+
+def parse_since(value):
+    """
+    Parse the value of a "since" filter, a date or a datetime in ISO format
+    @return: an aware datetime, or None if the value is empty
+    @raise ValueError: if the value is not a valid date or datetime
+    """
+    if not value:
+        return None
+    since = parse_datetime(value)
+    if since is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError("Invalid date or datetime: {0}".format(value))
+        since = datetime.datetime.combine(day, datetime.time())
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def exported_events(since=None):
+    """
+    The events to export
+    @param since: if given, only export events that did not end before this datetime
+    """
+    events = Event.objects.all()
+    if since is not None:
+        events = events.filter(Q(end__gte=since) | Q(end=None, start__gte=since))
+    return events
+
+
+def iter_records(since=None, chunk_size=2000):
+    """
+    Yields the exported records as dicts, with their type in the "type" key
+    @param since: only export data of events that did not end before this datetime
+    @param chunk_size: the number of rows fetched from the database at once
+    """
+    event_ids = exported_events(since).values("id")
+    querysets = (
+        ("event", Event.objects.filter(id__in=event_ids), EVENT_FIELDS),
+        ("category", Category.objects.filter(event__in=event_ids), CATEGORY_FIELDS),
+        ("session", Session.objects.filter(event__in=event_ids), SESSION_FIELDS),
+        ("choice", Choice.objects.filter(event__in=event_ids), CHOICE_FIELDS),
+        ("option", Option.objects.filter(choice__event__in=event_ids), OPTION_FIELDS),
+        ("booking", Booking.objects.filter(event__in=event_ids), BOOKING_FIELDS),
+        (
+            "booking",
+            ArchivedBooking.objects.filter(event__in=event_ids),
+            BOOKING_FIELDS,
+        ),
+        (
+            "booking_option",
+            BookingOption.objects.filter(booking__event__in=event_ids),
+            BOOKING_OPTION_FIELDS,
+        ),
+        (
+            "booking_option",
+            ArchivedBookingOption.objects.filter(booking__event__in=event_ids),
+            BOOKING_OPTION_FIELDS,
+        ),
+    )
+    for record_type, queryset, fields in querysets:
+        values = queryset.order_by("id").values(*fields)
+        for record in values.iterator(chunk_size=chunk_size):
+            record["type"] = record_type
+            yield record
+
+
+def iter_json_lines(since=None, chunk_size=2000):
+    """
+    Yields the exported records as lines of JSON
+    """
+    encoder = ExportJSONEncoder()
+    for record in iter_records(since, chunk_size):
+        yield encoder.encode(record) + "\n"
+
+
+def gzip_stream(lines, encoding="utf-8"):
+    """
+    Compress an iterable of text lines in the gzip format, as it is consumed
+    @return: a generator of compressed bytes
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for line in lines:
+        data = compressor.compress(line.encode(encoding))
+        if data:
+            yield data
+    yield compressor.flush()
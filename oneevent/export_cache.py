@@ -0,0 +1,138 @@
+"""
+Disk cache of the CSV exports of the events.
+
+The generated files are keyed by event ID, export type and content version of the
+event (see versions.py), so a change to the event never serves a stale file. The
+total size of the cache is bounded by ONEEVENT_EXPORT_CACHE_MAX_SIZE: the least
+recently used files are evicted first, the modification time of a file being
+updated each time it is served. The files of an event are removed as soon as its
+version is bumped or it is deleted, and the temporary files left by interrupted
+exports once older than TMP_TIMEOUT. The cache is disabled when
+ONEEVENT_EXPORT_CACHE_DIR is None, the exports being then generated in temporary
+files.
+"""
+import os
+import tempfile
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+# Age in seconds after which a temporary file is left by an interrupted export
+TMP_TIMEOUT = 60 * 60
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _get_path(directory, event, export):
+    return os.path.join(
+        directory, "{0}-{1}-{2}.csv".format(event.id, export, event.content_version)
+    )
+
+
+def _evict(directory, keep, max_size):
+    """
+    Remove the least recently used files until the cache fits in max_size, and the
+    orphaned temporary files
+    @param keep: the path of a file not to remove
+    """
+    entries = []
+    total = 0
+    tmp_expired_at = time.time() - TMP_TIMEOUT
+    for entry in os.scandir(directory):
+        if not entry.is_file():
+            continue
+        stat = entry.stat()
+        if entry.name.endswith(".tmp"):
+            if stat.st_mtime < tmp_expired_at:
+                _remove(entry.path)
+            continue
+        if not entry.name.endswith(".csv"):
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+    entries.sort()
+    for _, size, path in entries:
+        if total <= max_size:
+            break
+        if path == keep:
+            continue
+        _remove(path)
+        total -= size
+
+
+def _remove_old_versions(directory, event, export, keep):
+    prefix = "{0}-{1}-".format(event.id, export)
+    for entry in os.scandir(directory):
+        if entry.name.startswith(prefix) and entry.path != keep:
+            _remove(entry.path)
+
+
+def events_changed(event_ids):
+    """
+    Remove the cached files of changed or deleted events, stale from now on
+    @param event_ids: the IDs of the events, as an iterable or a queryset of values
+    """
+    directory = settings.ONEEVENT_EXPORT_CACHE_DIR
+    if directory is None:
+        return
+    prefixes = tuple("{0}-".format(event_id) for event_id in event_ids)
+    if not prefixes:
+        return
+    try:
+        entries = os.scandir(directory)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.name.endswith(".csv") and entry.name.startswith(prefixes):
+                _remove(entry.path)
+
+
+def open_export(event, export, write):
+    """
+    Open the cached file of an export, generating it on a cache miss
+    @param event: the exported Event, with an up-to-date content_version
+    @param export: the type of export, e.g. "participants_list"
+    @param write: the function generating the export, called with a binary file
+    to write it to
+    @return: the export as a binary file open for reading
+    """
+    directory = settings.ONEEVENT_EXPORT_CACHE_DIR
+    if directory is None:
+        f = tempfile.TemporaryFile()
+        write(f)
+        f.seek(0)
+        return f
+
+    path = _get_path(directory, event, export)
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        pass
+    else:
+        metrics.EXPORT_CACHE_REQUESTS.inc(export=export, result="hit")
+        os.utime(path)
+        return f
+
+    metrics.EXPORT_CACHE_REQUESTS.inc(export=export, result="miss")
+    os.makedirs(directory, exist_ok=True)
+    # Concurrent requests each write their own file, the last one wins
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            write(tmp)
+        os.replace(tmp_path, path)
+    except BaseException:
+        _remove(tmp_path)
+        raise
+    f = open(path, "rb")
+    _remove_old_versions(directory, event, export, path)
+    _evict(directory, path, settings.ONEEVENT_EXPORT_CACHE_MAX_SIZE)
+    return f
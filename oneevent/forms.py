@@ -1,5 +1,12 @@
 from django.forms import Form
-from django.forms.fields import ChoiceField, SplitDateTimeField
+from django.forms.fields import (
+    BooleanField,
+    CharField,
+    ChoiceField,
+    FileField,
+    SplitDateTimeField,
+)
+from . import bookings_table
 from .models import Event, Session, Category, Choice, Option, Booking, BookingOption
 from django.forms.models import ModelForm, inlineformset_factory, ModelChoiceField
 from django.urls import reverse
@@ -167,6 +174,7 @@ class EventForm(ModelForm):
             "booking_close",
             "choices_close",
             "max_participant",
+            "admission_rate",
             "price_currency",
         ]
 
@@ -190,7 +198,13 @@ class EventForm(ModelForm):
             Tab("Description", "description"),
             Tab("Venue", "location_name", "location_address"),
             Tab("Organisers", "owner", "organisers"),
-            Tab("Booking limits", "max_participant", "booking_close", "choices_close"),
+            Tab(
+                "Booking limits",
+                "max_participant",
+                "booking_close",
+                "choices_close",
+                "admission_rate",
+            ),
             Tab("Settings", "price_currency"),
         )
         self.helper.add_input(Submit("submit", "Save"))
@@ -381,3 +395,128 @@ class CreateBookingOnBehalfForm(Form):
         self.helper.label_class = "col-lg-3"
         self.helper.field_class = "col-lg-6"
         self.helper.add_input(Submit("submit", "Create Booking"))
+
+
+class EventCloneForm(Form):
+    title = CharField(max_length=64, label="Title of the new event")
+    start = MySplitDateTimeField(
+        required=True,
+        help_text="Local start date and time ({0}). The other dates are shifted "
+        "accordingly".format(datetime_help_string()),
+    )
+
+    def __init__(self, event_id, *args, **kwargs):
+        super(EventCloneForm, self).__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_method = "post"
+        self.helper.form_action = reverse("event_clone", kwargs={"event_id": event_id})
+        self.helper.form_class = "form-horizontal"
+        self.helper.label_class = "col-lg-3"
+        self.helper.field_class = "col-lg-6"
+        self.helper.add_input(Submit("submit", "Clone Event"))
+
+    def clean_title(self):
+        title = self.cleaned_data["title"]
+        if Event.objects.filter(title=title).exists():
+            raise ValidationError("An event with this title already exists")
+        return title
+
+
+class BookingImportForm(Form):
+    file = FileField(
+        label="CSV file",
+        help_text="A username or email column, an optional session column and one "
+        "column per choice",
+    )
+    dry_run = BooleanField(
+        required=False,
+        initial=True,
+        label="Only check the file",
+        help_text="Report the conflicts without creating any booking",
+    )
+
+    def __init__(self, event_id, *args, **kwargs):
+        super(BookingImportForm, self).__init__(*args, **kwargs)
+        self.helper = FormHelper()
+        self.helper.form_method = "post"
+        self.helper.form_action = reverse(
+            "event_import_bookings", kwargs={"event_id": event_id}
+        )
+        self.helper.form_class = "form-horizontal"
+        self.helper.label_class = "col-lg-3"
+        self.helper.field_class = "col-lg-6"
+        self.helper.add_input(Submit("submit", "Import"))
+
+
+class BookingFilterForm(Form):
+    status = ChoiceField(
+        required=False,
+        initial=bookings_table.STATUS_ACTIVE,
+        choices=(
+            (bookings_table.STATUS_ACTIVE, "Active"),
+            (bookings_table.STATUS_CANCELLED, "Cancelled"),
+            ("", "Active and cancelled"),
+        ),
+    )
+    paid = ChoiceField(
+        required=False,
+        label="Payment",
+        choices=(
+            ("", "Any payment"),
+            (bookings_table.PAID, "Paid"),
+            (bookings_table.EXEMPT, "Exempt"),
+            (bookings_table.UNPAID, "Not paid"),
+        ),
+    )
+    category = ModelChoiceField(
+        queryset=Category.objects.none(), required=False, empty_label="Any category"
+    )
+    session = SessionChoiceField(
+        queryset=Session.objects.none(), required=False, empty_label="Any session"
+    )
+    q = CharField(required=False, max_length=150, label="Name")
+    sort = ChoiceField(
+        required=False,
+        initial=bookings_table.DEFAULT_SORT,
+        choices=(
+            ("created", "Oldest first"),
+            ("-created", "Newest first"),
+            ("name", "Name (A-Z)"),
+            ("-name", "Name (Z-A)"),
+        ),
+    )
+
+    def __init__(self, event, data=None, *args, **kwargs):
+        if data is not None:
+            # The missing values are the initial ones, as on the first page
+            data = data.copy()
+            data.setdefault("status", self.base_fields["status"].initial)
+        super(BookingFilterForm, self).__init__(data, *args, **kwargs)
+        self.fields["category"].queryset = event.categories.all()
+        self.fields["session"].queryset = event.sessions.all()
+        if not event.categories.exists():
+            del self.fields["category"]
+        if not event.sessions.exists():
+            del self.fields["session"]
+        self.helper = FormHelper()
+        self.helper.form_method = "get"
+        self.helper.form_action = reverse(
+            "event_manage", kwargs={"event_id": event.id}
+        )
+        self.helper.form_class = "form-inline"
+        self.helper.form_show_labels = False
+        self.helper.add_input(Submit("submit", "Filter"))
+
+    def get_filters(self):
+        """
+        @return: a tuple (keyword arguments of bookings_table.filter_bookings(),
+        sort) from the submitted values, or the initial ones if the form is not
+        bound or not valid
+        """
+        if self.is_bound and self.is_valid():
+            values = dict(self.cleaned_data)
+        else:
+            values = {name: field.initial for name, field in self.fields.items()}
+        sort = values.pop("sort") or bookings_table.DEFAULT_SORT
+        filters = {name: value for name, value in values.items() if value}
+        return filters, sort
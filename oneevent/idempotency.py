@@ -0,0 +1,184 @@
+"""
+Idempotency keys of the booking and payment requests, to absorb the retries of
+clients and proxies during rushes.
+
+A request carrying a key, in the Idempotency-Key header or the idempotency_key
+parameter of the forms, records its outcome with the key. The retries of the same
+request by the same user get the recorded response, without running the view again,
+until the key expires after ONEEVENT_IDEMPOTENCY_KEY_TTL seconds. A retry arriving
+while the request is still processed gets a 409 response, and a key reused for
+another request a 422 response. A request claims its key for
+ONEEVENT_IDEMPOTENCY_LEASE_SECONDS only, so that the retries can take it over if the
+process handling the request was killed. The expired keys are removed by the
+oneevent_purge_idempotency_keys command.
+"""
+import hashlib
+import uuid
+from datetime import timedelta
+from functools import wraps
+
+from crispy_forms.layout import Hidden
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http.response import HttpResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+
+HEADER = "HTTP_IDEMPOTENCY_KEY"
+FIELD = "idempotency_key"
+MAX_LENGTH = 64
+# Parameters which differ between the retries of a request
+IGNORED_PARAMETERS = (FIELD, "csrfmiddlewaretoken")
+
+
+def new_key():
+    """
+    @return: a new random key, for the forms
+    """
+    return uuid.uuid4().hex
+
+
+def add_hidden_key(helper):
+    """
+    Add a new key to a crispy form
+    @param helper: the FormHelper of the form
+    """
+    helper.add_input(Hidden(FIELD, new_key()))
+
+
+def _get_key(request):
+    return request.META.get(HEADER) or request.POST.get(FIELD)
+
+
+def _get_fingerprint(request):
+    parameters = sorted(
+        (name, value)
+        for name, values in request.POST.lists()
+        if name not in IGNORED_PARAMETERS
+        for value in values
+    )
+    text = repr((request.method, request.path, parameters))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _in_progress():
+    response = HttpResponse(
+        "This request is still being processed", status=409, content_type="text/plain"
+    )
+    response["Retry-After"] = "1"
+    return response
+
+
+def _replay(record):
+    response = HttpResponse(
+        bytes(record.content),
+        status=record.status_code,
+        content_type=record.content_type,
+    )
+    if record.location:
+        response["Location"] = record.location
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _claim(request, key, fingerprint, now):
+    """
+    Record that a request with a key is being processed
+    @return: the new IdempotencyKey, or the response to send back if the key was
+    already used
+    """
+    expires_at = now + timedelta(seconds=settings.ONEEVENT_IDEMPOTENCY_LEASE_SECONDS)
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                user=request.user,
+                key=key,
+                fingerprint=fingerprint,
+                created_at=now,
+                expires_at=expires_at,
+            )
+    except IntegrityError:
+        pass
+    # An expired key is taken over: its outcome is too old to be replayed, or the
+    # lease of its request ran out as the process was killed
+    keys = IdempotencyKey.objects.filter(user=request.user, key=key)
+    taken = keys.filter(expires_at__lte=now).update(
+        fingerprint=fingerprint,
+        status_code=None,
+        content_type="",
+        location="",
+        content=b"",
+        created_at=now,
+        expires_at=expires_at,
+    )
+    if taken:
+        return keys.get()
+    record = keys.first()
+    if record is None or record.status_code is None:
+        # Processing, or failed meanwhile and the client can retry
+        return _in_progress()
+    if record.fingerprint != fingerprint:
+        return HttpResponse(
+            "This idempotency key was used for another request",
+            status=422,
+            content_type="text/plain",
+        )
+    return _replay(record)
+
+
+def idempotent(view):
+    """
+    Decorator of a view, recording its outcome for the requests carrying an
+    idempotency key. It must be applied after login_required.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = _get_key(request)
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_LENGTH:
+            return HttpResponse(
+                "Invalid idempotency key", status=400, content_type="text/plain"
+            )
+
+        record = _claim(request, key, _get_fingerprint(request), timezone.now())
+        if isinstance(record, HttpResponse):
+            return record
+        # The claim is only updated while it was not taken over
+        claim = IdempotencyKey.objects.filter(
+            id=record.id, created_at=record.created_at, status_code__isnull=True
+        )
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            claim.delete()
+            raise
+        if response.status_code >= 500 or response.streaming:
+            # Not recorded, the request can be retried
+            claim.delete()
+            return response
+
+        claim.update(
+            status_code=response.status_code,
+            content_type=response.get("Content-Type", ""),
+            location=response.get("Location", ""),
+            content=response.content,
+            expires_at=timezone.now()
+            + timedelta(seconds=settings.ONEEVENT_IDEMPOTENCY_KEY_TTL),
+        )
+        return response
+
+    return wrapper
+
+
+def purge_expired(now=None):
+    """
+    Remove the expired keys
+    @return: the number of keys removed
+    """
+    now = now or timezone.now()
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=now).delete()
+    return deleted
@@ -0,0 +1,364 @@
+"""
+Import of the participants of an event from a CSV file, e.g. to register a whole
+department at once, or from the groups matched by the categories of the event.
+
+The first row of the file gives the columns: "username" or "email" to identify the
+participants, "session" for the title of their session and one column per choice of
+the event, titled like the choice, giving the title of the selected option. Empty
+options, and the choices without a column, get the default option of their choice.
+The cancelled bookings of the listed participants are confirmed again, with the
+options of the file.
+
+The file is read in a streaming way and processed in batches of rows: the users of
+each batch are resolved with a single query, then the bookings of the valid rows are
+created, confirmed, with bulk_create(). The capacity of the event and its sessions is
+checked against the existing and the imported bookings. In dry-run mode, the rows are
+checked in the same way but nothing is written, to report the conflicts first.
+"""
+import csv
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from . import audit, metrics
+from .models import Event, Option, Booking, BookingOption, BookingLogEntry
+from .unicode_csv import UnicodeReader
+from .versions import bump_content_version
+
+
+DEFAULT_BATCH_SIZE = 500
+USER_COLUMNS = ("username", "email")
+SESSION_COLUMN = "session"
+
+
+class _Capacity(object):
+    """
+    Running count of the active bookings of an event and its sessions, including
+    the imported ones
+    """
+
+    def __init__(self, event, sessions):
+        self.max_participant = event.max_participant
+        self.count = event.get_active_bookings().count()
+        self.session_max = {s.id: s.max_participant for s in sessions.values()}
+        self.session_counts = dict.fromkeys(self.session_max, 0)
+        for session_id in event.get_active_bookings().values_list(
+            "session_id", flat=True
+        ):
+            if session_id in self.session_counts:
+                self.session_counts[session_id] += 1
+
+    def check(self, session):
+        """
+        @return: an error message if a booking can not be added, None otherwise
+        """
+        if 0 < self.max_participant <= self.count:
+            return "The event is fully booked"
+        if session is not None:
+            if 0 < self.session_max[session.id] <= self.session_counts[session.id]:
+                return "The session {0} is fully booked".format(session.title)
+        return None
+
+    def add(self, session):
+        self.count += 1
+        if session is not None:
+            self.session_counts[session.id] += 1
+
+
+def _read_header(reader, event):
+    """
+    Check the header of the file against the configuration of the event
+    @return: a tuple (user column, user column index, session column index or
+    None, list of (column index, choice))
+    """
+    try:
+        header = [column.strip() for column in next(reader)]
+    except StopIteration:
+        raise ValueError("The file is empty")
+
+    user_columns = [c for c in USER_COLUMNS if c in header]
+    if len(user_columns) != 1:
+        raise ValueError("The file must have either a username or an email column")
+    user_column = user_columns[0]
+
+    session_index = None
+    if SESSION_COLUMN in header:
+        session_index = header.index(SESSION_COLUMN)
+    choices = {choice.title: choice for choice in event.choices.all()}
+    choice_columns = []
+    for index, column in enumerate(header):
+        if column in (user_column, SESSION_COLUMN):
+            continue
+        if column not in choices:
+            raise ValueError("Unknown choice: {0}".format(column))
+        choice_columns.append((index, choices[column]))
+    return user_column, header.index(user_column), session_index, choice_columns
+
+
+def _resolve_users(user_column, values):
+    """
+    Find the users of a batch of rows with a single query
+    @return: a dict mapping each value to the list of matching users
+    """
+    users = {}
+    lookup = {"{0}__in".format(user_column): set(values)}
+    for user in get_user_model().objects.filter(**lookup):
+        users.setdefault(getattr(user, user_column), []).append(user)
+    return users
+
+
+def import_bookings(
+    event, f, actor, dry_run=False, batch_size=DEFAULT_BATCH_SIZE, encoding="utf-8-sig"
+):
+    """
+    Create the bookings of the participants listed in a CSV file
+    @param f: the binary CSV file, see the module documentation for its format
+    @param actor: the user importing the file, recorded in the history of the
+    bookings
+    @param dry_run: if True, only check the file without creating any booking
+    @param batch_size: the maximum number of rows processed together
+    @raise ValueError: if the file is malformed or its header is invalid
+    @return: a dict with the number of "rows" read, the number of bookings
+    "created" and of cancelled bookings "reactivated" (or that would be in dry-run
+    mode) and the "errors" as a list of (line number, user, message) for the rows
+    that were skipped
+    """
+    try:
+        with transaction.atomic():
+            # Serialise the imports to the same event, for the capacity checks
+            event = Event.objects.select_for_update().get(id=event.id)
+            report = _import_rows(event, f, actor, dry_run, batch_size, encoding)
+            if dry_run:
+                transaction.set_rollback(True)
+    except csv.Error as e:
+        raise ValueError("Malformed CSV file: {0}".format(e))
+    return report
+
+
+def _get_default_options(event):
+    """
+    @return: a dict mapping the ID of each choice of an event to its default
+    option, or to its first option if none is the default
+    """
+    defaults = {}
+    for option in Option.objects.filter(choice__event=event):
+        if option.default or option.choice_id not in defaults:
+            defaults[option.choice_id] = option
+    return defaults
+
+
+def _import_rows(event, f, actor, dry_run, batch_size, encoding):
+    reader = UnicodeReader(f, encoding=encoding)
+    user_column, user_index, session_index, choice_columns = _read_header(
+        reader, event
+    )
+    sessions = {session.title: session for session in event.sessions.all()}
+    defaults = _get_default_options(event)
+    options = {}
+    for _, choice in choice_columns:
+        for option in choice.options.all():
+            options[(choice.id, option.title)] = option
+    # The choices without a column get their default option
+    column_choices = {choice.id for _, choice in choice_columns}
+    missing = [o for c, o in defaults.items() if c not in column_choices]
+    capacity = _Capacity(event, sessions)
+    imported = set()
+    report = {"rows": 0, "created": 0, "reactivated": 0, "errors": []}
+
+    while True:
+        # Rows are read lazily, one batch at a time
+        rows = []
+        for row in islice(reader, batch_size):
+            rows.append((reader.line_num, [value.strip() for value in row]))
+        if not rows:
+            break
+        # Skip the blank lines
+        rows = [(line, row) for line, row in rows if any(row)]
+        report["rows"] += len(rows)
+        users = _resolve_users(
+            user_column, [row[user_index] for _, row in rows if len(row) > user_index]
+        )
+        booked = set(imported)
+        # The cancelled bookings, by person, which can be confirmed again
+        cancelled = {}
+        for person_id, booking_id, cancelled_on in Booking.objects.filter(
+            event=event, person__in=[u for m in users.values() for u in m]
+        ).values_list("person_id", "id", "cancelledOn"):
+            if cancelled_on is None or person_id in imported:
+                booked.add(person_id)
+            else:
+                cancelled[person_id] = booking_id
+
+        new_bookings = []
+        reactivated = []
+        for line, row in rows:
+            value = row[user_index] if len(row) > user_index else ""
+            error = None
+            matches = users.get(value, [])
+            session = None
+            selected = list(missing)
+            if len(matches) != 1:
+                error = "No user found" if not matches else "Several users found"
+            elif matches[0].id in booked:
+                error = "Already registered"
+            title = ""
+            if session_index is not None and session_index < len(row):
+                title = row[session_index]
+            if error is None and title:
+                session = sessions.get(title)
+                if session is None:
+                    error = "Unknown session: {0}".format(title)
+            if error is None and session is None and sessions:
+                error = "A session is required"
+            for index, choice in choice_columns:
+                title = row[index] if len(row) > index else ""
+                if title:
+                    option = options.get((choice.id, title))
+                else:
+                    option = defaults.get(choice.id)
+                if option is None:
+                    error = error or "Unknown option for {0}: {1}".format(
+                        choice.title, title
+                    )
+                selected.append(option)
+            if error is None:
+                error = capacity.check(session)
+
+            if error is not None:
+                report["errors"].append((line, value, error))
+                continue
+            person = matches[0]
+            booked.add(person.id)
+            imported.add(person.id)
+            capacity.add(session)
+            if person.id in cancelled:
+                reactivated.append((cancelled[person.id], session, selected))
+            else:
+                new_bookings.append((person, session, selected))
+
+        report["created"] += len(new_bookings)
+        report["reactivated"] += len(reactivated)
+        if not dry_run and new_bookings:
+            _create_bookings(event, actor, new_bookings)
+        if not dry_run and reactivated:
+            _reactivate_bookings(event, actor, reactivated)
+    return report
+
+
+def register_category_members(event, actor, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Create the bookings of all the users matched by the categories of an event,
+    with the default option of each choice, up to the maximum number of
+    participants. The users who already have a booking are skipped.
+    @param actor: the user registering the members, recorded in the history of
+    the bookings
+    @param batch_size: the maximum number of bookings created together
+    @raise ValueError: if the event has sessions, which the participants have to
+    choose themselves
+    @return: a dict with the number of users "matched" by the categories, of
+    users who were "already registered", of bookings "created" and of users left
+    out because the event is "full"
+    """
+    with transaction.atomic():
+        event = Event.objects.select_for_update().get(id=event.id)
+        if event.sessions.exists():
+            raise ValueError("The participants have to choose their session")
+
+        selected = list(_get_default_options(event).values())
+
+        members = event.get_category_members()
+        new_members = members.exclude(
+            id__in=Booking.objects.filter(event=event).values("person_id")
+        ).order_by("id")
+        report = {
+            "matched": members.count(),
+            "already registered": 0,
+            "created": 0,
+            "full": 0,
+        }
+        remaining = new_members.count()
+        report["already registered"] = report["matched"] - remaining
+        if event.max_participant > 0:
+            free = max(event.max_participant - event.get_active_bookings().count(), 0)
+            report["full"] = max(remaining - free, 0)
+            remaining -= report["full"]
+
+        last_id = 0
+        while remaining > 0:
+            size = min(batch_size, remaining)
+            batch = list(new_members.filter(id__gt=last_id)[:size])
+            if not batch:
+                break
+            _create_bookings(
+                event,
+                actor,
+                [(person, None, selected) for person in batch],
+                "Category member",
+            )
+            last_id = batch[-1].id
+            remaining -= len(batch)
+            report["created"] += len(batch)
+    return report
+
+
+def _create_bookings(event, actor, new_bookings, details="Imported"):
+    """
+    Create the confirmed bookings of a batch, with their options
+    @param new_bookings: a list of (person, session, list of options)
+    @param details: the description of the creation in the history of the bookings
+    """
+    now = timezone.now()
+    Booking.objects.bulk_create(
+        Booking(event=event, person=person, session=session, confirmedOn=now)
+        for person, session, _ in new_bookings
+    )
+    # The IDs of the new bookings are not returned by all databases
+    bookings = Booking.objects.filter(
+        event=event, person__in=[person for person, _, _ in new_bookings]
+    )
+    bookings = {booking.person_id: booking for booking in bookings}
+    BookingOption.objects.bulk_create(
+        BookingOption(booking=bookings[person.id], option=option)
+        for person, _, selected in new_bookings
+        for option in selected
+    )
+    with audit.buffered():
+        for booking in bookings.values():
+            audit.log(booking, BookingLogEntry.ACTION_CREATE, actor, details)
+            audit.log(booking, BookingLogEntry.ACTION_CONFIRM, actor)
+    metrics.BOOKINGS_CREATED.inc(len(bookings))
+    bump_content_version([event.id])
+
+
+def _reactivate_bookings(event, actor, reactivated, details="Imported"):
+    """
+    Confirm again the cancelled bookings of a batch, replacing their options
+    @param reactivated: a list of (booking ID, session, list of options)
+    @param details: the description of the confirmation in the history of the
+    bookings
+    """
+    now = timezone.now()
+    by_session = {}
+    for booking_id, session, _ in reactivated:
+        by_session.setdefault(session, []).append(booking_id)
+    for session, booking_ids in by_session.items():
+        Booking.objects.filter(id__in=booking_ids).update(
+            session=session,
+            confirmedOn=now,
+            cancelledBy=None,
+            cancelledOn=None,
+            updated_at=now,
+        )
+    booking_ids = [booking_id for booking_id, _, _ in reactivated]
+    BookingOption.objects.filter(booking_id__in=booking_ids).delete()
+    BookingOption.objects.bulk_create(
+        BookingOption(booking_id=booking_id, option=option)
+        for booking_id, _, selected in reactivated
+        for option in selected
+    )
+    with audit.buffered():
+        for booking in Booking.objects.filter(id__in=booking_ids):
+            audit.log(booking, BookingLogEntry.ACTION_CONFIRM, actor, details)
+    bump_content_version([event.id])
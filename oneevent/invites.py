@@ -0,0 +1,65 @@
+"""
+Rendering of calendar invites for many bookings at once.
+
+Building an invite mixes DB-free CPU work (iCalendar serialisation, timezone
+transitions, MIME encoding) with IO. All the related objects are fetched upfront in
+a constant number of queries, then the messages are rendered concurrently.
+"""
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.apps import apps
+
+
+def prefetch_for_invites(bookings):
+    """
+    Fetch in bulk everything needed to render the invites of a queryset of bookings
+    @return: a list of bookings whose invites can be rendered without DB queries
+    """
+    # Prefetching the event shares a single instance between all bookings
+    bookings = bookings.select_related("person")
+    bookings = bookings.prefetch_related("event__owner", "options__option__choice")
+    return list(bookings)
+
+
+def _render_invite(booking):
+    return booking.build_calendar_invite()
+
+
+def _init_process_worker():
+    """
+    Make sure Django is set up in worker processes that were not forked
+    """
+    if not apps.ready:
+        django.setup()
+
+
+def render_invites(bookings, max_workers=None, use_processes=False):
+    """
+    Render the calendar invite messages of many bookings concurrently
+    @param bookings: a queryset or an iterable of bookings. Related objects of plain
+    iterables should already be fetched, see prefetch_for_invites()
+    @param max_workers: the maximum number of concurrent workers
+    @param use_processes: use a pool of processes instead of threads, to spread the
+    CPU-heavy rendering of large batches over several cores
+    @return: a list of EmailMultiAlternatives, in the same order as bookings
+    """
+    if hasattr(bookings, "select_related"):
+        bookings = prefetch_for_invites(bookings)
+    else:
+        bookings = list(bookings)
+    if not bookings:
+        return []
+
+    if use_processes:
+        executor = ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_process_worker
+        )
+        chunksize = max(1, len(bookings) // ((max_workers or 4) * 4))
+    else:
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        chunksize = 1
+
+    with executor:
+        # Executor.map yields the results in the order of its input
+        return list(executor.map(_render_invite, bookings, chunksize=chunksize))
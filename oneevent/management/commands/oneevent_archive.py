@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from oneevent import archive, export
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive the events that ended before a date, moving their bookings out of "
+        "the tables of live bookings"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ended-before",
+            required=True,
+            help="Archive the events that ended before this date or datetime "
+            "(ISO format)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of bookings moved in each transaction",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the events that would be archived",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            ended_before = export.parse_since(options["ended_before"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options["batch_size"] < 1:
+            raise CommandError("The batch size must be positive")
+
+        events = archive.archivable_events(ended_before).order_by("start", "id")
+        for event in events:
+            if options["dry_run"]:
+                self.stdout.write(
+                    "Would archive {0} ({1} bookings)".format(
+                        event.title, event.bookings.count()
+                    )
+                )
+                continue
+
+            moved = archive.archive_event(event, options["batch_size"])
+            self.stdout.write(
+                "Archived {0} ({1} bookings)".format(event.title, moved)
+            )
@@ -0,0 +1,99 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from oneevent.invites import prefetch_for_invites, render_invites
+from oneevent.models import Booking, Event
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the rendering of calendar invites in a serial loop and with "
+        "render_invites(). Test data is created in a transaction rolled back at the end"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--bookings", type=int, default=1000, help="Number of bookings to render"
+        )
+        parser.add_argument(
+            "--workers", type=int, default=None, help="Maximum number of workers"
+        )
+        parser.add_argument(
+            "--processes",
+            action="store_true",
+            help="Render with a pool of processes instead of threads",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def _create_bookings(self, count):
+        user_model = get_user_model()
+        owner = user_model.objects.create(username="oneevent-benchmark-owner")
+        event = Event.objects.create(
+            title="OneEvent invites benchmark",
+            start=timezone.now(),
+            owner=owner,
+            location_name="Benchmark venue",
+        )
+        choice = event.choices.create(title="Meal")
+        option = choice.options.create(title="Vegetarian", default=True)
+
+        user_model.objects.bulk_create(
+            user_model(
+                username="oneevent-benchmark-{0}".format(i),
+                email="benchmark{0}@example.com".format(i),
+            )
+            for i in range(count)
+        )
+        users = user_model.objects.filter(username__startswith="oneevent-benchmark-")
+        Booking.objects.bulk_create(
+            Booking(event=event, person=user)
+            for user in users.exclude(id=owner.id)
+        )
+        bookings = Booking.objects.filter(event=event)
+        for booking in bookings:
+            booking.options.create(option=option)
+        return bookings
+
+    def _run(self, options):
+        bookings = self._create_bookings(options["bookings"])
+        prefetched = prefetch_for_invites(bookings)
+
+        start = time.perf_counter()
+        serial = [booking.build_calendar_invite() for booking in prefetched]
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parallel = render_invites(
+            prefetched,
+            max_workers=options["workers"],
+            use_processes=options["processes"],
+        )
+        parallel_time = time.perf_counter() - start
+
+        assert [m.to for m in serial] == [m.to for m in parallel]
+
+        self.stdout.write(
+            "Rendered {0} invites: serial {1:.3f}s, {2} {3:.3f}s "
+            "(speed-up x{4:.2f})".format(
+                len(serial),
+                serial_time,
+                "processes" if options["processes"] else "threads",
+                parallel_time,
+                serial_time / parallel_time,
+            )
+        )
@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from oneevent import deletion
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete user accounts with their bookings and owned events, in small "
+        "batches, e.g. to process GDPR erasure requests"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="*", help="Usernames to delete")
+        parser.add_argument(
+            "--from-file",
+            help="File listing usernames to delete, one per line",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=deletion.DEFAULT_BATCH_SIZE,
+            help="Number of rows deleted or updated in each transaction",
+        )
+
+    def handle(self, *args, **options):
+        usernames = list(options["usernames"])
+        if options["from_file"]:
+            with open(options["from_file"], encoding="utf-8") as usernames_file:
+                usernames.extend(line.strip() for line in usernames_file)
+        usernames = [username for username in usernames if username]
+        if not usernames:
+            raise CommandError("No user to delete")
+        if options["batch_size"] < 1:
+            raise CommandError("The batch size must be positive")
+
+        users = get_user_model().objects.filter(username__in=usernames)
+        found = set(users.values_list("username", flat=True))
+        for username in usernames:
+            if username not in found:
+                self.stderr.write("Unknown user: {0}".format(username))
+
+        verbosity = options["verbosity"]
+
+        def progress(step, count):
+            if verbosity > 1:
+                self.stdout.write("  {0}: {1}".format(step, count))
+
+        for user in users.order_by("id"):
+            self.stdout.write("Deleting {0}".format(user.username))
+            stats = deletion.delete_user(user, options["batch_size"], progress)
+            self.stdout.write(
+                "Deleted {0}: {1} bookings, {2} archived bookings, {3} events".format(
+                    user.username,
+                    stats["bookings"],
+                    stats["archived bookings"],
+                    stats["events"],
+                )
+            )
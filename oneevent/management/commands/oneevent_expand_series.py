@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from oneevent import series
+
+
+class Command(BaseCommand):
+    help = "Create the next occurrences of the recurring event series"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=4,
+            help="Number of upcoming occurrences that should exist for each series",
+        )
+
+    def handle(self, *args, **options):
+        if options["ahead"] < 1:
+            raise CommandError("The number of occurrences must be positive")
+
+        for event_series, events in series.expand_all(options["ahead"]).items():
+            if events:
+                self.stdout.write(
+                    "Created {0} occurrence(s) of {1}".format(
+                        len(events), event_series.title
+                    )
+                )
@@ -0,0 +1,59 @@
+import gzip
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from oneevent import export
+
+
+class Command(BaseCommand):
+    help = (
+        "Export events, categories, sessions, choices, options, bookings and booking "
+        "options in the JSON Lines format"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-o",
+            "--output",
+            default="-",
+            help="File to write the export to (default: standard output)",
+        )
+        parser.add_argument(
+            "--gzip", action="store_true", help="Compress the output with gzip"
+        )
+        parser.add_argument(
+            "--since",
+            help="Only export data of events that did not end before this date or "
+            "datetime (ISO format)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Number of rows fetched from the database at once",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            since = export.parse_since(options["since"])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        lines = export.iter_json_lines(since, options["chunk_size"])
+
+        if options["output"] == "-":
+            if options["gzip"]:
+                output = sys.stdout.buffer
+                for data in export.gzip_stream(lines):
+                    output.write(data)
+                output.flush()
+            else:
+                for line in lines:
+                    self.stdout.write(line, ending="")
+        elif options["gzip"]:
+            with gzip.open(options["output"], "wt", encoding="utf-8") as output:
+                output.writelines(lines)
+        else:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                output.writelines(lines)
@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from oneevent import outbox
+
+
+class Command(BaseCommand):
+    help = "Send the calendar invites and notifications queued in the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Maximum number of messages claimed at once",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Maximum number of email connections used in parallel",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=5,
+            help="Number of attempts before giving up on a message",
+        )
+        parser.add_argument(
+            "--backoff",
+            type=int,
+            default=60,
+            help="Seconds before the first retry, doubled at each attempt",
+        )
+        parser.add_argument(
+            "--lease",
+            type=int,
+            default=300,
+            help="Seconds for which claimed messages are reserved for this worker",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no message is due instead of polling the outbox",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5,
+            help="Seconds to wait between polls when the outbox is empty",
+        )
+
+    def handle(self, *args, **options):
+        batch_options = {
+            "batch_size": options["batch_size"],
+            "concurrency": options["concurrency"],
+            "max_attempts": options["max_attempts"],
+            "backoff_seconds": options["backoff"],
+            "lease_seconds": options["lease"],
+        }
+        while True:
+            totals = outbox.drain(**batch_options)
+            if any(totals.values()):
+                self.stdout.write(
+                    "Sent: {sent}, to retry: {retried}, failed: {failed}".format(
+                        **totals
+                    )
+                )
+            if options["once"]:
+                return
+            time.sleep(options["poll_interval"])
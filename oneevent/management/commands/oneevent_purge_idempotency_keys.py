@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from oneevent import idempotency
+
+
+class Command(BaseCommand):
+    help = "Remove the expired idempotency keys of the booking and payment requests"
+
+    def handle(self, *args, **options):
+        deleted = idempotency.purge_expired()
+        self.stdout.write("Removed {0} expired keys".format(deleted))
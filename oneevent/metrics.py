@@ -0,0 +1,268 @@
+"""
+In-process instrumentation of the OneEvent hot paths.
+
+Metrics are kept in memory for the lifetime of the process and rendered in the
+Prometheus text exposition format by the `metrics` view, so any Prometheus-style
+scraper can collect them without an external client library.
+"""
+
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{0}="{1}"'.format(name, _escape_label_value(value)) for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric(object):
+    """
+    Base class for a metric family, holding one value per combination of labels
+    """
+
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _label_values(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                "Metric {0} expects labels {1}, got {2}".format(
+                    self.name, self.labelnames, tuple(labels)
+                )
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        """
+        Forget all the recorded values
+        """
+        with self._lock:
+            self._values = {}
+
+    def samples(self):
+        """
+        Yields tuples (sample_name, [(label, value), ...], value) for this metric
+        """
+        raise NotImplementedError
+
+    def render(self):
+        """
+        Render this metric family in the Prometheus text format
+        """
+        lines = [
+            "# HELP {0} {1}".format(self.name, self.documentation),
+            "# TYPE {0} {1}".format(self.name, self.metric_type),
+        ]
+        for sample_name, labels, value in self.samples():
+            lines.append(
+                "{0}{1} {2}".format(
+                    sample_name, _format_labels(labels), _format_value(value)
+                )
+            )
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """
+    A value that only goes up, e.g. a number of processed items
+    """
+
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._label_values(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, list(zip(self.labelnames, key)), value
+
+
+class Histogram(_Metric):
+    """
+    A distribution of observed values, e.g. durations, counted in buckets
+    """
+
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Context manager observing the duration of its block, in seconds
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels):
+        counts, _total = self._values.get(self._label_values(labels), ([0], 0.0))
+        return sum(counts)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(c), t)) for key, (c, t) in self._values.items())
+        for key, (counts, total) in values:
+            labels = list(zip(self.labelnames, key))
+            cumulated = 0
+            for upper_bound, count in zip(self.buckets, counts):
+                cumulated += count
+                bucket_labels = labels + [("le", _format_value(upper_bound))]
+                yield self.name + "_bucket", bucket_labels, cumulated
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, cumulated
+
+
+class Registry(object):
+    """
+    The collection of all metrics exposed by the application
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError("Duplicated metric name: {0}".format(metric.name))
+            self._metrics[metric.name] = metric
+        return metric
+
+    def clear(self):
+        """
+        Reset the values of all the registered metrics
+        """
+        for metric in self._metrics.values():
+            metric.clear()
+
+    def render(self):
+        """
+        Render all the registered metrics in the Prometheus text format
+        """
+        families = [self._metrics[name].render() for name in sorted(self._metrics)]
+        return "\n".join(families) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def timed(metric, **labels):
+    """
+    Decorator observing the duration of each call to the function in a Histogram
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with metric.time(**labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# Metrics of the OneEvent hot paths
+VIEW_DURATION = histogram(
+    "oneevent_view_duration_seconds",
+    "Time spent processing requests to instrumented views",
+    ["view"],
+)
+BOOKINGS_CREATED = counter(
+    "oneevent_bookings_created_total", "Number of bookings created"
+)
+BOOKINGS_CANCELLED = counter(
+    "oneevent_bookings_cancelled_total", "Number of bookings cancelled"
+)
+USERS_CACHE_BUILD_DURATION = histogram(
+    "oneevent_users_cache_build_seconds",
+    "Time spent building the per-event cache of organisers and categories",
+)
+INVITE_RENDER_DURATION = histogram(
+    "oneevent_invite_render_seconds",
+    "Time spent generating the calendar entry of an invite",
+)
+EMAIL_SEND_DURATION = histogram(
+    "oneevent_email_send_seconds", "Time spent sending emails", ["kind"]
+)
+EMAILS_SENT = counter(
+    "oneevent_emails_sent_total", "Number of emails sent", ["kind", "result"]
+)
+CSV_EXPORT_DURATION = histogram(
+    "oneevent_csv_export_seconds", "Time spent generating CSV exports", ["export"]
+)
+CSV_EXPORT_ROWS = counter(
+    "oneevent_csv_export_rows_total",
+    "Number of rows written to CSV exports",
+    ["export"],
+)
+EXPORT_CACHE_REQUESTS = counter(
+    "oneevent_export_cache_requests_total",
+    "Number of CSV exports served from the cache (hit) or generated (miss)",
+    ["export", "result"],
+)
+PAGE_CACHE_REQUESTS = counter(
+    "oneevent_page_cache_requests_total",
+    "Number of pages served to anonymous visitors from the cache (hit), from the "
+    "cache while being rendered again (stale) or rendered (miss)",
+    ["page", "result"],
+)
+WAITING_ROOM_REQUESTS = counter(
+    "oneevent_waiting_room_requests_total",
+    "Number of registration requests admitted or queued by the waiting rooms",
+    ["result"],
+)
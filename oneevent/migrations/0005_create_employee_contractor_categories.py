@@ -1,10 +1,10 @@
 from django.db import migrations
 
 
-def create_categoories(apps, _schema_editor):
+def create_categoories(apps, schema_editor):
     Event = apps.get_model("oneevent", "Event")
 
-    for event in Event.objects.all():
+    for event in Event.objects.using(schema_editor.connection.alias):
         employees = event.employees_groups.all()
         contractors = event.contractors_groups.all()
         exceptions = event.employees_exception_groups.all()
@@ -36,10 +36,10 @@ def create_categoories(apps, _schema_editor):
                     cnt_category.groups1.add(cnt_group)
 
 
-def delete_categories(apps, _schema_editor):
+def delete_categories(apps, schema_editor):
     Category = apps.get_model("oneevent", "Category")
 
-    Category.objects.filter(
+    Category.objects.using(schema_editor.connection.alias).filter(
         name__in=["Exceptions", "Employees", "Contractors"]
     ).delete()
 
@@ -15,9 +15,9 @@ TIMEZONE_CODES = {
 }
 
 
-def forwards(apps, _schema_editor):
+def forwards(apps, schema_editor):
     event_model = apps.get_model("oneevent", "Event")
-    all_events = event_model.objects.all()
+    all_events = event_model.objects.using(schema_editor.connection.alias)
     for event in all_events:
         event.timezone = TIMEZONE_CODES[event.city]
         event.save()
@@ -0,0 +1,76 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oneevent", "0012_outboxmessage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="booking",
+            name="created_at",
+            field=models.DateTimeField(
+                auto_now_add=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="booking",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="bookingoption",
+            name="created_at",
+            field=models.DateTimeField(
+                auto_now_add=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="bookingoption",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.CreateModel(
+            name="BookingTombstone",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("event_id", models.IntegerField()),
+                ("booking_id", models.IntegerField()),
+                ("booking_option_id", models.IntegerField(blank=True, null=True)),
+                ("option_id", models.IntegerField(blank=True, null=True)),
+                ("deleted_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "ordering": ["id"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(
+                fields=["event", "updated_at", "id"],
+                name="oneevent_booking_changes_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bookingtombstone",
+            index=models.Index(
+                fields=["event_id", "deleted_at", "id"],
+                name="oneevent_tombstone_feed_idx",
+            ),
+        ),
+    ]
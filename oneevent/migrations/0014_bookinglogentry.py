@@ -0,0 +1,89 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("oneevent", "0013_booking_timestamps"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookingLogEntry",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("booking_id", models.IntegerField()),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("CREATE", "Created"),
+                            ("CONFIRM", "Confirmed"),
+                            ("CANCEL", "Cancelled"),
+                            ("PAY", "Paid"),
+                            ("REFUND", "Refunded"),
+                            ("EXEMPT", "Exempted of payment"),
+                            ("UNEXEMPT", "Exemption cancelled"),
+                            ("SESSION", "Session changed"),
+                            ("CHOICES", "Choices changed"),
+                        ],
+                        max_length=8,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("details", models.CharField(blank=True, max_length=256)),
+                (
+                    "actor",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "event",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="booking_log",
+                        to="oneevent.event",
+                    ),
+                ),
+                (
+                    "person",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "booking log entries",
+                "ordering": ["id"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="bookinglogentry",
+            index=models.Index(
+                fields=["event", "created_at"], name="oneevent_booking_log_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,141 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import oneevent.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("oneevent", "0014_bookinglogentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="archived_on",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="When the bookings were moved to the archive tables",
+                null=True,
+            ),
+        ),
+        migrations.CreateModel(
+            name="ArchivedBooking",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("confirmedOn", models.DateTimeField(blank=True, null=True)),
+                ("cancelledOn", models.DateTimeField(blank=True, null=True)),
+                ("datePaid", models.DateTimeField(blank=True, null=True)),
+                ("exempt_of_payment", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField()),
+                (
+                    "archived_on",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "cancelledBy",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "event",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_bookings",
+                        to="oneevent.event",
+                    ),
+                ),
+                (
+                    "paidTo",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "person",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_bookings",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "session",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="oneevent.session",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["id"],
+                "unique_together": {("event", "person")},
+            },
+            bases=(oneevent.models.BookingDetailsMixin, models.Model),
+        ),
+        migrations.CreateModel(
+            name="ArchivedBookingOption",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField()),
+                (
+                    "booking",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="options",
+                        to="oneevent.archivedbooking",
+                    ),
+                ),
+                (
+                    "option",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_booking_options",
+                        to="oneevent.option",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["option__choice__id", "option__id", "id"],
+                "unique_together": {("booking", "option")},
+            },
+        ),
+    ]
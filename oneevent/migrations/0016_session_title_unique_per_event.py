@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oneevent", "0015_archived_bookings"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="session",
+            name="title",
+            field=models.CharField(max_length=64),
+        ),
+    ]
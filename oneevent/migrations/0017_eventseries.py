@@ -0,0 +1,118 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oneevent", "0016_session_title_unique_per_event"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EventSeries",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "title",
+                    models.CharField(
+                        help_text="Occurrences are named after the title and their "
+                        "date",
+                        max_length=48,
+                        unique=True,
+                    ),
+                ),
+                (
+                    "frequency",
+                    models.CharField(
+                        choices=[
+                            ("DAILY", "Daily"),
+                            ("WEEKLY", "Weekly"),
+                            ("MONTHLY", "Monthly"),
+                        ],
+                        max_length=8,
+                    ),
+                ),
+                (
+                    "interval",
+                    models.PositiveSmallIntegerField(
+                        default=1,
+                        help_text="Number of days, weeks or months between occurrences",
+                    ),
+                ),
+                (
+                    "count",
+                    models.PositiveIntegerField(
+                        blank=True,
+                        help_text="Total number of occurrences, including the "
+                        "prototype",
+                        null=True,
+                    ),
+                ),
+                (
+                    "until",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="No occurrence starts after this date",
+                        null=True,
+                    ),
+                ),
+                (
+                    "dstmode",
+                    models.CharField(
+                        choices=[
+                            ("auto", "Automatic"),
+                            ("adjust", "Keep the local time"),
+                            ("keep", "Keep the UTC time"),
+                        ],
+                        default="auto",
+                        max_length=8,
+                        verbose_name="Daylight saving time changes",
+                    ),
+                ),
+                (
+                    "next_index",
+                    models.PositiveIntegerField(
+                        default=1,
+                        editable=False,
+                        help_text="Number of the next occurrence to create",
+                    ),
+                ),
+                (
+                    "prototype",
+                    models.ForeignKey(
+                        help_text="Event copied to create the occurrences",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="series_prototype_of",
+                        to="oneevent.event",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "event series",
+                "ordering": ["title"],
+            },
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="series",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="occurrences",
+                to="oneevent.eventseries",
+            ),
+        ),
+    ]
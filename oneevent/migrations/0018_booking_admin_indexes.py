@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oneevent", "0017_eventseries"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(
+                fields=["event", "cancelledOn"], name="oneevent_booking_cancel_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(
+                fields=["created_at"], name="oneevent_booking_created_idx"
+            ),
+        ),
+    ]
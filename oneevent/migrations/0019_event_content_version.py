@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:08
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oneevent", "0018_booking_admin_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="content_updated_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+        migrations.AddField(
+            model_name="event",
+            name="content_version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oneevent", "0019_event_content_version"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="booking",
+            index=models.Index(
+                fields=["event", "created_at", "id"], name="oneevent_booking_table_idx"
+            ),
+        ),
+    ]
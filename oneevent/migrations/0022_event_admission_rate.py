@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oneevent", "0021_idempotency_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="event",
+            name="admission_rate",
+            field=models.PositiveSmallIntegerField(
+                blank=True,
+                help_text="Maximum number of users admitted to register per second, "
+                "the others wait in a queue (blank = no limit)",
+                null=True,
+            ),
+        ),
+    ]
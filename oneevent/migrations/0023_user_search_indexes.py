@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.db import migrations
+
+# Indexes on the user table backing the prefix searches of the bookings admin,
+# as (name, field name)
+INDEXES = (
+    ("oneevent_user_username_search_idx", "username"),
+    ("oneevent_user_last_name_search_idx", "last_name"),
+    ("oneevent_user_email_search_idx", "email"),
+)
+
+
+def _get_indexes(apps, schema_editor):
+    """
+    @return: a list of (index name, table, column) for the database, empty if its
+    searches can not use an index
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor not in ("postgresql", "mysql"):
+        return []
+    user_model = apps.get_model(settings.AUTH_USER_MODEL)
+    indexes = []
+    for name, field_name in INDEXES:
+        # The username is unique, MySQL already searches it with its index
+        if vendor == "mysql" and field_name == "username":
+            continue
+        column = user_model._meta.get_field(field_name).column
+        indexes.append((name, user_model._meta.db_table, column))
+    return indexes
+
+
+def forwards(apps, schema_editor):
+    quote = schema_editor.quote_name
+    for name, table, column in _get_indexes(apps, schema_editor):
+        if schema_editor.connection.vendor == "postgresql":
+            # Matches the UPPER(...::text) LIKE UPPER(...) of istartswith lookups
+            sql = "CREATE INDEX {0} ON {1} (UPPER({2}::text) text_pattern_ops)"
+        else:
+            # The case-insensitive collations of MySQL use plain indexes
+            sql = "CREATE INDEX {0} ON {1} ({2})"
+        schema_editor.execute(sql.format(quote(name), quote(table), quote(column)))
+
+
+def backwards(apps, schema_editor):
+    quote = schema_editor.quote_name
+    for name, table, _ in _get_indexes(apps, schema_editor):
+        if schema_editor.connection.vendor == "postgresql":
+            sql = "DROP INDEX {0}"
+        else:
+            sql = "DROP INDEX {0} ON {1}"
+        schema_editor.execute(sql.format(quote(name), quote(table)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("oneevent", "0022_event_admission_rate"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
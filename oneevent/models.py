@@ -1,3 +1,5 @@
+from calendar import monthrange
+from datetime import timedelta
 from decimal import Decimal
 
 from django.db import models
@@ -7,7 +9,10 @@ from django.core.exceptions import ValidationError
 from django.utils import timezone as django_timezone
 from django.core.mail.message import EmailMultiAlternatives
 from django.db.models.aggregates import Count
-from .tz_utils import add_to_zones_map
+from django.db.models.query_utils import Q
+from django.utils.functional import cached_property
+from .tz_utils import add_to_zones_map, utcoffset_normalize, DSTAUTO, DSTADJUST, DSTKEEP
+from . import metrics
 from timezone_field import TimeZoneField
 
 import icalendar
@@ -32,6 +37,53 @@ def end_of_day(when, timezone):
     return timezone.normalize(local_dt.replace(hour=23, minute=59, second=59))
 
 
+class EventState(object):
+    """
+    Snapshot of the timing and capacity of an event at a given time.
+    Computed once, e.g. per request, it gives consistent answers to all the views
+    and templates asking whether the event is open, and avoids computing the end
+    of the event and the current time again for each of them.
+    """
+
+    PUBLISHED_STATUSES = ("PUB", "REST", "PRIV")
+
+    def __init__(self, event, now=None):
+        """
+        @param now: the time of the snapshot, the current time by default
+        """
+        if now is None:
+            now = django_timezone.now()
+        self.event = event
+        self.now = now
+        self.end = event.get_real_end()
+        self.ended = self.end < now
+        published = event.pub_status in self.PUBLISHED_STATUSES
+        choices_closed = event.choices_close is not None and now > event.choices_close
+        booking_closed = event.booking_close is not None and now > event.booking_close
+        self.choices_open = published and not self.ended and not choices_closed
+        self.booking_open = self.choices_open and not booking_closed
+
+    @cached_property
+    def active_bookings(self):
+        """
+        The number of active bookings, counted on first use
+        """
+        return self.event.get_active_bookings().count()
+
+    @cached_property
+    def remaining(self):
+        """
+        The number of bookings that can still be made, None if there is no limit
+        """
+        if self.event.max_participant <= 0:
+            return None
+        return max(self.event.max_participant - self.active_bookings, 0)
+
+    @property
+    def fully_booked(self):
+        return self.remaining == 0
+
+
 class Event(models.Model):
     """
     An event being organised
@@ -96,11 +148,39 @@ class Event(models.Model):
         default=0,
         help_text="Maximum number of participants to this event (0 = no limit)",
     )
+    admission_rate = models.PositiveSmallIntegerField(
+        blank=True,
+        null=True,
+        help_text="Maximum number of users admitted to register per second, the "
+        "others wait in a queue (blank = no limit)",
+    )
 
     price_currency = models.CharField(
         max_length=3, null=True, blank=True, verbose_name="Currency for prices"
     )
 
+    archived_on = models.DateTimeField(
+        blank=True,
+        null=True,
+        editable=False,
+        help_text="When the bookings were moved to the archive tables",
+    )
+    series = models.ForeignKey(
+        "EventSeries",
+        related_name="occurrences",
+        blank=True,
+        null=True,
+        editable=False,
+        on_delete=models.SET_NULL,
+    )
+
+    # Bumped on any change to the event or its bookings, see versions.py
+    VERSION_FIELDS = ("content_version", "content_updated_at")
+    content_version = models.PositiveIntegerField(default=0, editable=False)
+    content_updated_at = models.DateTimeField(
+        default=django_timezone.now, editable=False
+    )
+
     def __unicode__(self):
         result = "{0} - {1:%x %H:%M}".format(self.title, self.start)
         if self.end is not None:
@@ -131,6 +211,21 @@ class Event(models.Model):
         ):
             raise ValidationError("Bookings must close before choices")
 
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        """
+        Leave the content version out of the UPDATE of a saved event, as it is only
+        incremented in the database: saving an event loaded earlier must not write
+        an old version back. An insert still writes it.
+        """
+        values = [
+            (field, model, value)
+            for field, model, value in values
+            if field.name not in self.VERSION_FIELDS
+        ]
+        return super(Event, self)._do_update(
+            base_qs, using, pk_val, values, update_fields, forced_update
+        )
+
     def _populate_users_cache(self):
         """
         Fill in the cache of info about users related to this event
@@ -138,6 +233,13 @@ class Event(models.Model):
         if self.users_values_cache is not None:
             return
 
+        with metrics.USERS_CACHE_BUILD_DURATION.time():
+            self._build_users_cache()
+
+    def _build_users_cache(self):
+        """
+        Build the cache of info about users related to this event
+        """
         self.users_values_cache = {}
 
         def add_cache(user, category):
@@ -218,7 +320,7 @@ class Event(models.Model):
             )
         elif self.pub_status == "PRIV" or self.pub_status == "UNPUB":
             user_has_booking = (
-                self.bookings.filter(person=user, cancelledOn=None).count() > 0
+                self.get_bookings().filter(person=user, cancelledOn=None).count() > 0
             )
             return user.is_superuser or user_has_booking or self.user_is_organiser(user)
         elif self.pub_status == "ARCH":
@@ -261,54 +363,84 @@ class Event(models.Model):
         else:
             return end_of_day(self.start, self.timezone)
 
+    def get_state(self, now=None):
+        """
+        Take a snapshot of the timing and capacity of the event, to be used for all
+        the checks of a request
+        @param now: the time of the snapshot, the current time by default
+        @return: an EventState
+        """
+        return EventState(self, now)
+
     def is_ended(self):
         """
         Check if the event is ended
         """
-        return self.get_real_end() < django_timezone.now()
+        return self.get_state().ended
 
     def is_booking_open(self):
         """
         Check if the event is still open for bookings
         """
-        closed = (
-            self.booking_close is not None
-            and django_timezone.now() > self.booking_close
-        )
-        published = self.pub_status in ("PUB", "REST", "PRIV")
-        return (
-            self.is_choices_open() and not self.is_ended() and not closed and published
-        )
+        return self.get_state().booking_open
 
     def is_choices_open(self):
         """
         Check if the event is still open for choices
         """
-        closed = (
-            self.choices_close is not None
-            and django_timezone.now() > self.choices_close
-        )
-        published = self.pub_status in ("PUB", "REST", "PRIV")
-        return not self.is_ended() and not closed and published
+        return self.get_state().choices_open
 
     def is_fully_booked(self):
         """
         Checks if it is still possible to add a booking regarding the maximum number
         of participants
         """
-        return 0 < self.max_participant <= self.get_active_bookings().count()
+        return self.get_state().fully_booked
+
+    def get_category_members(self):
+        """
+        The active users matched by any category of the event, selected in SQL
+        @return: a queryset of users, empty if the event has no category
+        """
+        users = get_user_model().objects.none()
+        for category in self.categories.all():
+            users = users | category.get_members()
+        return users.filter(is_active=True)
+
+    def is_archived(self):
+        """
+        Indicate if the bookings of this event were moved to the archive tables
+        """
+        return self.archived_on is not None
+
+    def get_bookings(self):
+        """
+        Return all the bookings, read from the archive tables for archived events
+        """
+        if self.is_archived():
+            return self.archived_bookings.all()
+        return self.bookings.all()
+
+    def _booking_options_lookup(self):
+        """
+        @return: the name of the relation from Option to the booking options of
+        this event
+        """
+        if self.is_archived():
+            return "archived_booking_options"
+        return "bookingoption"
 
     def get_active_bookings(self):
         """
         Return the active bookings
         """
-        return self.bookings.filter(cancelledOn__isnull=True)
+        return self.get_bookings().filter(cancelledOn__isnull=True)
 
     def get_cancelled_bookings(self):
         """
         Return the cancelled bookings
         """
-        return self.bookings.filter(cancelledOn__isnull=False)
+        return self.get_bookings().filter(cancelledOn__isnull=False)
 
     def get_participants_ids(self):
         """
@@ -322,9 +454,12 @@ class Event(models.Model):
         @return: a map of the form {Choice: {Option: count}}
         """
         result = {}
+        selections = self._booking_options_lookup()
         event_options = Option.objects.filter(choice__event=self)
-        event_options = event_options.filter(bookingoption__booking__cancelledOn=None)
-        event_options = event_options.annotate(total=Count("bookingoption"))
+        event_options = event_options.filter(
+            **{selections + "__booking__cancelledOn": None}
+        )
+        event_options = event_options.annotate(total=Count(selections))
         event_options = event_options.select_related("choice")
 
         for option in event_options:
@@ -333,6 +468,19 @@ class Event(models.Model):
             result[option.choice] = choice_counts
         return result
 
+    def get_options_totals(self):
+        """
+        Get the number of active bookings for every option of this event, including
+        the options that nobody selected, in a single aggregate query
+        @return: a queryset of tuples (choice title, option title, count, default)
+        """
+        selections = self._booking_options_lookup()
+        active_selection = Q(**{selections + "__booking__cancelledOn__isnull": True})
+        totals = Option.objects.filter(choice__event=self)
+        totals = totals.annotate(total=Count(selections, filter=active_selection))
+        totals = totals.order_by("choice__id", "id")
+        return totals.values_list("choice__title", "title", "total", "default")
+
     def get_collected_money_sums(self):
         """
         Calculate the total money collected by each organiser, for each class of
@@ -407,7 +555,7 @@ class Event(models.Model):
                 total_row += self._make_row(self._overall_totals)
                 yield total_row
 
-        bookings = self.bookings.select_related("person", "paidTo").filter(
+        bookings = self.get_bookings().select_related("person", "paidTo").filter(
             paidTo__isnull=False, exempt_of_payment=False
         )
 
@@ -424,6 +572,120 @@ class Event(models.Model):
         return result
 
 
+class EventSeries(models.Model):
+    """
+    Definition of a recurring event, similar to an iCalendar RRULE.
+    Occurrences are clones of the prototype event, created on demand by the
+    oneevent_expand_series command rather than all at once. The prototype itself is
+    the occurrence number 0.
+    """
+
+    FREQ_DAILY = "DAILY"
+    FREQ_WEEKLY = "WEEKLY"
+    FREQ_MONTHLY = "MONTHLY"
+    FREQ_CHOICES = (
+        (FREQ_DAILY, "Daily"),
+        (FREQ_WEEKLY, "Weekly"),
+        (FREQ_MONTHLY, "Monthly"),
+    )
+    DSTMODE_CHOICES = (
+        (DSTAUTO, "Automatic"),
+        (DSTADJUST, "Keep the local time"),
+        (DSTKEEP, "Keep the UTC time"),
+    )
+
+    title = models.CharField(
+        max_length=48,
+        unique=True,
+        help_text="Occurrences are named after the title and their date",
+    )
+    prototype = models.ForeignKey(
+        "Event",
+        related_name="series_prototype_of",
+        on_delete=models.CASCADE,
+        help_text="Event copied to create the occurrences",
+    )
+    frequency = models.CharField(max_length=8, choices=FREQ_CHOICES)
+    interval = models.PositiveSmallIntegerField(
+        default=1, help_text="Number of days, weeks or months between occurrences"
+    )
+    count = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text="Total number of occurrences, including the prototype",
+    )
+    until = models.DateTimeField(
+        blank=True, null=True, help_text="No occurrence starts after this date"
+    )
+    dstmode = models.CharField(
+        max_length=8,
+        choices=DSTMODE_CHOICES,
+        default=DSTAUTO,
+        verbose_name="Daylight saving time changes",
+    )
+    next_index = models.PositiveIntegerField(
+        default=1, editable=False, help_text="Number of the next occurrence to create"
+    )
+
+    class Meta:
+        verbose_name_plural = "event series"
+        ordering = ["title"]
+
+    def __unicode__(self):
+        return "{0} ({1})".format(self.title, self.get_frequency_display())
+
+    def clean(self):
+        """
+        Validate the contents of this Model
+        """
+        super(EventSeries, self).clean()
+        if self.interval == 0:
+            raise ValidationError("The interval must be positive")
+
+    def get_occurrence_start(self, index):
+        """
+        Calculate the start of an occurrence of the series
+        @param index: the number of the occurrence, 0 being the prototype
+        @return: an aware datetime, in the timezone of the prototype
+        """
+        start = self.prototype.start.astimezone(self.prototype.timezone)
+        steps = index * self.interval
+        if self.frequency == self.FREQ_DAILY:
+            shifted = start + timedelta(days=steps)
+        elif self.frequency == self.FREQ_WEEKLY:
+            shifted = start + timedelta(weeks=steps)
+        elif self.frequency == self.FREQ_MONTHLY:
+            month = start.month - 1 + steps
+            year = start.year + month // 12
+            month = month % 12 + 1
+            # Occurrences on days missing from shorter months are on their last day
+            day = min(start.day, monthrange(year, month)[1])
+            shifted = start.replace(year=year, month=month, day=day)
+        else:
+            raise Exception("Unknown frequency: {0}".format(self.frequency))
+        return utcoffset_normalize(shifted, shifted - start, self.dstmode)
+
+    def iter_occurrence_starts(self, first_index=None):
+        """
+        Yields the (index, start) of the occurrences of the series, lazily
+        @param first_index: the first occurrence, the next one to create by default
+        """
+        index = self.next_index if first_index is None else first_index
+        while self.count is None or index < self.count:
+            start = self.get_occurrence_start(index)
+            if self.until is not None and start > self.until:
+                return
+            yield index, start
+            index += 1
+
+    def get_occurrence_title(self, start):
+        """
+        The title of the occurrence of the series starting at a given datetime
+        """
+        local_start = start.astimezone(self.prototype.timezone)
+        return "{0} {1:%Y-%m-%d}".format(self.title, local_start)
+
+
 class Session(models.Model):
     """
     A session from an event being organised
@@ -432,7 +694,7 @@ class Session(models.Model):
     event = models.ForeignKey(
         "Event", related_name="sessions", on_delete=models.CASCADE
     )
-    title = models.CharField(max_length=64, unique=True)
+    title = models.CharField(max_length=64)
     start = models.DateTimeField(help_text="Local start date and time")
     end = models.DateTimeField(
         blank=True, null=True, help_text="Local end date and time"
@@ -530,6 +792,24 @@ class Category(models.Model):
             return False
         return True
 
+    def get_members(self):
+        """
+        The users matched by this category, selected in SQL with the same rules
+        as match()
+        @return: a queryset of users
+        """
+        memberships = get_user_model().groups.through.objects
+        users = get_user_model().objects.all()
+        for groups in (self.groups1, self.groups2):
+            if not groups.exists():
+                # Without groups1, groups2 is ignored
+                break
+            group_ids = groups.values("id")
+            users = users.filter(
+                id__in=memberships.filter(group__in=group_ids).values("user_id")
+            )
+        return users
+
 
 class Choice(models.Model):
     """
@@ -569,7 +849,72 @@ class Option(models.Model):
             return "{0} : option {1}".format(self.choice, self.title)
 
 
-class Booking(models.Model):
+class BookingDetailsMixin(object):
+    """
+    Read-only helpers shared by the live and the archived bookings
+    """
+
+    def is_cancelled(self):
+        """
+        Indicate if the booking is currently cancelled
+        """
+        return self.cancelledOn is not None
+
+    def get_category(self):
+        """
+        Finds the Event's category for this booking.
+        @returns the Category object or None if none matches
+        """
+        return self.event.get_user_category(self.person)
+
+    def get_category_name(self):
+        """
+        @returns the name of the category or "Unknown"
+        """
+        cat = self.get_category()
+        if cat is None:
+            return "Unknown"
+        return cat.name
+
+    def must_pay(self):
+        """
+        Returns the amount that the person has to pay for the booking
+        @return the amount to be paid as a Decimal value, 0 if no payment is needed. If
+        the amount can not be determined, returns 9999.99
+        """
+        NOTHING = Decimal(0)
+        DEFAULT = (
+            Decimal(999999) / 100
+        )  # To make sure there is no floating point rounding
+
+        if self.exempt_of_payment or not self.event.categories.exists():
+            return NOTHING
+
+        price = self.event.user_price(self.person)
+        if price is None:
+            return DEFAULT
+        return price
+
+    def get_payment_status_class(self):
+        """
+        Return the status of payment (as a Bootstrap context CSS class)
+        """
+        if self.paidTo is not None:
+            if self.is_cancelled():
+                return "danger"
+            else:
+                return "success"
+        else:
+            if self.is_cancelled():
+                return "default"
+            elif self.must_pay() == Decimal(0):
+                return "success"
+            else:
+                return "warning"
+        return ""
+
+
+class Booking(BookingDetailsMixin, models.Model):
     """
     Entry recording a user registration to an event
     """
@@ -608,9 +953,25 @@ class Booking(models.Model):
     datePaid = models.DateTimeField(blank=True, null=True)
     exempt_of_payment = models.BooleanField(default=False)
 
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
     class Meta:
         unique_together = ("event", "person")
         ordering = ["id"]
+        indexes = [
+            models.Index(
+                fields=["event", "updated_at", "id"],
+                name="oneevent_booking_changes_idx",
+            ),
+            models.Index(
+                fields=["event", "cancelledOn"], name="oneevent_booking_cancel_idx"
+            ),
+            models.Index(fields=["created_at"], name="oneevent_booking_created_idx"),
+            models.Index(
+                fields=["event", "created_at", "id"], name="oneevent_booking_table_idx"
+            ),
+        ]
 
     def __unicode__(self):
         return "{0} : {1}".format(self.event.title, self.person)
@@ -673,65 +1034,6 @@ class Booking(models.Model):
         """
         return self.event.user_is_organiser(user)
 
-    def is_cancelled(self):
-        """
-        Indicate if the booking is currently cancelled
-        """
-        return self.cancelledOn is not None
-
-    def get_category(self):
-        """
-        Finds the Event's category for this booking.
-        @returns the Category object or None if none matches
-        """
-        return self.event.get_user_category(self.person)
-
-    def get_category_name(self):
-        """
-        @returns the name of the category or "Unknown"
-        """
-        cat = self.get_category()
-        if cat is None:
-            return "Unknown"
-        return cat.name
-
-    def must_pay(self):
-        """
-        Returns the amount that the person has to pay for the booking
-        @return the amount to be paid as a Decimal value, 0 if no payment is needed. If
-        the amount can not be determined, returns 9999.99
-        """
-        NOTHING = Decimal(0)
-        DEFAULT = (
-            Decimal(999999) / 100
-        )  # To make sure there is no floating point rounding
-
-        if self.exempt_of_payment or not self.event.categories.exists():
-            return NOTHING
-
-        price = self.event.user_price(self.person)
-        if price is None:
-            return DEFAULT
-        return price
-
-    def get_payment_status_class(self):
-        """
-        Return the status of payment (as a Bootstrap context CSS class)
-        """
-        if self.paidTo is not None:
-            if self.is_cancelled():
-                return "danger"
-            else:
-                return "success"
-        else:
-            if self.is_cancelled():
-                return "default"
-            elif self.must_pay() == Decimal(0):
-                return "success"
-            else:
-                return "warning"
-        return ""
-
     def get_invite_texts(self):
         """
         Get the text contents for an invite to the event
@@ -804,6 +1106,7 @@ class Booking(models.Model):
 
         return (title_text, plain_text, html_text)
 
+    @metrics.timed(metrics.INVITE_RENDER_DURATION)
     def get_calendar_entry(self):
         """
         Build the iCalendar string for the event
@@ -886,9 +1189,11 @@ class Booking(models.Model):
 
         return cal.to_ical()
 
-    def send_calendar_invite(self):
+    def build_calendar_invite(self, connection=None):
         """
-        Send a calendar entry to the participant
+        Build the email carrying a calendar entry for the participant
+        @param connection: the email backend connection to send the message with
+        @return: an EmailMultiAlternatives ready to be sent
         """
         title, _desc_plain, desc_html = self.get_invite_texts()
         cal_text = self.get_calendar_entry()
@@ -973,6 +1278,7 @@ class Booking(models.Model):
             to=[self.person.email],
             from_email=from_full,
             reply_to=[reply_to_full],
+            connection=connection,
         )
         msg.extra_headers["Content-class"] = "urn:content-classes:calendarmessage"
         msg.attach(part_html)
@@ -987,10 +1293,38 @@ class Booking(models.Model):
         part.add_header("Path", filename)
         msg.attach(part)
 
-        print(cal_text)
+        return msg
+
+    def send_calendar_invite(self, connection=None):
+        """
+        Send a calendar entry to the participant
+        @param connection: the email backend connection to use, a new one by default
+        @return: True if the message was sent
+        """
+        msg = self.build_calendar_invite(connection)
 
         # Send the message
-        return msg.send(fail_silently=False) == 1
+        with metrics.EMAIL_SEND_DURATION.time(kind="invite"):
+            try:
+                sent = msg.send(fail_silently=False) == 1
+            except Exception:
+                metrics.EMAILS_SENT.inc(kind="invite", result="error")
+                raise
+        metrics.EMAILS_SENT.inc(kind="invite", result="sent" if sent else "failed")
+        return sent
+
+    def enqueue_calendar_invite(self):
+        """
+        Queue a calendar entry to be sent to the participant by the outbox worker.
+        The message is created in the current transaction, and is not queued twice.
+        @return: the OutboxMessage
+        """
+        message, _ = OutboxMessage.objects.get_or_create(
+            booking=self,
+            kind=OutboxMessage.KIND_INVITE,
+            status=OutboxMessage.STATUS_PENDING,
+        )
+        return message
 
 
 class BookingOption(models.Model):
@@ -1005,6 +1339,9 @@ class BookingOption(models.Model):
         "Option", null=True, blank=True, on_delete=models.CASCADE
     )
 
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
     class Meta:
         unique_together = ("booking", "option")
         ordering = ["option__choice__id", "option__id", "id"]
@@ -1026,3 +1363,266 @@ class BookingOption(models.Model):
                     self.booking, self.option.choice
                 )
                 raise ValidationError(error)
+
+
+class ArchivedBooking(BookingDetailsMixin, models.Model):
+    """
+    Booking of an archived event, moved out of the Booking table by the
+    oneevent_archive command. It keeps the ID of the original booking.
+    """
+
+    event = models.ForeignKey(
+        "Event", related_name="archived_bookings", on_delete=models.CASCADE
+    )
+    person = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="archived_bookings",
+        on_delete=models.CASCADE,
+    )
+    session = models.ForeignKey(
+        "Session", related_name="+", null=True, blank=True, on_delete=models.SET_NULL
+    )
+
+    confirmedOn = models.DateTimeField(blank=True, null=True)
+    cancelledBy = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        blank=True,
+        null=True,
+        related_name="+",
+        on_delete=models.SET_NULL,
+    )
+    cancelledOn = models.DateTimeField(blank=True, null=True)
+
+    paidTo = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        blank=True,
+        null=True,
+        related_name="+",
+        on_delete=models.SET_NULL,
+    )
+    datePaid = models.DateTimeField(blank=True, null=True)
+    exempt_of_payment = models.BooleanField(default=False)
+
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_on = models.DateTimeField(default=django_timezone.now)
+
+    class Meta:
+        unique_together = ("event", "person")
+        ordering = ["id"]
+
+    def __unicode__(self):
+        return "{0} : {1} (archived)".format(self.event.title, self.person)
+
+    # Archived bookings are read-only
+    def user_can_update(self, user):
+        return False
+
+    def user_can_cancel(self, user):
+        return False
+
+    def user_can_update_payment(self, user):
+        return False
+
+
+class ArchivedBookingOption(models.Model):
+    """
+    Option selected in an archived booking
+    """
+
+    booking = models.ForeignKey(
+        "ArchivedBooking", related_name="options", on_delete=models.CASCADE
+    )
+    option = models.ForeignKey(
+        "Option",
+        related_name="archived_booking_options",
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+    )
+
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("booking", "option")
+        ordering = ["option__choice__id", "option__id", "id"]
+
+    def __unicode__(self):
+        return "{0} -> {1}".format(self.booking, self.option)
+
+
+class BookingTombstone(models.Model):
+    """
+    Record of a deleted booking or booking option, so that consumers of the change
+    feed of an event also learn about deletions.
+    Only IDs are stored: the referenced rows do not exist any more.
+    """
+
+    event_id = models.IntegerField()
+    booking_id = models.IntegerField()
+    booking_option_id = models.IntegerField(blank=True, null=True)
+    option_id = models.IntegerField(blank=True, null=True)
+    deleted_at = models.DateTimeField(default=django_timezone.now)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(
+                fields=["event_id", "deleted_at", "id"],
+                name="oneevent_tombstone_feed_idx",
+            ),
+        ]
+
+    def __unicode__(self):
+        if self.booking_option_id is None:
+            return "Deleted booking {0}".format(self.booking_id)
+        return "Deleted option {0} of booking {1}".format(
+            self.option_id, self.booking_id
+        )
+
+
+class BookingLogEntry(models.Model):
+    """
+    Append-only log of the changes of state of the bookings, see the audit module.
+    The booking is only referenced by ID so that its history outlives it.
+    """
+
+    ACTION_CREATE = "CREATE"
+    ACTION_CONFIRM = "CONFIRM"
+    ACTION_CANCEL = "CANCEL"
+    ACTION_PAY = "PAY"
+    ACTION_REFUND = "REFUND"
+    ACTION_EXEMPT = "EXEMPT"
+    ACTION_UNEXEMPT = "UNEXEMPT"
+    ACTION_SESSION = "SESSION"
+    ACTION_CHOICES = "CHOICES"
+    ACTION_CHOICES_LIST = (
+        (ACTION_CREATE, "Created"),
+        (ACTION_CONFIRM, "Confirmed"),
+        (ACTION_CANCEL, "Cancelled"),
+        (ACTION_PAY, "Paid"),
+        (ACTION_REFUND, "Refunded"),
+        (ACTION_EXEMPT, "Exempted of payment"),
+        (ACTION_UNEXEMPT, "Exemption cancelled"),
+        (ACTION_SESSION, "Session changed"),
+        (ACTION_CHOICES, "Choices changed"),
+    )
+
+    event = models.ForeignKey(
+        "Event", related_name="booking_log", on_delete=models.CASCADE
+    )
+    booking_id = models.IntegerField()
+    person = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="+",
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+    )
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="+",
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+    )
+    action = models.CharField(max_length=8, choices=ACTION_CHOICES_LIST)
+    created_at = models.DateTimeField(default=django_timezone.now)
+    details = models.CharField(max_length=256, blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name_plural = "booking log entries"
+        indexes = [
+            models.Index(
+                fields=["event", "created_at"], name="oneevent_booking_log_idx"
+            ),
+        ]
+
+    def __unicode__(self):
+        return "{0} {1} booking {2}".format(
+            self.created_at, self.get_action_display(), self.booking_id
+        )
+
+
+class OutboxMessage(models.Model):
+    """
+    A message waiting to be sent to a participant by the outbox worker
+    """
+
+    KIND_INVITE = "INVITE"
+    KIND_CHOICES = ((KIND_INVITE, "Calendar invite"),)
+
+    STATUS_PENDING = "PENDING"
+    STATUS_SENT = "SENT"
+    STATUS_FAILED = "FAILED"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_SENT, "Sent"),
+        (STATUS_FAILED, "Failed"),
+    )
+
+    booking = models.ForeignKey(
+        "Booking", related_name="outbox_messages", on_delete=models.CASCADE
+    )
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    status = models.CharField(
+        max_length=8, choices=STATUS_CHOICES, default=STATUS_PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(default=django_timezone.now)
+    next_attempt_at = models.DateTimeField(default=django_timezone.now)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(
+                fields=["status", "next_attempt_at"], name="oneevent_outbox_due_idx"
+            ),
+        ]
+
+    def __unicode__(self):
+        return "{0} for {1} ({2})".format(
+            self.get_kind_display(), self.booking, self.get_status_display()
+        )
+
+    def send(self, connection=None):
+        """
+        Send the message
+        @param connection: the email backend connection to send the message with
+        @return: True if the message was sent
+        """
+        if self.kind == self.KIND_INVITE:
+            return self.booking.send_calendar_invite(connection)
+        raise ValueError("Unknown message kind: {0}".format(self.kind))
+
+
+class IdempotencyKey(models.Model):
+    """
+    The outcome of a request sent with an idempotency key, replayed to the retries
+    of the same request until it expires
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name="+", on_delete=models.CASCADE
+    )
+    key = models.CharField(max_length=64)
+    # Hash of the method, path and parameters of the request
+    fingerprint = models.CharField(max_length=64)
+    # None while the request is being processed
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True)
+    content_type = models.CharField(max_length=128, blank=True)
+    location = models.CharField(max_length=2048, blank=True)
+    content = models.BinaryField(blank=True)
+    created_at = models.DateTimeField(default=django_timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ("user", "key")
+        ordering = ["id"]
+
+    def __unicode__(self):
+        return "{0} for {1}".format(self.key, self.user)
@@ -0,0 +1,152 @@
+"""
+Delivery of the messages queued in the OutboxMessage table.
+
+Views only enqueue messages, in their own transaction, and the outbox worker
+(`manage.py oneevent_outbox_worker`) drains the queue in batches, outside of the
+request/response cycle.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.mail import get_connection
+from django.db import connection as db_connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+
+logger = logging.getLogger(__name__)
+
+
+def claim_batch(batch_size, lease_seconds, now=None):
+    """
+    Reserve a batch of due messages for this worker.
+    Claimed messages are not due again before the lease expires, so a crashed worker
+    does not lose them and concurrent workers do not send them twice.
+    @param batch_size: the maximum number of messages to claim
+    @param lease_seconds: how long the messages are reserved for this worker
+    @return: a list of OutboxMessage, ready to be sent without further DB queries
+    """
+    now = now or timezone.now()
+    lease_end = now + timedelta(seconds=lease_seconds)
+    with transaction.atomic():
+        due = OutboxMessage.objects.filter(
+            status=OutboxMessage.STATUS_PENDING, next_attempt_at__lte=now
+        ).order_by("next_attempt_at", "id")
+        if db_connection.features.has_select_for_update_skip_locked:
+            # The selected rows are locked until the lease is recorded
+            due = due.select_for_update(skip_locked=True)
+            claimed_ids = list(due.values_list("id", flat=True)[:batch_size])
+            OutboxMessage.objects.filter(id__in=claimed_ids).update(
+                next_attempt_at=lease_end
+            )
+        else:
+            # Without locks, concurrent workers may select the same messages: each
+            # message is claimed by a compare-and-set, won by a single worker
+            claimed_ids = [
+                message_id
+                for message_id in due.values_list("id", flat=True)[:batch_size]
+                if due.filter(id=message_id).update(next_attempt_at=lease_end)
+            ]
+
+    messages = OutboxMessage.objects.filter(id__in=claimed_ids)
+    messages = messages.select_related(
+        "booking__event__owner", "booking__person"
+    ).prefetch_related("booking__options__option__choice")
+    return list(messages)
+
+
+def _send_chunk(messages):
+    """
+    Send a list of messages over a single email backend connection
+    @return: a list of (message, error) where error is None for sent messages
+    """
+    results = []
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        logger.exception("Failure opening the email connection")
+        return [(message, repr(e)) for message in messages]
+    try:
+        for message in messages:
+            try:
+                if message.send(connection):
+                    results.append((message, None))
+                else:
+                    results.append((message, "Message not sent"))
+            except Exception as e:
+                logger.exception("Failure sending outbox message %s", message.id)
+                results.append((message, repr(e)))
+    finally:
+        connection.close()
+    return results
+
+
+def process_batch(
+    batch_size=50, concurrency=1, max_attempts=5, backoff_seconds=60, lease_seconds=300
+):
+    """
+    Claim and send one batch of due messages
+    @param batch_size: the maximum number of messages to send
+    @param concurrency: the maximum number of connections sending messages in parallel
+    @param max_attempts: the number of attempts before a message is marked as failed
+    @param backoff_seconds: delay before the first retry, doubled at each attempt
+    @param lease_seconds: how long claimed messages are reserved for this worker
+    @return: a dict with the number of messages "sent", "retried" and "failed"
+    """
+    stats = {"sent": 0, "retried": 0, "failed": 0}
+    messages = claim_batch(batch_size, lease_seconds)
+    if not messages:
+        return stats
+
+    concurrency = max(1, min(concurrency, len(messages)))
+    chunks = [messages[i::concurrency] for i in range(concurrency)]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = [r for chunk in executor.map(_send_chunk, chunks) for r in chunk]
+
+    now = timezone.now()
+    sent_ids = [message.id for message, error in results if error is None]
+    OutboxMessage.objects.filter(id__in=sent_ids).update(
+        status=OutboxMessage.STATUS_SENT,
+        sent_at=now,
+        attempts=F("attempts") + 1,
+        last_error="",
+    )
+    stats["sent"] = len(sent_ids)
+
+    for message, error in results:
+        if error is None:
+            continue
+        attempts = message.attempts + 1
+        message.attempts = attempts
+        message.last_error = error
+        if attempts >= max_attempts:
+            message.status = OutboxMessage.STATUS_FAILED
+            stats["failed"] += 1
+        else:
+            delay = backoff_seconds * 2 ** (attempts - 1)
+            message.next_attempt_at = now + timedelta(seconds=delay)
+            stats["retried"] += 1
+        message.save(
+            update_fields=["attempts", "last_error", "status", "next_attempt_at"]
+        )
+
+    return stats
+
+
+def drain(**kwargs):
+    """
+    Send batches of messages until none is due any more
+    @param kwargs: the parameters of process_batch()
+    @return: a dict with the total number of messages "sent", "retried" and "failed"
+    """
+    totals = {"sent": 0, "retried": 0, "failed": 0}
+    while True:
+        stats = process_batch(**kwargs)
+        for key, value in stats.items():
+            totals[key] += value
+        if not any(stats.values()):
+            return totals
@@ -0,0 +1,184 @@
+"""
+Cache of the public lists of events served to anonymous visitors.
+
+Anonymous visitors all see the same lists, made of the published events only, so
+the rendered pages are stored in the Django cache and shared between them. A cached
+page is stale once its timeout expired or once a published event, or an event shown
+in a cached page, changed (see versions.bump_content_version()): the time of the
+last such change is kept in the cache, and the pages rendered before it are stale.
+
+A stale page is still served for ONEEVENT_PAGE_CACHE_STALE_TIMEOUT seconds while a
+single request renders it again, so that a rush of visitors after a change does not
+render the page many times at once. The pages are rendered from the primary
+database, even in views reading from a replica. The cached pages have their own
+ETag, derived from the time they were rendered, so that the conditional requests
+served from the cache do not query the database either: the decorator must be
+applied outside of the condition() decorator of the view. The cache is disabled when
+ONEEVENT_PAGE_CACHE_TIMEOUT is None. It must be shared by all the processes serving
+the site for the invalidation to reach them, e.g. memcached or redis.
+"""
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.http.response import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+from . import db_routing, metrics
+from .models import Event
+
+
+KEY_PREFIX = "oneevent:page_cache:"
+CHANGED_AT_KEY = KEY_PREFIX + "changed_at"
+LISTED_KEY = KEY_PREFIX + "listed"
+
+
+def _is_enabled():
+    return settings.ONEEVENT_PAGE_CACHE_TIMEOUT is not None
+
+
+def _get_changed_at(now):
+    """
+    @return: the time of the last change to the public events. If it is unknown,
+    e.g. evicted from the cache, all the pages are considered stale.
+    """
+    changed_at = cache.get(CHANGED_AT_KEY)
+    if changed_at is None:
+        cache.add(CHANGED_AT_KEY, now, None)
+        changed_at = now
+    return changed_at
+
+
+def invalidate():
+    """
+    Mark all the cached pages as stale
+    """
+    cache.set(CHANGED_AT_KEY, time.time(), None)
+    cache.delete(LISTED_KEY)
+
+
+def events_changed(event_ids):
+    """
+    Invalidate the cached pages if some of the changed events are public, or were
+    shown in the cached pages, e.g. before being unpublished or deleted
+    @param event_ids: the IDs of the changed events, as an iterable or a
+    queryset of values
+    """
+    if not _is_enabled():
+        return
+    listed = cache.get(LISTED_KEY, set())
+    if isinstance(event_ids, QuerySet):
+        query = Q(pub_status="PUB") | Q(id__in=listed)
+        changed = Event.objects.filter(query, id__in=event_ids).exists()
+    else:
+        event_ids = set(event_ids)
+        changed = (
+            not event_ids.isdisjoint(listed)
+            or Event.objects.filter(id__in=event_ids, pub_status="PUB").exists()
+        )
+    if changed:
+        invalidate()
+        # Again once committed, for the pages rendered meanwhile from the previous
+        # state of the database
+        transaction.on_commit(invalidate)
+
+
+def _add_listed(event_ids):
+    """
+    Record the events shown in a cached page, so it is invalidated when they
+    change even if they are no longer public
+    """
+    event_ids = set(event_ids)
+    listed = cache.get(LISTED_KEY, set())
+    if not listed.issuperset(event_ids):
+        cache.set(LISTED_KEY, listed.union(event_ids), None)
+
+
+def _get_etag(page, rendered_at):
+    return quote_etag("page-{0}-{1:.0f}".format(page, rendered_at * 1000000))
+
+
+def _cached_response(request, page, entry):
+    """
+    @return: the response of a cached page, or a 304 response if the visitor
+    already has it
+    """
+    rendered_at, content_type, content = entry
+    etag = _get_etag(page, rendered_at)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type=content_type)
+    response["ETag"] = etag
+    return response
+
+
+def anonymous_cached(page):
+    """
+    Decorator of a view listing events, serving its GET requests from anonymous
+    visitors from the cache
+    @param page: the name of the page in the cache
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (
+                not _is_enabled()
+                or request.method not in ("GET", "HEAD")
+                or not request.user.is_anonymous
+                # Pending messages are shown in the page
+                or len(get_messages(request)) > 0
+            ):
+                return view(request, *args, **kwargs)
+
+            key = KEY_PREFIX + page
+            timeout = settings.ONEEVENT_PAGE_CACHE_TIMEOUT
+            stale_timeout = settings.ONEEVENT_PAGE_CACHE_STALE_TIMEOUT
+            now = time.time()
+            changed_at = _get_changed_at(now)
+            entry = cache.get(key)
+            if entry is not None:
+                rendered_at = entry[0]
+                stale_since = rendered_at + timeout
+                if rendered_at < changed_at:
+                    stale_since = min(stale_since, changed_at)
+                if now < stale_since:
+                    metrics.PAGE_CACHE_REQUESTS.inc(page=page, result="hit")
+                    return _cached_response(request, page, entry)
+                # Only one request renders the page again, the others get the stale
+                # page meanwhile
+                if now < stale_since + stale_timeout and not cache.add(
+                    key + ":lock", True, stale_timeout
+                ):
+                    metrics.PAGE_CACHE_REQUESTS.inc(page=page, result="stale")
+                    return _cached_response(request, page, entry)
+
+            metrics.PAGE_CACHE_REQUESTS.inc(page=page, result="miss")
+            # Rendered from the primary database, as a page rendered from a lagging
+            # replica would be cached as fresh
+            with db_routing.reading_from(DEFAULT_DB_ALIAS):
+                response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                # The pages of anonymous visitors list published events only
+                _add_listed(
+                    Event.objects.filter(pub_status="PUB").values_list("id", flat=True)
+                )
+                cache.set(
+                    key,
+                    (now, response["Content-Type"], response.content),
+                    timeout + stale_timeout,
+                )
+                # Revalidated against the cache from now on
+                response["ETag"] = _get_etag(page, now)
+            cache.delete(key + ":lock")
+            return response
+
+        return wrapper
+
+    return decorator
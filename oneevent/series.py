@@ -0,0 +1,67 @@
+"""
+Lazy expansion of recurring event series into events.
+
+Only the next few occurrences of a series exist as events at any time, so the lists
+of events do not pay for occurrences far in the future. The oneevent_expand_series
+command, typically run daily, creates the next ones in bulk as time goes by.
+"""
+import itertools
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cloning import clone_events
+from .models import EventSeries
+
+
+def expand(series, limit, after=None):
+    """
+    Create the next occurrences of a series
+    @param limit: the maximum number of occurrences to create
+    @param after: if given, skip the occurrences starting before this datetime
+    @return: the list of new Events
+    """
+    with transaction.atomic():
+        # Lock the series so that concurrent expansions do not create duplicates
+        series = EventSeries.objects.select_for_update().get(id=series.id)
+        starts = series.iter_occurrence_starts()
+        if after is not None:
+            starts = itertools.dropwhile(lambda o: o[1] < after, starts)
+        starts = list(itertools.islice(starts, limit))
+        if not starts:
+            return []
+        prototype = series.prototype
+        events = clone_events(
+            prototype,
+            [(series.get_occurrence_title(start), start) for _index, start in starts],
+            pub_status=prototype.pub_status,
+            series=series,
+        )
+        series.next_index = starts[-1][0] + 1
+        series.save(update_fields=["next_index"])
+    return events
+
+
+def expand_upcoming(series, ahead, now=None):
+    """
+    Make sure that the next occurrences of a series exist. Occurrences in the past
+    which were never created are skipped
+    @param ahead: the number of occurrences that should exist after now
+    @return: the list of new Events
+    """
+    now = now or timezone.now()
+    upcoming = series.occurrences.filter(start__gte=now).count()
+    if upcoming >= ahead:
+        return []
+    return expand(series, ahead - upcoming, now)
+
+
+def expand_all(ahead, now=None):
+    """
+    Make sure that the next occurrences of all the series exist
+    @return: a dict mapping each series to its new Events
+    """
+    return {
+        series: expand_upcoming(series, ahead, now)
+        for series in EventSeries.objects.select_related("prototype")
+    }
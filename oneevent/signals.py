@@ -0,0 +1,197 @@
+"""
+Signal handlers keeping derived data in sync with the OneEvent models.
+They are connected when the application is ready.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db.models.query_utils import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import (
+    Event,
+    Category,
+    Session,
+    Choice,
+    Option,
+    Booking,
+    BookingOption,
+    BookingTombstone,
+)
+from .versions import bump_content_version
+
+
+_local = threading.local()
+
+
+@contextmanager
+def _disabled(name):
+    previous = getattr(_local, name, False)
+    setattr(_local, name, True)
+    try:
+        yield
+    finally:
+        setattr(_local, name, previous)
+
+
+def tombstones_disabled():
+    """
+    Do not record the bookings deleted within this block as tombstones, e.g. when
+    they are only moved to the archive tables
+    """
+    return _disabled("tombstones_disabled")
+
+
+def versions_disabled():
+    """
+    Do not bump the content versions of the events changed within this block, e.g.
+    when a bulk operation bumps them once at the end
+    """
+    return _disabled("versions_disabled")
+
+
+def _tombstones_enabled():
+    return not getattr(_local, "tombstones_disabled", False)
+
+
+def _bump_content_version(event_ids):
+    if not getattr(_local, "versions_disabled", False):
+        bump_content_version(event_ids)
+
+
+@receiver(post_save, sender=BookingOption)
+def touch_booking_on_option_saved(sender, instance, **kwargs):
+    """
+    Changing the options of a booking is a change of the booking
+    """
+    Booking.objects.filter(id=instance.booking_id).update(
+        updated_at=instance.updated_at
+    )
+
+
+@receiver(post_delete, sender=BookingOption)
+def record_booking_option_deletion(sender, instance, **kwargs):
+    if not _tombstones_enabled():
+        return
+    booking = Booking.objects.filter(id=instance.booking_id)
+    event_id = booking.values_list("event_id", flat=True).first()
+    if event_id is None:
+        return
+    tombstone = BookingTombstone.objects.create(
+        event_id=event_id,
+        booking_id=instance.booking_id,
+        booking_option_id=instance.id,
+        option_id=instance.option_id,
+    )
+    booking.update(updated_at=tombstone.deleted_at)
+
+
+@receiver(post_delete, sender=Booking)
+def record_booking_deletion(sender, instance, **kwargs):
+    if not _tombstones_enabled():
+        return
+    BookingTombstone.objects.create(
+        event_id=instance.event_id, booking_id=instance.id
+    )
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def bump_event_version(sender, instance, **kwargs):
+    _bump_content_version([instance.id])
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Session)
+@receiver(post_delete, sender=Session)
+@receiver(post_save, sender=Choice)
+@receiver(post_delete, sender=Choice)
+def bump_version_of_event(sender, instance, **kwargs):
+    """
+    A change to the parts of an event is a change of the event
+    """
+    _bump_content_version([instance.event_id])
+
+
+@receiver(post_save, sender=Option)
+@receiver(post_delete, sender=Option)
+def bump_version_on_option_changed(sender, instance, **kwargs):
+    choices = Choice.objects.filter(id=instance.choice_id)
+    _bump_content_version(choices.values("event_id"))
+
+
+@receiver(post_save, sender=BookingOption)
+@receiver(post_delete, sender=BookingOption)
+def bump_version_on_booking_option_changed(sender, instance, **kwargs):
+    bookings = Booking.objects.filter(id=instance.booking_id)
+    _bump_content_version(bookings.values("event_id"))
+
+
+@receiver(m2m_changed, sender=Event.organisers.through)
+@receiver(m2m_changed, sender=Category.groups1.through)
+@receiver(m2m_changed, sender=Category.groups2.through)
+def bump_version_on_relations_changed(
+    sender, instance, action, model, pk_set, **kwargs
+):
+    if not action.startswith("post_"):
+        return
+    if isinstance(instance, Event):
+        _bump_content_version([instance.id])
+    elif isinstance(instance, Category):
+        _bump_content_version([instance.event_id])
+    elif pk_set:
+        # Changed from the side of the user or group
+        if model is Event:
+            _bump_content_version(pk_set)
+        else:
+            categories = Category.objects.filter(id__in=pk_set)
+            _bump_content_version(categories.values("event_id"))
+
+
+# Saves of the users which do not change what the events show of them
+USER_UNSHOWN_FIELDS = {"last_login", "password"}
+
+
+@receiver(post_save, sender=get_user_model())
+def bump_version_on_user_changed(sender, instance, update_fields=None, **kwargs):
+    """
+    The names of the users are shown in the pages and exports of the events they
+    take part in
+    """
+    if update_fields is not None and set(update_fields) <= USER_UNSHOWN_FIELDS:
+        return
+    events = Event.objects.filter(
+        Q(bookings__person=instance)
+        | Q(bookings__paidTo=instance)
+        | Q(owner=instance)
+        | Q(organisers=instance)
+    )
+    _bump_content_version(events.values("id"))
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+def bump_version_on_user_groups_changed(
+    sender, instance, action, model, pk_set, **kwargs
+):
+    """
+    The groups of the participants give their category, and their price
+    """
+    if isinstance(instance, get_user_model()):
+        if not action.startswith("post_"):
+            return
+        user_ids = [instance.id]
+    elif action == "pre_clear":
+        # All the users removed from a group, not known after the removal
+        user_ids = instance.user_set.values("id")
+    elif action.startswith("post_") and pk_set:
+        # Changed from the side of the group
+        user_ids = pk_set
+    else:
+        return
+    bookings = Booking.objects.filter(person_id__in=user_ids)
+    _bump_content_version(bookings.values("event_id"))
@@ -3,9 +3,20 @@ avoid_collapse_toggle = function(e) {
     e.stopPropagation();
 };
 
-hide_cancelled_toggle = function(evt){
-    $('tr.cancelled').toggleClass("hidden", !evt.target.checked);
-    avoid_collapse_toggle(evt);
+load_more_bookings = function(evt){
+    var button = $(evt.target);
+    button.prop("disabled", true);
+    $.getJSON(button.data("url"), {cursor: button.data("cursor")})
+       .done(function(page) {
+            $('#bookings-rows').append(page.html);
+            button.data("cursor", page.next_cursor);
+            button.prop("disabled", false);
+            button.toggleClass("hidden", !page.more);
+       })
+       .fail(function() {
+            button.prop("disabled", false);
+            add_message('danger', 'Failed loading more participants');
+       });
 };
 
 add_message = function(level, text){
@@ -20,10 +31,10 @@ add_message = function(level, text){
 send_invite = function(url, username){
     var jqxhr = $.ajax(url)
        .done(function() {
-            add_message('success', 'Invite sent to ' + username)
+            add_message('success', 'Invite queued for ' + username)
        })
        .fail(function() {
-            add_message('danger', 'Failed sending invite to ' + username)
+            add_message('danger', 'Failed queuing invite for ' + username)
        });
 };
 
@@ -31,3 +42,27 @@ send_invite = function(url, username){
 copyToClipboard = function(text) {
     window.prompt("Copy to clipboard: Ctrl+C, Enter", text);
 }
+
+poll_waiting_room = function(room){
+    $.getJSON(room.data("status-url"), {token: room.data("token")})
+       .done(function(status) {
+            if (status.admitted) {
+                window.location = room.data("next-url");
+                return;
+            }
+            $('#waiting-room-position').text(status.position);
+            $('#waiting-room-wait').text(status.wait);
+            setTimeout(poll_waiting_room, Math.min(status.wait, 5) * 1000, room);
+       })
+       .fail(function() {
+            // Expired ticket, get a new one
+            window.location = room.data("next-url");
+       });
+};
+
+$(function() {
+    var room = $('#waiting-room');
+    if (room.length) {
+        setTimeout(poll_waiting_room, Math.min(room.data("wait") || 1, 5) * 1000, room);
+    }
+});
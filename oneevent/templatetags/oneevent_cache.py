@@ -0,0 +1,75 @@
+"""
+Cache of the template fragments showing the details of an event, the same for all
+the users.
+
+    {% load oneevent_cache %}
+    {% event_fragment "name" event %} ... {% endevent_fragment %}
+
+The fragments are keyed by the ID and content version of the event (see
+versions.py), and by the active language and timezone, so a change to the event
+never serves a stale fragment. They are stored in the "template_fragments" cache if
+defined, like the fragments of the cache tag of Django, or in the default cache.
+The cache is disabled when ONEEVENT_FRAGMENT_CACHE_TIMEOUT is None.
+"""
+from django import template
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.utils import timezone, translation
+
+register = template.Library()
+
+
+def _get_cache():
+    try:
+        return caches["template_fragments"]
+    except InvalidCacheBackendError:
+        return caches["default"]
+
+
+class EventFragmentNode(template.Node):
+    def __init__(self, nodelist, fragment_name, event):
+        self.nodelist = nodelist
+        self.fragment_name = fragment_name
+        self.event = event
+
+    def render(self, context):
+        timeout = settings.ONEEVENT_FRAGMENT_CACHE_TIMEOUT
+        if timeout is None:
+            return self.nodelist.render(context)
+
+        event = self.event.resolve(context)
+        fragment_name = self.fragment_name.resolve(context)
+        key = make_template_fragment_key(
+            "oneevent." + fragment_name,
+            [
+                event.id,
+                event.content_version,
+                translation.get_language(),
+                timezone.get_current_timezone_name(),
+            ],
+        )
+        fragment_cache = _get_cache()
+        value = fragment_cache.get(key)
+        if value is None:
+            value = self.nodelist.render(context)
+            fragment_cache.set(key, value, timeout)
+        return value
+
+
+@register.tag
+def event_fragment(parser, token):
+    """
+    Cache a fragment of template showing the details of an event
+    Usage: {% event_fragment "name" event %} ... {% endevent_fragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 3:
+        raise template.TemplateSyntaxError(
+            "'{0}' tag requires a fragment name and an event".format(bits[0])
+        )
+    nodelist = parser.parse(("endevent_fragment",))
+    parser.delete_first_token()
+    return EventFragmentNode(
+        nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2])
+    )
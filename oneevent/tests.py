@@ -1,12 +1,63 @@
-from django.test import TestCase
-from .models import Event, Category, Choice, Option, Booking, BookingOption
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .models import (
+    ArchivedBooking,
+    Event,
+    EventSeries,
+    Category,
+    Choice,
+    Option,
+    Booking,
+    BookingOption,
+    BookingLogEntry,
+    BookingTombstone,
+    IdempotencyKey,
+    OutboxMessage,
+)
+from . import (
+    archive,
+    audit,
+    bookings_table,
+    bulk,
+    changes,
+    cloning,
+    db_routing,
+    deletion,
+    export,
+    importing,
+    invites,
+    metrics,
+    outbox,
+    page_cache,
+    series,
+    unicode_csv,
+    waiting_room,
+)
+from django.db import connection
+from django.db.models.query import QuerySet
+from django.db.models.signals import post_save
 from django.db.utils import IntegrityError
+from django.http.response import FileResponse
 from django.core.exceptions import ValidationError
-from django.utils import timezone
-from datetime import timedelta
+from django.utils import timezone, translation
+from datetime import datetime, timedelta
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from decimal import Decimal
+import gzip
+import io
+import json
+import os
+import pytz
+import re
+import tempfile
 
 
 def default_user():
@@ -116,6 +167,26 @@ class CategoryTest(TestCase):
         self.g2b = Group.objects.create(name="group2B")
         self.g2c = Group.objects.create(name="group2C")
 
+    def test_members_match(self):
+        users = []
+        for groups in ([], [self.g1a], [self.g2a], [self.g1a, self.g2a], [self.g1b]):
+            user = get_user_model().objects.create(username="u{0}".format(len(users)))
+            user.groups.set(groups)
+            users.append(user)
+        for groups1, groups2 in (
+            ([], []),
+            ([self.g1a], []),
+            ([], [self.g2a]),
+            ([self.g1a], [self.g2a]),
+            ([self.g1a, self.g1b], [self.g2a]),
+        ):
+            cat = Category.objects.create(event=self.ev, order=1, name="category")
+            cat.groups1.set(groups1)
+            cat.groups2.set(groups2)
+            members = {u for u in users if cat.match(u.groups.all())}
+            self.assertEqual(set(cat.get_members()) & set(users), members)
+            cat.delete()
+
     def test_match_1GroupInGroup1(self):
         cat = Category.objects.create(event=self.ev, order=1, name="category1")
         cat.groups1.add(self.g1a)
@@ -370,3 +441,2283 @@ class ParticipantChoiceTest(TestCase):
         opt2 = Option.objects.create(choice=self.choice, title="option 2")
         pchoice2 = BookingOption.objects.create(booking=self.booking, option=opt2)
         self.assertRaises(ValidationError, pchoice2.clean)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.counter = metrics.Counter("test_total", "A test counter", ["kind"])
+        self.histogram = metrics.Histogram(
+            "test_seconds", "A test histogram", buckets=(0.1, 1.0)
+        )
+
+    def test_counter_renders_values_per_label(self):
+        self.counter.inc(kind="a")
+        self.counter.inc(2, kind="b")
+        self.counter.inc(kind="a")
+
+        self.assertEqual(
+            self.counter.render(),
+            "# HELP test_total A test counter\n"
+            "# TYPE test_total counter\n"
+            'test_total{kind="a"} 2.0\n'
+            'test_total{kind="b"} 2.0',
+        )
+
+    def test_counter_rejects_wrong_labels(self):
+        self.assertRaises(ValueError, self.counter.inc, other="a")
+
+    def test_histogram_renders_cumulative_buckets(self):
+        self.histogram.observe(0.05)
+        self.histogram.observe(0.5)
+        self.histogram.observe(5)
+
+        lines = self.histogram.render().split("\n")
+        self.assertEqual(lines[1], "# TYPE test_seconds histogram")
+        self.assertEqual(
+            lines[2:],
+            [
+                'test_seconds_bucket{le="0.1"} 1.0',
+                'test_seconds_bucket{le="1.0"} 2.0',
+                'test_seconds_bucket{le="+Inf"} 3.0',
+                "test_seconds_sum 5.55",
+                "test_seconds_count 3.0",
+            ],
+        )
+
+    def test_timed_observes_each_call(self):
+        @metrics.timed(self.histogram)
+        def func():
+            return 42
+
+        self.assertEqual(func(), 42)
+        self.assertEqual(func(), 42)
+        self.assertEqual(self.histogram.get_count(), 2)
+
+    def test_users_cache_build_is_timed(self):
+        event = Event.objects.create(
+            title="myEvent", start=timezone.now(), owner=default_user()
+        )
+        before = metrics.USERS_CACHE_BUILD_DURATION.get_count()
+        event.user_is_organiser(default_user())
+        event.user_is_organiser(default_user())
+        after = metrics.USERS_CACHE_BUILD_DURATION.get_count()
+        self.assertEqual(after - before, 1)
+
+    def test_view_disabled_by_default(self):
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(ONEEVENT_METRICS_ENABLED=True)
+    def test_view_exposes_metrics(self):
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        content = response.content.decode()
+        self.assertIn("# TYPE oneevent_bookings_created_total counter", content)
+        self.assertIn("# TYPE oneevent_users_cache_build_seconds histogram", content)
+
+
+@override_settings(ONEEVENT_CALENDAR_INVITE_FROM="no-reply@example.com")
+class OutboxTest(TestCase):
+    def setUp(self):
+        self.ev = Event.objects.create(
+            title="myEvent", start=timezone.now(), owner=default_user()
+        )
+        self.user = get_user_model().objects.create(
+            username="myUser", email="me@example.com"
+        )
+        self.booking = Booking.objects.create(event=self.ev, person=self.user)
+
+    def test_enqueue_does_not_duplicate_pending_messages(self):
+        message1 = self.booking.enqueue_calendar_invite()
+        message2 = self.booking.enqueue_calendar_invite()
+
+        self.assertEqual(message1, message2)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_view_enqueues_without_sending(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("booking_send_invite", args=[self.booking.id]))
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.booking, self.booking)
+        self.assertEqual(message.status, OutboxMessage.STATUS_PENDING)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_messages_claimed_by_a_single_worker(self):
+        message = self.booking.enqueue_calendar_invite()
+        now = timezone.now() + timedelta(seconds=1)
+        values_list = QuerySet.values_list
+        selections = []
+
+        def race(queryset, *args, **kwargs):
+            selected = list(values_list(queryset, *args, **kwargs))
+            selections.append(selected)
+            if len(selections) == 1:
+                # Another worker claims the same messages meanwhile
+                self.assertEqual(len(outbox.claim_batch(10, 60, now=now)), 1)
+            return selected
+
+        patch = mock.patch.object
+        with patch(connection.features, "has_select_for_update_skip_locked", False):
+            with patch(QuerySet, "values_list", autospec=True, side_effect=race):
+                claimed = outbox.claim_batch(10, 60, now=now)
+        self.assertEqual(claimed, [])
+        message.refresh_from_db()
+        self.assertGreater(message.next_attempt_at, now)
+
+    def test_drain_sends_pending_messages(self):
+        user2 = get_user_model().objects.create(username="user2", email="2@a.com")
+        booking2 = Booking.objects.create(event=self.ev, person=user2)
+        self.booking.enqueue_calendar_invite()
+        booking2.enqueue_calendar_invite()
+
+        totals = outbox.drain(concurrency=2)
+
+        self.assertEqual(totals, {"sent": 2, "retried": 0, "failed": 0})
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            sorted(m.to[0] for m in mail.outbox), ["2@a.com", "me@example.com"]
+        )
+        for message in OutboxMessage.objects.all():
+            self.assertEqual(message.status, OutboxMessage.STATUS_SENT)
+            self.assertEqual(message.attempts, 1)
+            self.assertIsNotNone(message.sent_at)
+
+    def test_failures_are_retried_with_backoff_then_failed(self):
+        message = self.booking.enqueue_calendar_invite()
+
+        with mock.patch.object(
+            Booking, "send_calendar_invite", side_effect=IOError("relay down")
+        ):
+            stats = outbox.process_batch(max_attempts=2, backoff_seconds=60)
+            self.assertEqual(stats, {"sent": 0, "retried": 1, "failed": 0})
+            message.refresh_from_db()
+            self.assertEqual(message.attempts, 1)
+            self.assertIn("relay down", message.last_error)
+            self.assertGreater(
+                message.next_attempt_at, timezone.now() + timedelta(seconds=50)
+            )
+
+            # Not due yet
+            stats = outbox.process_batch(max_attempts=2)
+            self.assertEqual(stats, {"sent": 0, "retried": 0, "failed": 0})
+
+            OutboxMessage.objects.update(next_attempt_at=timezone.now())
+            stats = outbox.process_batch(max_attempts=2)
+            self.assertEqual(stats, {"sent": 0, "retried": 0, "failed": 1})
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.STATUS_FAILED)
+        self.assertEqual(message.attempts, 2)
+
+    def test_worker_command(self):
+        self.booking.enqueue_calendar_invite()
+
+        call_command("oneevent_outbox_worker", "--once", stdout=io.StringIO())
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, "Invitation to myEvent")
+
+
+@override_settings(ONEEVENT_CALENDAR_INVITE_FROM="no-reply@example.com")
+class RenderInvitesTest(TestCase):
+    def setUp(self):
+        self.ev = Event.objects.create(
+            title="myEvent", start=timezone.now(), owner=default_user()
+        )
+        choice = Choice.objects.create(event=self.ev, title="choice 1")
+        option = Option.objects.create(choice=choice, title="option 1", default=True)
+        for i in range(5):
+            user = get_user_model().objects.create(
+                username="user{0}".format(i), email="user{0}@example.com".format(i)
+            )
+            booking = Booking.objects.create(event=self.ev, person=user)
+            booking.options.create(option=option)
+
+    def test_render_keeps_order_of_bookings(self):
+        bookings = Booking.objects.filter(event=self.ev).order_by("-id")
+        expected = [[b.person.email] for b in bookings]
+
+        rendered = invites.render_invites(bookings, max_workers=3)
+
+        self.assertEqual([m.to for m in rendered], expected)
+        html_part = rendered[0].attachments[0]
+        self.assertIn(b"option 1", html_part.get_payload(decode=True))
+
+    def test_render_prefetched_bookings_runs_no_query(self):
+        bookings = invites.prefetch_for_invites(Booking.objects.all())
+
+        with self.assertNumQueries(0):
+            rendered = invites.render_invites(bookings, max_workers=2)
+
+        self.assertEqual(len(rendered), 5)
+
+
+class OptionsExportTest(TestCase):
+    def setUp(self):
+        self.ev = Event.objects.create(
+            title="myEvent", start=timezone.now(), owner=default_user()
+        )
+        self.choice1 = Choice.objects.create(event=self.ev, title="Meal")
+        self.meat = Option.objects.create(choice=self.choice1, title="Meat")
+        self.veg = Option.objects.create(
+            choice=self.choice1, title="Végétarien", default=True
+        )
+        self.choice2 = Choice.objects.create(event=self.ev, title="Drink")
+        self.wine = Option.objects.create(
+            choice=self.choice2, title="Wine", default=True
+        )
+
+        for i, option in enumerate([self.veg, self.veg, self.meat]):
+            user = get_user_model().objects.create(username="user{0}".format(i))
+            booking = Booking.objects.create(event=self.ev, person=user)
+            booking.options.create(option=option)
+        self.cancelled = Booking.objects.create(
+            event=self.ev,
+            person=get_user_model().objects.create(username="cancelled"),
+            cancelledOn=timezone.now(),
+        )
+        self.cancelled.options.create(option=self.meat)
+        self.cancelled.options.create(option=self.wine)
+
+        self.client.force_login(default_user())
+
+    def test_options_totals_include_unselected_options(self):
+        with self.assertNumQueries(1):
+            totals = list(self.ev.get_options_totals())
+
+        self.assertEqual(
+            totals,
+            [
+                ("Meal", "Meat", 1, False),
+                ("Meal", "Végétarien", 2, True),
+                ("Drink", "Wine", 0, True),
+            ],
+        )
+
+    def test_download_options_totals_streams_long_format(self):
+        response = self.client.get(
+            reverse("event_download_options_totals", args=[self.ev.id])
+        )
+
+        self.assertTrue(response.streaming)
+        # Streamed without a temporary file while the exports cache is disabled
+        self.assertNotIsInstance(response, FileResponse)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        content = b"".join(response.streaming_content).decode("utf-8")
+        self.assertEqual(
+            content.splitlines(),
+            [
+                "Choice,Option,Count,Default",
+                "Meal,Meat,1,No",
+                "Meal,Végétarien,2,Yes",
+                "Drink,Wine,0,Yes",
+            ],
+        )
+
+    def test_download_options_summary(self):
+        response = self.client.get(
+            reverse("event_download_options_summary", args=[self.ev.id])
+        )
+
+        self.assertEqual(
+            response.getvalue().decode("utf-8").splitlines(),
+            ["Choice,Options", "Meal,Meat,1,Végétarien,2"],
+        )
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.old_ev = Event.objects.create(
+            title="Old event",
+            start=now - timedelta(days=20),
+            end=now - timedelta(days=19),
+            owner=default_user(),
+        )
+        self.ev = Event.objects.create(
+            title="myEvent", start=now, owner=default_user(), timezone="Europe/Paris"
+        )
+        self.ev.categories.create(order=1, name="category1", price=Decimal("12.5"))
+        self.ev.sessions.create(title="session1", start=now)
+        choice = self.ev.choices.create(title="choice1")
+        option = choice.options.create(title="option1", default=True)
+        self.user = get_user_model().objects.create(username="myUser")
+        booking = self.ev.bookings.create(person=self.user)
+        booking.options.create(option=option)
+        self.old_ev.bookings.create(person=self.user)
+
+    def test_records_of_all_types(self):
+        records = list(export.iter_records(chunk_size=1))
+
+        self.assertEqual(
+            [r["type"] for r in records],
+            [
+                "event",
+                "event",
+                "category",
+                "session",
+                "choice",
+                "option",
+                "booking",
+                "booking",
+                "booking_option",
+            ],
+        )
+
+    def test_json_lines_are_valid_json(self):
+        lines = list(export.iter_json_lines())
+        event = json.loads(lines[1])
+
+        self.assertEqual(event["title"], "myEvent")
+        self.assertEqual(event["timezone"], "Europe/Paris")
+        category = json.loads(lines[2])
+        self.assertEqual(category["price"], "12.50")
+
+    def test_since_filters_old_events(self):
+        since = timezone.now() - timedelta(days=1)
+        records = list(export.iter_records(since=since))
+
+        events = [r for r in records if r["type"] == "event"]
+        self.assertEqual([e["id"] for e in events], [self.ev.id])
+        bookings = [r for r in records if r["type"] == "booking"]
+        self.assertEqual([b["event_id"] for b in bookings], [self.ev.id])
+
+    def test_parse_since(self):
+        self.assertIsNone(export.parse_since(""))
+        since = export.parse_since("2020-05-04")
+        self.assertEqual(since.date().isoformat(), "2020-05-04")
+        self.assertRaises(ValueError, export.parse_since, "yesterday")
+
+    def test_command_writes_gzip_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "export.jsonl.gz")
+            call_command("oneevent_export", "--gzip", "--output", path)
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                lines = f.readlines()
+
+        self.assertEqual(len(lines), 9)
+
+    def test_view_is_reserved_to_superusers(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("export_json_lines"))
+        self.assertRedirects(response, reverse("index"), fetch_redirect_response=False)
+
+    def test_view_streams_gzip_export(self):
+        admin = get_user_model().objects.create(username="admin", is_superuser=True)
+        self.client.force_login(admin)
+
+        response = self.client.get(
+            reverse("export_json_lines"), {"gzip": "1", "since": "2000-01-01"}
+        )
+
+        self.assertTrue(response.streaming)
+        content = gzip.decompress(b"".join(response.streaming_content))
+        self.assertEqual(len(content.decode("utf-8").splitlines()), 9)
+
+
+class ChangesTest(TestCase):
+    def setUp(self):
+        self.ev = Event.objects.create(
+            title="myEvent", start=timezone.now(), owner=default_user()
+        )
+        choice = self.ev.choices.create(title="choice1")
+        self.option = choice.options.create(title="option1", default=True)
+        self.bookings = [
+            self.ev.bookings.create(
+                person=get_user_model().objects.create(username="user{0}".format(i))
+            )
+            for i in range(3)
+        ]
+
+    def test_option_change_touches_booking(self):
+        booking = self.bookings[0]
+        before = Booking.objects.get(id=booking.id).updated_at
+
+        booking.options.create(option=self.option)
+
+        self.assertGreater(Booking.objects.get(id=booking.id).updated_at, before)
+
+    def test_pages_through_changed_bookings(self):
+        page = changes.get_changes(self.ev, limit=2)
+        self.assertEqual(
+            [b["id"] for b in page["bookings"]], [b.id for b in self.bookings[:2]]
+        )
+        self.assertTrue(page["more"])
+
+        page = changes.get_changes(self.ev, page["next_cursor"], limit=2)
+        self.assertEqual([b["id"] for b in page["bookings"]], [self.bookings[2].id])
+        self.assertFalse(page["more"])
+
+        cursor = page["next_cursor"]
+        self.assertEqual(changes.get_changes(self.ev, cursor)["bookings"], [])
+
+        self.bookings[0].options.create(option=self.option)
+        page = changes.get_changes(self.ev, cursor)
+        self.assertEqual([b["id"] for b in page["bookings"]], [self.bookings[0].id])
+        self.assertEqual(page["bookings"][0]["options"][0]["option_id"], self.option.id)
+
+    def test_deletions_leave_tombstones(self):
+        booking_option = self.bookings[0].options.create(option=self.option)
+        cursor = changes.get_changes(self.ev)["next_cursor"]
+        deleted_ids = [
+            (self.bookings[0].id, booking_option.id),
+            (self.bookings[1].id, None),
+        ]
+
+        booking_option.delete()
+        self.bookings[1].delete()
+
+        page = changes.get_changes(self.ev, cursor)
+        self.assertEqual(
+            [(d["booking_id"], d["booking_option_id"]) for d in page["deleted"]],
+            deleted_ids,
+        )
+        self.assertEqual([b["id"] for b in page["bookings"]], [self.bookings[0].id])
+
+    def test_deleted_booking_records_its_options(self):
+        self.bookings[0].options.create(option=self.option)
+
+        self.bookings[0].delete()
+
+        self.assertEqual(
+            list(BookingTombstone.objects.values_list("option_id", flat=True)),
+            [self.option.id, None],
+        )
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            changes.get_changes(self.ev, "not a cursor")
+
+    def test_view_is_reserved_to_organisers(self):
+        self.client.force_login(self.bookings[0].person)
+        url = reverse("event_bookings_changes", kwargs={"event_id": self.ev.id})
+
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_view_returns_json_page(self):
+        self.client.force_login(default_user())
+        url = reverse("event_bookings_changes", kwargs={"event_id": self.ev.id})
+
+        response = self.client.get(url, {"limit": 1})
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        self.assertEqual(len(page["bookings"]), 1)
+        self.assertTrue(page["more"])
+
+        response = self.client.get(url, {"cursor": "bad"})
+        self.assertEqual(response.status_code, 400)
+
+
+class AuditTest(TestCase):
+    def setUp(self):
+        self.ev = Event.objects.create(
+            title="myEvent",
+            start=timezone.now() + timedelta(days=1),
+            owner=default_user(),
+            pub_status="PUB",
+        )
+        self.user = get_user_model().objects.create(username="myUser")
+
+    def test_log_without_buffer_saves_immediately(self):
+        booking = self.ev.bookings.create(person=self.user)
+
+        audit.log(booking, BookingLogEntry.ACTION_CREATE, self.user)
+
+        entry = BookingLogEntry.objects.get()
+        self.assertEqual(entry.booking_id, booking.id)
+        self.assertEqual(entry.event, self.ev)
+        self.assertEqual(entry.actor, self.user)
+
+    def test_buffer_is_flushed_in_one_query(self):
+        booking = self.ev.bookings.create(person=self.user)
+
+        with self.assertNumQueries(1):
+            with audit.buffered():
+                audit.log(booking, BookingLogEntry.ACTION_CREATE, self.user)
+                with audit.buffered():
+                    audit.log(booking, BookingLogEntry.ACTION_CONFIRM, self.user)
+
+        self.assertEqual(
+            list(BookingLogEntry.objects.values_list("action", flat=True)),
+            [BookingLogEntry.ACTION_CREATE, BookingLogEntry.ACTION_CONFIRM],
+        )
+
+    def test_buffer_is_discarded_on_error(self):
+        booking = self.ev.bookings.create(person=self.user)
+
+        with self.assertRaises(RuntimeError):
+            with audit.buffered():
+                audit.log(booking, BookingLogEntry.ACTION_CREATE, self.user)
+                raise RuntimeError()
+
+        self.assertFalse(BookingLogEntry.objects.exists())
+
+    def test_views_log_booking_lifecycle(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("booking_create", kwargs={"event_id": self.ev.id}))
+        booking = Booking.objects.get(event=self.ev, person=self.user)
+        update_url = reverse("booking_update", kwargs={"booking_id": booking.id})
+        self.client.post(update_url, {"save": "Save"})
+        cancel_url = reverse("booking_cancel", kwargs={"booking_id": booking.id})
+        self.client.post(cancel_url)
+
+        entries = BookingLogEntry.objects.filter(booking_id=booking.id)
+        self.assertEqual(
+            list(entries.values_list("action", flat=True)),
+            [
+                BookingLogEntry.ACTION_CREATE,
+                BookingLogEntry.ACTION_CONFIRM,
+                BookingLogEntry.ACTION_CANCEL,
+            ],
+        )
+
+    def test_booking_rate_fills_minutes_without_bookings(self):
+        booking = self.ev.bookings.create(person=self.user)
+        start = timezone.now().replace(second=0, microsecond=0)
+        for minutes in (0, 0, 2):
+            entry = audit.log(booking, BookingLogEntry.ACTION_CONFIRM)
+            entry.created_at = start + timedelta(minutes=minutes, seconds=30)
+            entry.save()
+        audit.log(booking, BookingLogEntry.ACTION_CANCEL)
+
+        series = audit.booking_rate(self.ev)
+
+        self.assertEqual(
+            series,
+            [
+                (start, 2),
+                (start + timedelta(minutes=1), 0),
+                (start + timedelta(minutes=2), 1),
+            ],
+        )
+
+    def test_booking_rate_is_bounded(self):
+        booking = self.ev.bookings.create(person=self.user)
+        start = timezone.now().replace(second=0, microsecond=0)
+        for minutes in (0, 60 * 24 * 90, 60 * 24 * 90 + 2):
+            entry = audit.log(booking, BookingLogEntry.ACTION_CONFIRM)
+            entry.created_at = start + timedelta(minutes=minutes, seconds=30)
+            entry.save()
+        last = start + timedelta(minutes=60 * 24 * 90 + 2)
+
+        with mock.patch.object(audit, "MAX_RATE_MINUTES", 3):
+            series = audit.booking_rate(self.ev)
+            self.assertEqual(
+                series,
+                [
+                    (last - timedelta(minutes=2), 1),
+                    (last - timedelta(minutes=1), 0),
+                    (last, 1),
+                ],
+            )
+            series = audit.booking_rate(self.ev, start=start)
+            self.assertEqual(len(series), 3)
+
+    def test_rate_view(self):
+        self.client.force_login(default_user())
+        url = reverse("event_booking_rate", kwargs={"event_id": self.ev.id})
+
+        response = self.client.get(url)
+        self.assertEqual(response.json(), {"action": "CONFIRM", "series": []})
+        response = self.client.get(url, {"action": "BAD"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ArchiveTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.ev = Event.objects.create(
+            title="Old event",
+            start=now - timedelta(days=20),
+            end=now - timedelta(days=19),
+            owner=default_user(),
+            pub_status="PUB",
+        )
+        choice = self.ev.choices.create(title="choice1")
+        self.option = choice.options.create(title="option1", default=True)
+        self.bookings = []
+        for i in range(5):
+            booking = self.ev.bookings.create(
+                person=get_user_model().objects.create(username="user{0}".format(i))
+            )
+            booking.options.create(option=self.option)
+            self.bookings.append(booking)
+        self.bookings[0].cancelledOn = now
+        self.bookings[0].save()
+        self.live_ev = Event.objects.create(
+            title="Live event", start=now, owner=default_user()
+        )
+
+    def test_archivable_events(self):
+        events = archive.archivable_events(timezone.now() - timedelta(days=10))
+        self.assertEqual(list(events), [self.ev])
+
+    def test_bookings_are_moved_in_batches(self):
+        progress = []
+
+        moved = archive.archive_event(self.ev, batch_size=2, progress=progress.append)
+
+        self.assertEqual(moved, 5)
+        self.assertEqual(progress, [2, 4, 5])
+        self.assertFalse(Booking.objects.exists())
+        self.assertFalse(BookingOption.objects.exists())
+        self.assertFalse(BookingTombstone.objects.exists())
+        self.assertEqual(
+            list(ArchivedBooking.objects.values_list("id", flat=True)),
+            [b.id for b in self.bookings],
+        )
+        ev = Event.objects.get(id=self.ev.id)
+        self.assertTrue(ev.is_archived())
+        self.assertEqual(ev.pub_status, "ARCH")
+
+    def test_archived_bookings_are_read_transparently(self):
+        archive.archive_event(self.ev)
+        ev = Event.objects.get(id=self.ev.id)
+
+        self.assertEqual(ev.get_bookings().count(), 5)
+        self.assertEqual(ev.get_active_bookings().count(), 4)
+        self.assertEqual(ev.get_cancelled_bookings().count(), 1)
+        self.assertEqual(
+            list(ev.get_options_totals()), [("choice1", "option1", 4, True)]
+        )
+        self.assertEqual(ev.get_options_counts()[self.option.choice], {self.option: 4})
+        booking = ev.get_active_bookings().get(person__username="user1")
+        self.assertEqual(booking.get_payment_status_class(), "success")
+        self.assertFalse(booking.user_can_cancel(booking.person))
+
+    def test_participants_list_reads_archive(self):
+        archive.archive_event(self.ev)
+        self.client.force_login(default_user())
+
+        response = self.client.get(
+            reverse("event_download_participants_list", kwargs={"event_id": self.ev.id})
+        )
+
+        self.assertEqual(len(response.getvalue().decode("utf-8").splitlines()), 6)
+
+    def test_export_includes_archived_bookings(self):
+        archive.archive_event(self.ev)
+
+        records = list(export.iter_records())
+
+        self.assertEqual(len([r for r in records if r["type"] == "booking"]), 5)
+        self.assertEqual(len([r for r in records if r["type"] == "booking_option"]), 5)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command(
+            "oneevent_archive",
+            "--ended-before",
+            (timezone.now() - timedelta(days=10)).date().isoformat(),
+            stdout=out,
+        )
+
+        self.assertIn("Archived Old event (5 bookings)", out.getvalue())
+        self.assertFalse(Event.objects.get(id=self.live_ev.id).is_archived())
+
+
+class DeletionTest(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.organiser = get_user_model().objects.create(username="organiser")
+        self.user = get_user_model().objects.create(username="myUser")
+        self.other = get_user_model().objects.create(username="other")
+        self.owned = Event.objects.create(title="Owned", start=now, owner=self.user)
+        self.ev = Event.objects.create(title="myEvent", start=now, owner=self.organiser)
+        option = self.ev.choices.create(title="choice1").options.create(
+            title="option1", default=True
+        )
+        for person in (self.user, self.other):
+            self.ev.bookings.create(person=person).options.create(option=option)
+            self.owned.bookings.create(person=person)
+        other_booking = self.ev.bookings.get(person=self.other)
+        other_booking.paidTo = self.user
+        other_booking.datePaid = now
+        other_booking.save()
+
+    def test_delete_user_in_batches(self):
+        steps = []
+
+        stats = deletion.delete_user(
+            self.user, batch_size=1, progress=lambda *args: steps.append(args)
+        )
+
+        self.assertFalse(get_user_model().objects.filter(id=self.user.id).exists())
+        self.assertFalse(Event.objects.filter(id=self.owned.id).exists())
+        self.assertEqual(stats["bookings"], 3)
+        self.assertEqual(stats["payments"], 1)
+        self.assertEqual(stats["events"], 1)
+        self.assertIn(("bookings", 2), steps)
+        self.assertEqual(
+            list(Booking.objects.values_list("person__username", flat=True)),
+            ["other"],
+        )
+        self.assertIsNone(Booking.objects.get().paidTo)
+
+    @override_settings(ONEEVENT_PAGE_CACHE_TIMEOUT=60)
+    def test_deleted_events_leave_the_caches(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.owned.pub_status = "PUB"
+        self.owned.save()
+        self.assertContains(self.client.get(reverse("events_list_all")), "Owned")
+        path = os.path.join(
+            directory.name, "{0}-participants_list-1.csv".format(self.owned.id)
+        )
+        open(path, "w").close()
+
+        with override_settings(ONEEVENT_EXPORT_CACHE_DIR=directory.name):
+            deletion.delete_user(self.user)
+
+        self.assertNotContains(self.client.get(reverse("events_list_all")), "Owned")
+        self.assertFalse(os.path.exists(path))
+
+    def test_deleted_bookings_leave_tombstones(self):
+        booking = self.ev.bookings.get(person=self.user)
+        booking_option_id = booking.options.get().id
+
+        deletion.delete_user(self.user)
+
+        self.assertEqual(
+            list(BookingTombstone.objects.values_list("event_id", "booking_option_id")),
+            [(self.ev.id, booking_option_id), (self.ev.id, None)],
+        )
+
+    def test_archived_bookings_are_deleted(self):
+        archive.archive_event(self.ev)
+
+        stats = deletion.delete_user(self.user)
+
+        self.assertEqual(stats["archived bookings"], 1)
+        self.assertEqual(stats["archived payments"], 1)
+        self.assertEqual(self.ev.archived_bookings.count(), 1)
+
+    def test_view_deletes_user(self):
+        self.client.force_login(self.user)
+
+        response = self.client.post(reverse("user_delete"))
+
+        self.assertRedirects(response, reverse("index"), fetch_redirect_response=False)
+        self.assertFalse(get_user_model().objects.filter(id=self.user.id).exists())
+
+    def test_command(self):
+        out = io.StringIO()
+        err = io.StringIO()
+
+        call_command(
+            "oneevent_delete_users", "myUser", "nobody", stdout=out, stderr=err
+        )
+
+        self.assertIn("Deleted myUser: 3 bookings", out.getvalue())
+        self.assertIn("Unknown user: nobody", err.getvalue())
+        self.assertFalse(get_user_model().objects.filter(id=self.user.id).exists())
+
+
+class CloningTest(TestCase):
+    def setUp(self):
+        self.tz = pytz.timezone("Europe/Paris")
+        self.ev = Event.objects.create(
+            title="Party 2020",
+            start=self.tz.localize(datetime(2020, 3, 20, 18, 0)),
+            end=self.tz.localize(datetime(2020, 3, 20, 23, 0)),
+            booking_close=self.tz.localize(datetime(2020, 3, 13, 12, 0)),
+            timezone=self.tz,
+            owner=default_user(),
+            pub_status="PUB",
+        )
+        self.organiser = get_user_model().objects.create(username="organiser")
+        self.ev.organisers.add(self.organiser)
+        group = Group.objects.create(name="group1")
+        for order in range(3):
+            category = self.ev.categories.create(
+                order=order, name="cat{0}".format(order), price=order
+            )
+            category.groups1.add(group)
+            category.groups2.add(group)
+            self.ev.sessions.create(
+                title="session{0}".format(order),
+                start=self.tz.localize(datetime(2020, 3, 20, 18 + order, 0)),
+            )
+            choice = self.ev.choices.create(title="choice{0}".format(order))
+            for number in range(3):
+                choice.options.create(
+                    title="option{0}".format(number), default=number == 0
+                )
+        self.ev.bookings.create(person=self.organiser)
+
+    def test_clone_copies_configuration(self):
+        start = self.tz.localize(datetime(2021, 4, 2, 18, 0))
+
+        clone = cloning.clone_event(self.ev, "Party 2021", start)
+
+        clone = Event.objects.get(id=clone.id)
+        self.assertEqual(clone.pub_status, "UNPUB")
+        self.assertEqual(clone.owner, self.ev.owner)
+        self.assertEqual(list(clone.organisers.all()), [self.organiser])
+        self.assertFalse(clone.bookings.exists())
+        self.assertEqual(
+            list(clone.categories.values_list("name", "price")),
+            list(self.ev.categories.values_list("name", "price")),
+        )
+        self.assertTrue(all(c.groups1.exists() for c in clone.categories.all()))
+        self.assertTrue(all(c.groups2.exists() for c in clone.categories.all()))
+        self.assertEqual(
+            Option.objects.filter(choice__event=clone, default=True).count(), 3
+        )
+        self.assertEqual(Option.objects.filter(choice__event=clone).count(), 9)
+
+    def test_dates_keep_local_time_across_dst(self):
+        # The source is before the DST change and the clone after it
+        start = self.tz.localize(datetime(2021, 4, 2, 18, 0))
+
+        clone = cloning.clone_event(self.ev, "Party 2021", start)
+
+        local = Event.objects.get(id=clone.id)
+        self.assertEqual(local.end.astimezone(self.tz).hour, 23)
+        self.assertEqual(
+            local.booking_close.astimezone(self.tz),
+            self.tz.localize(datetime(2021, 3, 26, 12, 0)),
+        )
+        session = local.sessions.get(title="session2")
+        self.assertEqual(
+            session.start.astimezone(self.tz),
+            self.tz.localize(datetime(2021, 4, 2, 20, 0)),
+        )
+
+    def test_constant_number_of_queries(self):
+        start = self.tz.localize(datetime(2021, 4, 2, 18, 0))
+        with self.assertNumQueries(20):
+            cloning.clone_events(
+                self.ev, [("Party {0}".format(i), start) for i in range(5)]
+            )
+
+    def test_view(self):
+        self.client.force_login(self.organiser)
+        url = reverse("event_clone", kwargs={"event_id": self.ev.id})
+
+        response = self.client.post(
+            url,
+            {"title": "Party 2020", "start_0": "2021-04-02", "start_1": "18:00"},
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(
+            url,
+            {"title": "Party 2021", "start_0": "2021-04-02", "start_1": "18:00"},
+        )
+        clone = Event.objects.get(title="Party 2021")
+        self.assertRedirects(
+            response,
+            reverse("event_update", kwargs={"event_id": clone.id}),
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(clone.owner, self.organiser)
+        self.assertEqual(clone.start, self.tz.localize(datetime(2021, 4, 2, 18, 0)))
+
+
+class EventSeriesTest(TestCase):
+    def setUp(self):
+        self.tz = pytz.timezone("Europe/Paris")
+        self.prototype = Event.objects.create(
+            title="Yoga",
+            start=self.tz.localize(datetime(2021, 3, 15, 18, 0)),
+            timezone=self.tz,
+            owner=default_user(),
+            pub_status="PUB",
+        )
+        self.prototype.choices.create(title="mat").options.create(title="yes")
+        self.series = EventSeries.objects.create(
+            title="Yoga",
+            prototype=self.prototype,
+            frequency=EventSeries.FREQ_WEEKLY,
+            count=10,
+        )
+
+    def test_weekly_occurrences_keep_local_time_across_dst(self):
+        # DST starts on 28 March 2021 in Europe/Paris
+        starts = [self.series.get_occurrence_start(i) for i in range(3)]
+
+        self.assertEqual([s.hour for s in starts], [18, 18, 18])
+        self.assertEqual(starts[2] - starts[1], timedelta(days=7, hours=-1))
+
+    def test_keep_utc_time(self):
+        self.series.dstmode = "keep"
+
+        start = self.series.get_occurrence_start(2)
+
+        self.assertEqual(start.hour, 19)
+        self.assertEqual(start - self.prototype.start, timedelta(days=14))
+
+    def test_monthly_occurrences_on_short_months(self):
+        self.prototype.start = self.tz.localize(datetime(2021, 1, 31, 18, 0))
+        self.series.frequency = EventSeries.FREQ_MONTHLY
+
+        start = self.series.get_occurrence_start(1)
+
+        self.assertEqual((start.month, start.day, start.hour), (2, 28, 18))
+
+    def test_count_and_until_limit_occurrences(self):
+        self.series.count = 3
+        self.assertEqual(len(list(self.series.iter_occurrence_starts())), 2)
+
+        self.series.count = None
+        self.series.until = self.tz.localize(datetime(2021, 4, 1))
+        self.assertEqual(len(list(self.series.iter_occurrence_starts())), 2)
+
+    def test_expand_creates_next_occurrences_lazily(self):
+        events = series.expand(self.series, 3)
+
+        self.assertEqual(
+            [e.title for e in events],
+            ["Yoga 2021-03-22", "Yoga 2021-03-29", "Yoga 2021-04-05"],
+        )
+        self.assertEqual(self.series.occurrences.count(), 3)
+        self.assertTrue(all(e.pub_status == "PUB" for e in events))
+        self.assertEqual(Choice.objects.filter(event__series=self.series).count(), 3)
+
+        events = series.expand(self.series, 20)
+        self.assertEqual(len(events), 6)
+        self.assertEqual(series.expand(self.series, 1), [])
+
+    def test_expand_upcoming_skips_past_occurrences(self):
+        now = self.tz.localize(datetime(2021, 4, 1))
+        series.expand(self.series, 1)
+
+        events = series.expand_upcoming(self.series, 2, now)
+
+        self.assertEqual(
+            [e.title for e in events], ["Yoga 2021-04-05", "Yoga 2021-04-12"]
+        )
+        self.assertEqual(series.expand_upcoming(self.series, 2, now), [])
+
+    def test_command(self):
+        self.prototype.start = timezone.now() + timedelta(days=1)
+        self.prototype.save()
+        out = io.StringIO()
+
+        call_command("oneevent_expand_series", "--ahead", "2", stdout=out)
+
+        self.assertIn("Created 2 occurrence(s) of Yoga", out.getvalue())
+
+
+class AdminTest(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create(
+            username="admin", is_superuser=True, is_staff=True
+        )
+        self.client.force_login(self.admin)
+        self.event = Event.objects.create(
+            title="Gala", start=timezone.now(), owner=default_user(), pub_status="PUB"
+        )
+        for i in range(3):
+            user = get_user_model().objects.create(
+                username="user{0}".format(i), last_name="Name{0}".format(i)
+            )
+            Booking.objects.create(event=self.event, person=user)
+        Booking.objects.filter(person__username="user0").update(
+            cancelledOn=timezone.now(), cancelledBy=self.admin
+        )
+        Booking.objects.filter(person__username="user1").update(
+            exempt_of_payment=True
+        )
+
+    def changelist(self, params=None):
+        response = self.client.get(
+            reverse("admin:oneevent_booking_changelist"), params or {}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_booking_changelist_query_count_is_constant(self):
+        with self.assertNumQueries(7) as queries:
+            self.changelist()
+        for i in range(3, 10):
+            user = get_user_model().objects.create(username="user{0}".format(i))
+            Booking.objects.create(event=self.event, person=user)
+        with self.assertNumQueries(len(queries)):
+            self.changelist()
+
+    def test_booking_filters(self):
+        response = self.changelist({"cancelled": "yes"})
+        self.assertEqual(response.context["cl"].result_count, 1)
+        response = self.changelist({"cancelled": "no", "paid": "unpaid"})
+        self.assertEqual(response.context["cl"].result_count, 1)
+        response = self.changelist({"paid": "exempt"})
+        self.assertEqual(response.context["cl"].result_count, 1)
+
+    def test_booking_search_matches_prefixes(self):
+        response = self.changelist({"q": "user2"})
+        self.assertEqual(response.context["cl"].result_count, 1)
+        response = self.changelist({"q": "ser2"})
+        self.assertEqual(response.context["cl"].result_count, 0)
+
+    def test_event_changelist(self):
+        response = self.client.get(
+            reverse("admin:oneevent_event_changelist"), {"q": "Ga"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["cl"].result_count, 1)
+
+    def test_booking_change_page_query_count_is_constant(self):
+        booking = Booking.objects.get(person__username="user2")
+        choices = [self.event.choices.create(title="c{0}".format(i)) for i in range(2)]
+        for choice in choices:
+            booking.options.create(option=choice.options.create(title="o"))
+        url = reverse("admin:oneevent_booking_change", args=[booking.id])
+
+        self.client.get(url)  # Fill the content types cache
+        with self.assertNumQueries(10) as queries:
+            self.client.get(url)
+        for i in range(2, 6):
+            choice = self.event.choices.create(title="c{0}".format(i))
+            booking.options.create(option=choice.options.create(title="o"))
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(url)
+        self.assertContains(response, "<select", count=6 + 4)
+        for booking_option in booking.options.all():
+            self.assertContains(
+                response, 'value="{0}" selected>'.format(booking_option.option_id)
+            )
+
+
+class BulkUpdateTest(TestCase):
+    def setUp(self):
+        self.organiser = get_user_model().objects.create(username="orga")
+        self.group = Group.objects.create(name="members")
+        self.event = Event.objects.create(
+            title="Gala", start=timezone.now(), owner=self.organiser, pub_status="PUB"
+        )
+        self.event.categories.create(
+            order=1, name="members", price=10
+        ).groups1.add(self.group)
+        self.bookings = []
+        for i in range(4):
+            user = get_user_model().objects.create(username="user{0}".format(i))
+            user.groups.add(self.group)
+            self.bookings.append(
+                Booking.objects.create(
+                    event=self.event, person=user, confirmedOn=timezone.now()
+                )
+            )
+        self.ids = [b.id for b in self.bookings]
+
+    def test_pay_in_one_update(self):
+        Booking.objects.filter(id=self.ids[0]).update(paidTo=self.organiser)
+
+        with CaptureQueriesContext(connection) as queries:
+            summary = bulk.update_bookings(self.organiser, bulk.ACTION_PAY, self.ids)
+
+        updates = [
+            q for q in queries if q["sql"].startswith('UPDATE "oneevent_booking"')
+        ]
+        self.assertEqual(len(updates), 1)
+
+        self.assertEqual(summary["updated"], self.ids[1:])
+        self.assertEqual(summary["errors"], {self.ids[0]: "Payment already confirmed"})
+        self.assertEqual(
+            Booking.objects.filter(paidTo=self.organiser, datePaid__isnull=False)
+            .count(),
+            3,
+        )
+        self.assertEqual(
+            BookingLogEntry.objects.filter(action=BookingLogEntry.ACTION_PAY).count(),
+            3,
+        )
+
+    def test_pay_rejects_bookings_without_price(self):
+        self.bookings[0].person.groups.clear()
+        Booking.objects.filter(id=self.ids[1]).update(exempt_of_payment=True)
+        self.event.categories.update(price=0)
+
+        summary = bulk.update_bookings(self.organiser, bulk.ACTION_PAY, self.ids[:3])
+
+        # Without category the price is unknown, so payments are accepted
+        self.assertEqual(summary["updated"], [self.ids[0]])
+        self.assertIn("does not have to pay", summary["errors"][self.ids[2]])
+
+    def test_cancel_and_exempt(self):
+        summary = bulk.update_bookings(
+            self.organiser, bulk.ACTION_CANCEL, self.ids[:2] + [0]
+        )
+
+        self.assertEqual(summary["updated"], self.ids[:2])
+        self.assertEqual(summary["errors"], {0: "Booking not found"})
+        cancelled = Booking.objects.get(id=self.ids[0])
+        self.assertTrue(cancelled.is_cancelled())
+        self.assertIsNone(cancelled.confirmedOn)
+
+        summary = bulk.update_bookings(self.organiser, bulk.ACTION_EXEMPT, self.ids)
+        self.assertEqual(len(summary["updated"]), 4)
+        self.assertEqual(Booking.objects.filter(exempt_of_payment=True).count(), 4)
+
+    def test_permission_checked_per_event(self):
+        other = get_user_model().objects.create(username="other")
+
+        summary = bulk.update_bookings(other, bulk.ACTION_CANCEL, self.ids)
+
+        self.assertEqual(summary["updated"], [])
+        self.assertEqual(len(summary["errors"]), 4)
+        self.assertFalse(Booking.objects.filter(cancelledOn__isnull=False).exists())
+
+    def test_view(self):
+        url = reverse(
+            "event_bookings_bulk_update", args=[self.event.id, bulk.ACTION_CANCEL]
+        )
+        self.client.force_login(self.organiser)
+
+        response = self.client.post(url, {"booking": self.ids[:2]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"updated": self.ids[:2], "errors": {}})
+        response = self.client.post(url, {"booking": ["x"]})
+        self.assertEqual(response.status_code, 400)
+        self.client.force_login(self.bookings[0].person)
+        response = self.client.post(url, {"booking": self.ids})
+        self.assertEqual(response.status_code, 403)
+
+    def test_admin_action(self):
+        admin = get_user_model().objects.create(
+            username="admin", is_superuser=True, is_staff=True
+        )
+        self.client.force_login(admin)
+
+        response = self.client.post(
+            reverse("admin:oneevent_booking_changelist"),
+            {"action": "confirm_payments", "_selected_action": self.ids},
+        )
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Booking.objects.filter(paidTo=admin).count(), 4)
+
+
+class ImportTest(TestCase):
+    def setUp(self):
+        self.organiser = get_user_model().objects.create(username="orga")
+        self.event = Event.objects.create(
+            title="Gala",
+            start=timezone.now() + timedelta(days=1),
+            owner=self.organiser,
+            pub_status="PUB",
+            max_participant=4,
+        )
+        self.menu = self.event.choices.create(title="menu")
+        self.meat = self.menu.options.create(title="meat")
+        self.fish = self.menu.options.create(title="fish", default=True)
+        for i in range(5):
+            get_user_model().objects.create(
+                username="user{0}".format(i), email="user{0}@example.com".format(i)
+            )
+
+    def csv_file(self, *lines):
+        return io.BytesIO("\r\n".join(lines).encode("utf-8"))
+
+    def test_unicode_reader(self):
+        f = io.BytesIO('name,city\r\n"Zoë, Jr",Köln\r\n'.encode("latin-1"))
+
+        rows = list(unicode_csv.UnicodeReader(f, encoding="latin-1"))
+
+        self.assertEqual(rows, [["name", "city"], ["Zoë, Jr", "Köln"]])
+
+    def test_import(self):
+        Booking.objects.create(
+            event=self.event, person=get_user_model().objects.get(username="user0")
+        )
+        f = self.csv_file(
+            "username,menu",
+            "user0,",
+            "user1,meat",
+            "user2,",
+            "",
+            "unknown,",
+            "user2,",
+            "user3,pasta",
+        )
+
+        report = importing.import_bookings(self.event, f, self.organiser, batch_size=2)
+
+        self.assertEqual(report["rows"], 6)
+        self.assertEqual(report["created"], 2)
+        self.assertEqual(
+            report["errors"],
+            [
+                (2, "user0", "Already registered"),
+                (6, "unknown", "No user found"),
+                (7, "user2", "Already registered"),
+                (8, "user3", "Unknown option for menu: pasta"),
+            ],
+        )
+        booking = Booking.objects.get(person__username="user1")
+        self.assertIsNotNone(booking.confirmedOn)
+        self.assertEqual([o.option for o in booking.options.all()], [self.meat])
+        booking = Booking.objects.get(person__username="user2")
+        self.assertEqual([o.option for o in booking.options.all()], [self.fish])
+        self.assertEqual(
+            BookingLogEntry.objects.filter(
+                action=BookingLogEntry.ACTION_CONFIRM
+            ).count(),
+            2,
+        )
+
+    def test_dry_run_and_capacity(self):
+        f = self.csv_file("email", *("user{0}@example.com".format(i) for i in range(5)))
+
+        report = importing.import_bookings(self.event, f, self.organiser, dry_run=True)
+
+        self.assertEqual(report["created"], 4)
+        self.assertEqual(
+            report["errors"], [(6, "user4@example.com", "The event is fully booked")]
+        )
+        self.assertFalse(Booking.objects.exists())
+
+    def test_cancelled_bookings_are_confirmed_again(self):
+        users = get_user_model().objects.order_by("id")
+        cancelled = []
+        for user in users.filter(username__in=["user0", "user1"]):
+            booking = Booking.objects.create(event=self.event, person=user)
+            booking.options.create(option=self.fish)
+            booking.cancelledBy = self.organiser
+            booking.cancelledOn = timezone.now()
+            booking.save()
+            cancelled.append(booking)
+        for user in users.filter(username__in=["user2", "user3", "user4"]):
+            Booking.objects.create(event=self.event, person=user)
+        f = self.csv_file("username,menu", "user0,meat", "user0,", "user1,")
+
+        report = importing.import_bookings(self.event, f, self.organiser, dry_run=True)
+        self.assertEqual(report["reactivated"], 1)
+        self.assertTrue(Booking.objects.get(id=cancelled[0].id).is_cancelled())
+
+        f.seek(0)
+        report = importing.import_bookings(self.event, f, self.organiser)
+
+        self.assertEqual((report["created"], report["reactivated"]), (0, 1))
+        self.assertEqual(
+            report["errors"],
+            [
+                (3, "user0", "Already registered"),
+                (4, "user1", "The event is fully booked"),
+            ],
+        )
+        booking = Booking.objects.get(id=cancelled[0].id)
+        self.assertFalse(booking.is_cancelled())
+        self.assertIsNotNone(booking.confirmedOn)
+        self.assertEqual([o.option for o in booking.options.all()], [self.meat])
+        self.assertEqual(
+            BookingLogEntry.objects.filter(booking_id=booking.id).last().action,
+            BookingLogEntry.ACTION_CONFIRM,
+        )
+        self.assertTrue(Booking.objects.get(id=cancelled[1].id).is_cancelled())
+
+    def test_sessions(self):
+        self.event.sessions.create(
+            title="morning", start=self.event.start, max_participant=1
+        )
+        f = self.csv_file(
+            "username,session", "user0,morning", "user1,morning", "user2,"
+        )
+
+        report = importing.import_bookings(self.event, f, self.organiser)
+
+        self.assertEqual(report["created"], 1)
+        self.assertEqual(
+            [error for _, _, error in report["errors"]],
+            ["The session morning is fully booked", "A session is required"],
+        )
+
+    def test_choices_without_column(self):
+        drinks = self.event.choices.create(title="drinks")
+        wine = drinks.options.create(title="wine")
+        f = self.csv_file("username,drinks", "user1,")
+
+        importing.import_bookings(self.event, f, self.organiser)
+
+        booking = Booking.objects.get(person__username="user1")
+        self.assertEqual(
+            [o.option for o in booking.options.order_by("option")], [self.fish, wine]
+        )
+
+    def test_malformed_file(self):
+        f = self.csv_file("username", "user1", "a" * 200000)
+        with self.assertRaises(ValueError):
+            importing.import_bookings(self.event, f, self.organiser)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_invalid_header(self):
+        with self.assertRaises(ValueError):
+            importing.import_bookings(
+                self.event, self.csv_file("name"), self.organiser
+            )
+        with self.assertRaises(ValueError):
+            importing.import_bookings(
+                self.event, self.csv_file("username,drinks"), self.organiser
+            )
+
+    def test_view(self):
+        url = reverse("event_import_bookings", args=[self.event.id])
+        self.client.force_login(self.organiser)
+        f = self.csv_file("username", "user1", "nobody")
+        f.name = "participants.csv"
+
+        response = self.client.post(url, {"file": f, "dry_run": "on"})
+
+        self.assertContains(response, "nobody")
+        self.assertFalse(Booking.objects.exists())
+
+        f.seek(0)
+        response = self.client.post(url, {"file": f})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_register_category_members(self):
+        staff = Group.objects.create(name="staff")
+        paris = Group.objects.create(name="paris")
+        users = list(get_user_model().objects.filter(username__startswith="user"))
+        for user in users[:4]:
+            user.groups.add(staff)
+        for user in users[1:]:
+            user.groups.add(paris)
+        category = self.event.categories.create(order=1, name="staff")
+        category.groups1.add(staff)
+        category.groups2.add(paris)
+        self.event.max_participant = 2
+        self.event.save()
+        Booking.objects.create(event=self.event, person=users[1])
+
+        self.assertEqual(set(self.event.get_category_members()), set(users[1:4]))
+        everyone = self.event.categories.create(order=2, name="all")
+        self.assertEqual(
+            everyone.get_members().count(), get_user_model().objects.count()
+        )
+        everyone.delete()
+
+        report = importing.register_category_members(
+            self.event, self.organiser, batch_size=1
+        )
+
+        self.assertEqual(
+            report,
+            {"matched": 3, "already registered": 1, "created": 1, "full": 1},
+        )
+        booking = Booking.objects.get(person=users[2])
+        self.assertEqual([o.option for o in booking.options.all()], [self.fish])
+
+    def test_register_category_members_view(self):
+        self.event.categories.create(order=1, name="all")
+        get_user_model().objects.create(username="inactive", is_active=False)
+        url = reverse("event_register_members", args=[self.event.id])
+        self.client.force_login(self.organiser)
+
+        response = self.client.get(url)
+        self.assertEqual(response.context["unregistered"], 6)
+
+        self.event.max_participant = 0
+        self.event.save()
+        response = self.client.post(url)
+        self.assertRedirects(response, reverse("event_manage", args=[self.event.id]))
+        self.assertEqual(Booking.objects.filter(confirmedOn__isnull=False).count(), 6)
+
+
+class EventStateTest(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.event = Event.objects.create(
+            title="Gala",
+            start=self.now + timedelta(days=2),
+            end=self.now + timedelta(days=3),
+            booking_close=self.now + timedelta(days=1),
+            owner=default_user(),
+            pub_status="PUB",
+            max_participant=2,
+        )
+
+    def test_snapshot_at_a_given_time(self):
+        state = self.event.get_state(self.now)
+        self.assertFalse(state.ended)
+        self.assertTrue(state.booking_open)
+        self.assertTrue(state.choices_open)
+
+        state = self.event.get_state(self.now + timedelta(days=1, hours=1))
+        self.assertFalse(state.booking_open)
+        self.assertTrue(state.choices_open)
+
+        state = self.event.get_state(self.now + timedelta(days=4))
+        self.assertTrue(state.ended)
+        self.assertFalse(state.choices_open)
+
+        self.event.pub_status = "UNPUB"
+        self.assertFalse(self.event.get_state(self.now).choices_open)
+
+    def test_capacity_counted_once(self):
+        Booking.objects.create(event=self.event, person=default_user())
+        state = self.event.get_state()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(state.active_bookings, 1)
+            self.assertEqual(state.remaining, 1)
+            self.assertFalse(state.fully_booked)
+
+        self.event.max_participant = 0
+        state = self.event.get_state()
+        self.assertIsNone(state.remaining)
+        self.assertFalse(state.fully_booked)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.organiser = get_user_model().objects.create(username="orga")
+        self.event = Event.objects.create(
+            title="Gala",
+            start=timezone.now() + timedelta(days=1),
+            owner=self.organiser,
+            pub_status="PUB",
+        )
+        self.client.force_login(self.organiser)
+
+    def version(self):
+        self.event.refresh_from_db()
+        return self.event.content_version
+
+    def test_version_bumped_on_changes(self):
+        version = self.version()
+        booking = Booking.objects.create(event=self.event, person=default_user())
+        self.assertGreater(self.version(), version)
+
+        version = self.version()
+        choice = self.event.choices.create(title="menu")
+        option = choice.options.create(title="fish")
+        booking.options.create(option=option)
+        self.assertEqual(self.version(), version + 3)
+
+        version = self.version()
+        category = self.event.categories.create(order=1, name="all")
+        category.groups1.add(Group.objects.create(name="staff"))
+        self.assertEqual(self.version(), version + 2)
+
+        version = self.version()
+        bulk.update_bookings(self.organiser, bulk.ACTION_CANCEL, [booking.id])
+        self.assertEqual(self.version(), version + 1)
+
+    def test_version_not_saved_back(self):
+        stale = Event.objects.get(id=self.event.id)
+        version = self.version()
+        Booking.objects.create(event=self.event, person=default_user())
+        stale.title = "Ball"
+        stale.save()
+        self.assertEqual(self.version(), version + 2)
+        self.assertEqual(self.event.title, "Ball")
+
+    def test_save_of_a_deleted_event(self):
+        stale = Event.objects.get(id=self.event.id)
+        saved = []
+
+        def receiver(sender, **kwargs):
+            saved.append(kwargs)
+
+        post_save.connect(receiver, sender=Event)
+        self.addCleanup(post_save.disconnect, receiver, sender=Event)
+        Event.objects.filter(id=stale.id).delete()
+        # Saved again like any model, with an insert
+        stale.save()
+        self.assertTrue(Event.objects.filter(id=stale.id).exists())
+        self.assertTrue(saved[0]["created"])
+        self.assertIsNone(saved[0]["update_fields"])
+
+    def test_manage_page_not_modified(self):
+        url = reverse("event_manage", args=[self.event.id])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Booking.objects.create(event=self.event, person=default_user())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_csv_download_not_modified(self):
+        url = reverse("event_download_participants_list", args=[self.event.id])
+
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_events_list_not_modified_unless_messages(self):
+        url = reverse("events_list_mine")
+
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        other = get_user_model().objects.create(username="other")
+        self.client.force_login(other)
+        url = reverse("events_list_all")
+        etag = self.client.get(url)["ETag"]
+        # Redirected to the list with an error message
+        self.client.get(reverse("event_manage", args=[self.event.id]))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "not authorised")
+
+
+class ExportCacheTest(TestCase):
+    def setUp(self):
+        self.organiser = get_user_model().objects.create(username="orga")
+        self.event = Event.objects.create(
+            title="Gala", start=timezone.now(), owner=self.organiser
+        )
+        self.event.choices.create(title="menu").options.create(title="fish")
+        Booking.objects.create(event=self.event, person=self.organiser)
+        self.client.force_login(self.organiser)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def download(self, name="event_download_participants_list"):
+        response = self.client.get(reverse(name, args=[self.event.id]))
+        self.assertEqual(response.status_code, 200)
+        return response.getvalue().decode("utf-8")
+
+    def test_repeated_downloads_are_served_from_the_cache(self):
+        with override_settings(ONEEVENT_EXPORT_CACHE_DIR=self.directory.name):
+            hits = metrics.EXPORT_CACHE_REQUESTS.get(
+                export="participants_list", result="hit"
+            )
+            first = self.download()
+            rows = metrics.CSV_EXPORT_ROWS.get(export="participants_list")
+            self.assertEqual(self.download(), first)
+            self.assertEqual(
+                metrics.CSV_EXPORT_ROWS.get(export="participants_list"), rows
+            )
+            self.assertEqual(
+                metrics.EXPORT_CACHE_REQUESTS.get(
+                    export="participants_list", result="hit"
+                ),
+                hits + 1,
+            )
+
+            Booking.objects.create(event=self.event, person=default_user())
+            self.assertNotEqual(self.download(), first)
+            # The file of the previous version was removed
+            self.assertEqual(len(os.listdir(self.directory.name)), 1)
+
+    def test_changes_of_the_participants_are_exported(self):
+        with override_settings(ONEEVENT_EXPORT_CACHE_DIR=self.directory.name):
+            self.download()
+            self.organiser.last_name = "Smith"
+            self.organiser.save()
+            self.assertIn("Smith", self.download())
+
+            category = self.event.categories.create(order=1, name="staff")
+            staff = Group.objects.create(name="staff")
+            category.groups1.add(staff)
+            self.assertNotIn("staff", self.download())
+            self.organiser.groups.add(staff)
+            self.assertIn("staff", self.download())
+            staff.user_set.clear()
+            self.assertNotIn("staff", self.download())
+
+            # Logging in does not change the exports
+            version = Event.objects.get(id=self.event.id).content_version
+            self.organiser.last_login = timezone.now()
+            self.organiser.save(update_fields=["last_login"])
+            self.assertEqual(
+                Event.objects.get(id=self.event.id).content_version, version
+            )
+
+    def test_least_recently_used_files_are_evicted(self):
+        with override_settings(
+            ONEEVENT_EXPORT_CACHE_DIR=self.directory.name,
+            ONEEVENT_EXPORT_CACHE_MAX_SIZE=60,
+        ):
+            self.download("event_download_options_summary")
+            path = os.path.join(self.directory.name, os.listdir(self.directory.name)[0])
+            os.utime(path, (0, 0))
+            self.download("event_download_options_totals")
+
+            files = os.listdir(self.directory.name)
+            self.assertEqual(len(files), 1)
+            self.assertIn("options_totals", files[0])
+
+    def test_files_of_changed_and_deleted_events_are_removed(self):
+        with override_settings(ONEEVENT_EXPORT_CACHE_DIR=self.directory.name):
+            other = Event.objects.create(
+                title="Ball", start=timezone.now(), owner=self.organiser
+            )
+            self.download()
+            self.download("event_download_options_totals")
+            self.assertEqual(len(os.listdir(self.directory.name)), 2)
+            other.title = "Dance"
+            other.save()
+            self.assertEqual(len(os.listdir(self.directory.name)), 2)
+
+            self.event.title = "Party"
+            self.event.save()
+            self.assertEqual(os.listdir(self.directory.name), [])
+
+            self.download()
+            self.event.delete()
+            self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_orphaned_temporary_files_are_removed(self):
+        with override_settings(ONEEVENT_EXPORT_CACHE_DIR=self.directory.name):
+            orphan = os.path.join(self.directory.name, "orphan.tmp")
+            recent = os.path.join(self.directory.name, "recent.tmp")
+            for path in (orphan, recent):
+                with open(path, "w") as f:
+                    f.write("id")
+            os.utime(orphan, (0, 0))
+            self.download()
+            files = os.listdir(self.directory.name)
+            self.assertNotIn("orphan.tmp", files)
+            self.assertIn("recent.tmp", files)
+
+
+@override_settings(ONEEVENT_PAGE_CACHE_TIMEOUT=60)
+class PageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.organiser = get_user_model().objects.create(username="orga")
+        self.event = Event.objects.create(
+            title="Gala",
+            start=timezone.now() + timedelta(days=1),
+            owner=self.organiser,
+            pub_status="PUB",
+            max_participant=10,
+        )
+
+    def get(self, expected_result, name="events_list_all"):
+        count = metrics.PAGE_CACHE_REQUESTS.get(page=name, result=expected_result)
+        response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            metrics.PAGE_CACHE_REQUESTS.get(page=name, result=expected_result),
+            count + 1,
+        )
+        return response.content.decode("utf-8")
+
+    def test_anonymous_pages_are_cached(self):
+        first = self.get("miss")
+        self.assertIn("Gala", first)
+        self.assertEqual(self.get("hit"), first)
+        self.get("miss", "events_list_future")
+        self.get("hit", "events_list_future")
+
+    def test_hits_are_served_without_queries(self):
+        self.get("miss")
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("events_list_all"))
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                reverse("events_list_all"), HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+
+        self.event.title = "Ball"
+        self.event.save()
+        response = self.client.get(reverse("events_list_all"), HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "Ball")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_authenticated_users_are_not_served_from_the_cache(self):
+        self.get("miss")
+        self.client.force_login(self.organiser)
+        hits = metrics.PAGE_CACHE_REQUESTS.get(page="events_list_all", result="hit")
+        response = self.client.get(reverse("events_list_all"))
+        self.assertContains(response, "Manage")
+        self.assertEqual(
+            metrics.PAGE_CACHE_REQUESTS.get(page="events_list_all", result="hit"),
+            hits,
+        )
+
+    def test_changes_to_public_events_invalidate_the_pages(self):
+        self.assertIn("Participants: 0/10", self.get("miss"))
+        Booking.objects.create(
+            event=self.event, person=default_user(), confirmedOn=timezone.now()
+        )
+        self.assertIn("Participants: 1/10", self.get("miss"))
+
+        self.event.organisers.add(self.organiser)
+        self.get("miss")
+
+        self.event.pub_status = "UNPUB"
+        self.event.save()
+        self.assertNotIn("Gala", self.get("miss"))
+
+    def test_deleted_events_invalidate_the_pages(self):
+        self.assertIn("Gala", self.get("miss"))
+        self.get("hit")
+        self.event.delete()
+        self.assertNotIn("Gala", self.get("miss"))
+
+    def test_archived_events_invalidate_the_pages(self):
+        self.assertIn("Gala", self.get("miss"))
+        self.get("hit")
+        archive.archive_event(self.event)
+        self.assertNotIn("Gala", self.get("miss"))
+
+    def test_changes_to_other_events_keep_the_pages(self):
+        other = Event.objects.create(
+            title="Secret", start=timezone.now(), owner=self.organiser
+        )
+        self.get("miss")
+        Booking.objects.create(event=other, person=default_user())
+        self.get("hit")
+
+        other.pub_status = "PUB"
+        other.save()
+        self.assertIn("Secret", self.get("miss"))
+
+    def test_stale_page_is_served_while_rendered_again(self):
+        first = self.get("miss")
+        self.event.title = "Ball"
+        self.event.save()
+        # Another request is rendering the page
+        cache.add(page_cache.KEY_PREFIX + "events_list_all:lock", True)
+        self.assertEqual(self.get("stale"), first)
+        cache.delete(page_cache.KEY_PREFIX + "events_list_all:lock")
+        self.assertIn("Ball", self.get("miss"))
+        self.get("hit")
+
+
+@override_settings(ONEEVENT_FRAGMENT_CACHE_TIMEOUT=60)
+class FragmentCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.organiser = get_user_model().objects.create(
+            username="orga", first_name="Ann"
+        )
+        self.event = Event.objects.create(
+            title="Gala", start=timezone.now(), owner=self.organiser, pub_status="PUB"
+        )
+        self.event.organisers.add(self.organiser)
+
+    def rename_organiser(self, name):
+        # Not a change of the event
+        get_user_model().objects.filter(id=self.organiser.id).update(first_name=name)
+
+    def test_list_rows_are_cached_until_the_event_changes(self):
+        self.assertContains(self.client.get(reverse("events_list_all")), "Ann")
+        self.rename_organiser("Bob")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("events_list_all"))
+        self.assertContains(response, "Ann")
+        self.assertFalse(
+            [q for q in queries if "oneevent_event_organisers" in q["sql"]]
+        )
+
+        Booking.objects.create(event=self.event, person=default_user())
+        self.assertContains(self.client.get(reverse("events_list_all")), "Bob")
+
+    def test_user_dependent_parts_are_not_cached(self):
+        def render(price):
+            return render_to_string(
+                "oneevent/event_description_panel_part.html",
+                {"event": Event.objects.get(id=self.event.id), "price": price},
+            )
+
+        content = render(None)
+        self.assertIn("Ann", content)
+        self.assertNotIn("Price for you", content)
+        self.rename_organiser("Bob")
+        content = render(7)
+        self.assertIn("Ann", content)
+        self.assertIn("Price for you", content)
+
+    def test_fragments_depend_on_the_language(self):
+        self.client.get(reverse("events_list_all"))
+        self.rename_organiser("Bob")
+        with translation.override("fr"):
+            self.assertContains(self.client.get(reverse("events_list_all")), "Bob")
+
+
+class BookingsTableTest(TestCase):
+    def setUp(self):
+        self.organiser = get_user_model().objects.create(username="orga")
+        self.event = Event.objects.create(
+            title="Gala", start=timezone.now(), owner=self.organiser
+        )
+        self.bookings = []
+        for i, name in enumerate(("Smith", "Jones", "Brown", "Adams", "Clark")):
+            person = get_user_model().objects.create(
+                username="user{0}".format(i), first_name="Jo", last_name=name
+            )
+            booking = Booking.objects.create(event=self.event, person=person)
+            self.bookings.append(booking)
+        self.cancelled = self.bookings[1]
+        self.cancelled.cancelledBy = self.organiser
+        self.cancelled.cancelledOn = timezone.now()
+        self.cancelled.save()
+        self.client.force_login(self.organiser)
+
+    def table(self, **params):
+        url = reverse("event_bookings_table", args=[self.event.id])
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_follow_each_other(self):
+        ids = []
+        cursor = None
+        for _ in range(3):
+            page = bookings_table.get_page(
+                self.event, {"status": "active"}, cursor=cursor, limit=2
+            )
+            ids.extend(booking.id for booking in page["bookings"])
+            cursor = page["next_cursor"]
+            if not page["more"]:
+                break
+        self.assertFalse(page["more"])
+        self.assertEqual(
+            ids, [b.id for b in self.bookings if b is not self.cancelled]
+        )
+
+    def test_sort_by_name(self):
+        names = []
+        page = {"next_cursor": None}
+        for _ in range(3):
+            page = self.table(sort="-name", limit=2, cursor=page["next_cursor"] or "")
+            names.extend(re.findall(r"<p>Jo (\w+)</p>", page["html"]))
+        self.assertEqual(names, ["Smith", "Clark", "Brown", "Adams"])
+
+    def test_filters(self):
+        page = bookings_table.get_page(self.event, {"status": "cancelled"})
+        self.assertEqual(page["bookings"], [self.cancelled])
+
+        self.bookings[2].paidTo = self.organiser
+        self.bookings[2].save()
+        page = bookings_table.get_page(self.event, {"paid": "paid"})
+        self.assertEqual(page["bookings"], [self.bookings[2]])
+
+        page = bookings_table.get_page(self.event, {"q": "ada"})
+        self.assertEqual(page["bookings"], [self.bookings[3]])
+
+        session = self.event.sessions.create(title="morning", start=timezone.now())
+        self.bookings[4].session = session
+        self.bookings[4].save()
+        page = bookings_table.get_page(self.event, {"session": session})
+        self.assertEqual(page["bookings"], [self.bookings[4]])
+
+    def test_category_filter_uses_the_first_matching_category(self):
+        staff = Group.objects.create(name="staff")
+        everyone = Group.objects.create(name="everyone")
+        for booking in self.bookings:
+            booking.person.groups.add(everyone)
+        self.bookings[0].person.groups.add(staff)
+        first = self.event.categories.create(order=1, name="staff")
+        first.groups1.add(staff)
+        second = self.event.categories.create(order=2, name="others")
+        second.groups1.add(everyone)
+
+        page = bookings_table.get_page(self.event, {"category": first})
+        self.assertEqual(page["bookings"], [self.bookings[0]])
+        page = bookings_table.get_page(
+            self.event, {"status": "active", "category": second}
+        )
+        self.assertEqual(page["bookings"], self.bookings[2:])
+
+    def test_category_filter_matches_the_categories_of_the_participants(self):
+        paris = Group.objects.create(name="paris")
+        self.bookings[0].person.groups.add(paris)
+        # groups2 only: matches everyone, like match()
+        first = self.event.categories.create(order=1, name="paris")
+        first.groups2.add(paris)
+        second = self.event.categories.create(order=2, name="others")
+
+        for category in (first, second):
+            page = bookings_table.get_page(self.event, {"category": category})
+            expected = [
+                b
+                for b in self.bookings
+                if self.event.get_user_category(b.person) == category
+            ]
+            self.assertEqual(page["bookings"], expected)
+        self.assertEqual(len(page["bookings"]), 0)
+
+    def test_manage_page_shows_the_active_bookings(self):
+        url = reverse("event_manage", args=[self.event.id])
+        response = self.client.get(url)
+        self.assertContains(response, "Jo Smith")
+        self.assertNotContains(response, "Jo Jones")
+
+        response = self.client.get(url, {"status": "cancelled"})
+        self.assertContains(response, "Jo Jones")
+        self.assertNotContains(response, "Jo Smith")
+
+    def test_manage_page_loads_more_bookings(self):
+        url = reverse("event_manage", args=[self.event.id])
+        response = self.client.get(url)
+        self.assertContains(response, "load_more_bookings(event)")
+        self.assertFalse(response.context["bookings_more"])
+        self.assertContains(response, 'class="btn btn-default hidden"')
+
+        get_user_model().objects.bulk_create(
+            get_user_model()(username="many{0}".format(i), last_name="Zed")
+            for i in range(bookings_table.DEFAULT_LIMIT)
+        )
+        users = get_user_model().objects.filter(username__startswith="many")
+        Booking.objects.bulk_create(
+            Booking(event=self.event, person=user) for user in users
+        )
+        response = self.client.get(url)
+        self.assertTrue(response.context["bookings_more"])
+        cursor = response.context["bookings_next_cursor"]
+        self.assertTrue(cursor)
+        self.assertContains(response, 'data-cursor="{0}"'.format(cursor))
+        self.assertNotContains(response, 'class="btn btn-default hidden"')
+
+    def test_invalid_requests(self):
+        url = reverse("event_bookings_table", args=[self.event.id])
+        response = self.client.get(url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url, {"sort": "price"})
+        self.assertEqual(response.status_code, 400)
+
+        # A cursor of another sort
+        cursor = self.table(limit=1)["next_cursor"]
+        response = self.client.get(url, {"cursor": cursor, "sort": "name"})
+        self.assertEqual(response.status_code, 400)
+
+        self.client.force_login(default_user())
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 403)
+
+
+@skipUnless("replica" in settings.DATABASES, "No replica database configured")
+@override_settings(
+    ONEEVENT_READ_REPLICA="replica",
+    DATABASE_ROUTERS=["oneevent.db_routing.ReadReplicaRouter"],
+    MIDDLEWARE=settings.MIDDLEWARE + ["oneevent.db_routing.PinPrimaryMiddleware"],
+)
+class ReadReplicaTest(TestCase):
+    databases = {"default", "replica"} & set(settings.DATABASES)
+
+    def setUp(self):
+        self.organiser = get_user_model().objects.create(
+            username="orga", is_superuser=True
+        )
+        self.event = Event.objects.create(
+            title="Primary",
+            start=timezone.now() + timedelta(days=1),
+            owner=self.organiser,
+            pub_status="PUB",
+        )
+        # Not replicated yet
+        replica_owner = get_user_model().objects.using("replica").create(
+            id=self.organiser.id, username="orga"
+        )
+        Event.objects.using("replica").create(
+            title="Replica",
+            start=timezone.now() + timedelta(days=1),
+            owner=replica_owner,
+            pub_status="PUB",
+        )
+
+    def test_lists_are_read_from_the_replica(self):
+        response = self.client.get(reverse("events_list_all"))
+        self.assertContains(response, "Replica")
+        self.assertNotContains(response, "Primary")
+
+        with override_settings(ONEEVENT_READ_REPLICA=None):
+            response = self.client.get(reverse("events_list_all"))
+        self.assertContains(response, "Primary")
+
+    def test_streamed_exports_are_read_from_the_replica(self):
+        self.client.force_login(self.organiser)
+        response = self.client.get(reverse("export_json_lines"))
+        content = b"".join(response.streaming_content).decode("utf-8")
+        self.assertIn("Replica", content)
+        self.assertNotIn("Primary", content)
+
+    def test_session_pinned_to_the_primary_after_a_write(self):
+        self.client.force_login(self.organiser)
+        self.assertNotContains(self.client.get(reverse("events_list_all")), "Primary")
+
+        self.client.get(reverse("booking_create", args=[self.event.id]))
+        self.assertTrue(Booking.objects.filter(event=self.event).exists())
+        self.assertIn(db_routing.PIN_SESSION_KEY, self.client.session)
+        self.assertContains(self.client.get(reverse("events_list_all")), "Primary")
+
+        # Other sessions still read from the replica
+        self.client.logout()
+        self.assertNotContains(self.client.get(reverse("events_list_all")), "Primary")
+
+    @override_settings(ONEEVENT_PAGE_CACHE_TIMEOUT=60)
+    def test_cached_pages_are_read_from_the_primary(self):
+        cache.clear()
+        for _ in range(2):
+            response = self.client.get(reverse("events_list_all"))
+            self.assertContains(response, "Primary")
+            self.assertNotContains(response, "Replica")
+
+
+class IdempotencyTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="user")
+        self.event = Event.objects.create(
+            title="Gala",
+            start=timezone.now() + timedelta(days=1),
+            owner=default_user(),
+            pub_status="PUB",
+        )
+        self.booking = Booking.objects.create(
+            event=self.event, person=self.user, confirmedOn=timezone.now()
+        )
+        self.client.force_login(self.user)
+        self.url = reverse("booking_cancel", args=[self.booking.id])
+
+    def test_retries_replay_the_outcome(self):
+        response = self.client.post(self.url, {"idempotency_key": "abc"})
+        self.assertRedirects(
+            response, reverse("events_list_mine"), fetch_redirect_response=False
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.client.post(self.url, {"idempotency_key": "abc"})
+        self.assertEqual(retry.status_code, 302)
+        self.assertEqual(retry["Location"], response["Location"])
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertFalse([q for q in queries if '"oneevent_booking"' in q["sql"]])
+        self.assertEqual(
+            BookingLogEntry.objects.filter(
+                action=BookingLogEntry.ACTION_CANCEL
+            ).count(),
+            1,
+        )
+
+    def test_key_from_the_header(self):
+        self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="abc")
+        retry = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="abc")
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+
+        # Keys are scoped by user
+        other = get_user_model().objects.create(username="other")
+        self.client.force_login(other)
+        response = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="abc")
+        self.assertNotIn("Idempotent-Replayed", response)
+
+    def test_conflicts(self):
+        IdempotencyKey.objects.create(
+            user=self.user,
+            key="running",
+            fingerprint="",
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+        response = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="running")
+        self.assertEqual(response.status_code, 409)
+        self.assertIsNone(Booking.objects.get(id=self.booking.id).cancelledOn)
+
+        self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="abc")
+        url = reverse("booking_update", args=[self.booking.id])
+        response = self.client.post(url, HTTP_IDEMPOTENCY_KEY="abc")
+        self.assertEqual(response.status_code, 422)
+
+        response = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="x" * 65)
+        self.assertEqual(response.status_code, 400)
+
+    def test_abandoned_requests_are_taken_over(self):
+        # Left by a killed process
+        IdempotencyKey.objects.create(
+            user=self.user,
+            key="abc",
+            fingerprint="",
+            created_at=timezone.now() - timedelta(minutes=2),
+            expires_at=timezone.now() - timedelta(minutes=1),
+        )
+        response = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="abc")
+        self.assertEqual(response.status_code, 302)
+        self.assertIsNotNone(Booking.objects.get(id=self.booking.id).cancelledOn)
+
+        record = IdempotencyKey.objects.get(key="abc")
+        self.assertEqual(record.status_code, 302)
+        ttl = timedelta(seconds=settings.ONEEVENT_IDEMPOTENCY_KEY_TTL)
+        self.assertGreater(record.expires_at, timezone.now() + ttl / 2)
+        retry = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="abc")
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+
+    def test_expired_keys(self):
+        IdempotencyKey.objects.create(
+            user=self.user,
+            key="old",
+            fingerprint="",
+            status_code=302,
+            expires_at=timezone.now() - timedelta(seconds=1),
+        )
+        response = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY="old")
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertIsNotNone(Booking.objects.get(id=self.booking.id).cancelledOn)
+
+        IdempotencyKey.objects.filter(key="old").update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        out = io.StringIO()
+        call_command("oneevent_purge_idempotency_keys", stdout=out)
+        self.assertIn("Removed 1 expired keys", out.getvalue())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_forms_carry_a_key(self):
+        self.assertContains(self.client.get(self.url), 'name="idempotency_key"')
+        url = reverse("booking_update", args=[self.booking.id])
+        self.assertContains(self.client.get(url), 'name="idempotency_key"')
+
+
+class WaitingRoomTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.event = Event.objects.create(
+            title="Gala",
+            start=timezone.now() + timedelta(days=1),
+            owner=default_user(),
+            pub_status="PUB",
+            admission_rate=1,
+        )
+        self.url = reverse("booking_create", args=[self.event.id])
+        self.status_url = reverse("waiting_room_status", args=[self.event.id])
+        self.clock = mock.Mock()
+        self.clock.time.return_value = 1000000.5
+        patcher = mock.patch.object(waiting_room, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login(self, username):
+        user = get_user_model().objects.create(username=username)
+        client = Client()
+        client.force_login(user)
+        return user, client
+
+    def test_no_waiting_room(self):
+        event = Event.objects.create(
+            title="Picnic",
+            start=timezone.now() + timedelta(days=1),
+            owner=default_user(),
+            pub_status="PUB",
+        )
+        user, client = self.login("user")
+        response = client.get(reverse("booking_create", args=[event.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Booking.objects.filter(event=event, person=user).exists())
+
+    def test_queue(self):
+        first, first_client = self.login("first")
+        response = first_client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+        second, second_client = self.login("second")
+        response = second_client.get(self.url)
+        self.assertContains(response, 'id="waiting-room"')
+        self.assertFalse(Booking.objects.filter(person=second).exists())
+        token = response.context["token"]
+
+        # Refreshing the page keeps the place in the queue
+        response = second_client.get(self.url)
+        self.assertEqual(response.context["token"], token)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.status_url, {"token": token})
+        self.assertEqual(
+            response.json(), {"admitted": False, "wait": 1, "position": 1}
+        )
+
+        self.clock.time.return_value += 1
+        response = self.client.get(self.status_url, {"token": token})
+        self.assertTrue(response.json()["admitted"])
+        response = second_client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Booking.objects.filter(person=second).exists())
+
+        # The admission expires
+        self.clock.time.return_value += settings.ONEEVENT_WAITING_ROOM_ADMISSION_SECONDS
+        response = self.client.get(self.status_url, {"token": token})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+    )
+    def test_cache_without_increments(self):
+        user, client = self.login("first")
+        client.get(self.url)
+        user, client = self.login("second")
+        with self.assertLogs("oneevent.waiting_room", "ERROR"):
+            response = client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_invalid_tickets(self):
+        response = self.client.get(self.status_url, {"token": "forged"})
+        self.assertEqual(response.status_code, 400)
+
+        user, client = self.login("first")
+        client.get(self.url)
+        user, client = self.login("second")
+        token = client.get(self.url).context["token"]
+        other_url = reverse("waiting_room_status", args=[self.event.id + 1])
+        response = self.client.get(other_url, {"token": token})
+        self.assertEqual(response.status_code, 400)
+
+    def test_load(self):
+        """
+        Ten times more users than admitted per second rush to register: the
+        registrations, and the queries they make, stay at the admission rate
+        """
+        rate = 5
+        Event.objects.filter(id=self.event.id).update(admission_rate=rate)
+        cache.clear()
+        clients = [self.login("user{0}".format(i))[1] for i in range(rate * 10)]
+
+        def is_domain_query(query):
+            return "oneevent_" in query["sql"]
+
+        # Queries of a single registration, without waiting room
+        event = Event.objects.create(
+            title="Picnic",
+            start=timezone.now() + timedelta(days=1),
+            owner=default_user(),
+            pub_status="PUB",
+        )
+        self.client.force_login(default_user())
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("booking_create", args=[event.id]))
+        booking_queries = len(list(filter(is_domain_query, queries)))
+
+        waiting = {}
+        pending = clients
+        seconds = []
+        while pending and len(seconds) < 20:
+            registered = []
+            bookings = Booking.objects.filter(event=self.event).count()
+            with CaptureQueriesContext(connection) as queries:
+                for client in pending:
+                    if client in waiting:
+                        # Polling of the waiting page
+                        status = client.get(self.status_url, {"token": waiting[client]})
+                        if not status.json()["admitted"]:
+                            continue
+                    response = client.get(self.url)
+                    if response.status_code == 200:
+                        waiting[client] = response.context["token"]
+                    else:
+                        registered.append(client)
+            seconds.append(
+                (
+                    Booking.objects.filter(event=self.event).count() - bookings,
+                    len(list(filter(is_domain_query, queries))),
+                )
+            )
+            pending = [c for c in pending if c not in registered]
+            self.clock.time.return_value += 1
+
+        self.assertEqual(Booking.objects.filter(event=self.event).count(), rate * 10)
+        self.assertEqual(len(seconds), 10)
+        for bookings, domain_queries in seconds:
+            self.assertEqual(bookings, rate)
+            self.assertLessEqual(domain_queries, rate * booking_queries + 1)
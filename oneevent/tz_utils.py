@@ -162,6 +162,23 @@ def utcoffset_normalize(date, delta=None, dstmode=DSTAUTO):
         return date
 
 
+def shift_local(dt, delta, tz):
+    """Shift an aware datetime by a delta of local (wall clock) time.
+
+    The result keeps the same local time of day in the given timezone, even
+    when the shift crosses daylight saving time changes.
+
+    :param dt: aware datetime to shift, or None.
+    :param delta: datetime.timedelta instance.
+    :param tz: pytz timezone in which the local time is kept.
+    :returns: the shifted aware datetime, or None if dt is None.
+    """
+    if dt is None:
+        return None
+    local = tzdel(dt.astimezone(tz)) + delta
+    return tz.normalize(tz.localize(local))
+
+
 def tzdel(dt):
     """ Create timezone naive datetime from a timezone aware one by removing
     the timezone component.
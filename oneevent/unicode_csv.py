@@ -3,9 +3,10 @@ import codecs
 import io
 
 
-class UTF8Recoder:
+class Recoder:
     """
-    Iterator that reads an encoded stream and reencodes the input to UTF-8
+    Iterator that reads an encoded binary stream and yields its decoded lines,
+    one at a time
     """
 
     def __init__(self, f, encoding):
@@ -15,22 +16,29 @@ class UTF8Recoder:
         return self
 
     def __next__(self):
-        return self.reader.next().encode("utf-8")
+        return next(self.reader)
 
 
 class UnicodeReader:
     """
-    A CSV reader which will iterate over lines in the CSV file "f",
-    which is encoded in the given encoding.
+    A CSV reader which will iterate over lines in the binary CSV file "f",
+    which is encoded in the given encoding. The file is read as the rows are
+    iterated, so it is never loaded in memory as a whole.
     """
 
     def __init__(self, f, dialect=csv.excel, encoding="utf-8", **kwds):
-        f = UTF8Recoder(f, encoding)
+        f = Recoder(f, encoding)
         self.reader = csv.reader(f, dialect=dialect, **kwds)
 
+    @property
+    def line_num(self):
+        """
+        The number of lines read from the file so far
+        """
+        return self.reader.line_num
+
     def __next__(self):
-        row = next(self.reader)
-        return [str(s, "utf-8") for s in row]
+        return next(self.reader)
 
     def __iter__(self):
         return self
@@ -42,25 +50,37 @@ class UnicodeWriter:
     which is encoded in the given encoding.
     """
 
-    def __init__(self, f, dialect=csv.excel, encoding="utf-8", **kwds):
+    def __init__(self, f=None, dialect=csv.excel, encoding="utf-8", **kwds):
         # Redirect output to a queue
         self.queue = io.StringIO()
         self.writer = csv.writer(self.queue, dialect=dialect, **kwds)
         self.stream = f
         self.encoder = codecs.getincrementalencoder(encoding)()
 
-    def writerow(self, row):
-        self.writer.writerow([s.encode("utf-8") for s in row])
-        # Fetch UTF-8 output from the queue ...
-        data = self.queue.getvalue()
-        data = data.decode("utf-8")
-        # ... and reencode it into the target encoding
-        data = self.encoder.encode(data)
-        # write to the target stream
-        self.stream.write(data)
+    def _encode_row(self, row):
+        """
+        Returns the CSV line for the given row, encoded in the target encoding
+        """
+        self.writer.writerow(row)
+        # Fetch output from the queue and encode it into the target encoding
+        data = self.encoder.encode(self.queue.getvalue())
         # empty queue
+        self.queue.seek(0)
         self.queue.truncate(0)
+        return data
+
+    def writerow(self, row):
+        # write to the target stream
+        self.stream.write(self._encode_row(row))
 
     def writerows(self, rows):
         for row in rows:
             self.writerow(row)
+
+    def iterrows(self, rows):
+        """
+        Yields the encoded CSV line of each row instead of writing it to the stream,
+        e.g. to feed a StreamingHttpResponse
+        """
+        for row in rows:
+            yield self._encode_row(row)
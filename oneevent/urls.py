@@ -21,11 +21,17 @@ urlpatterns = [
         name="event_update_sessions",
     ),
     path("event/<int:event_id>/manage", views.event_manage, name="event_manage"),
+    path("event/<int:event_id>/clone", views.event_clone, name="event_clone"),
     path(
         "event/<int:event_id>/options_summary",
         views.event_download_options_summary,
         name="event_download_options_summary",
     ),
+    path(
+        "event/<int:event_id>/options_totals",
+        views.event_download_options_totals,
+        name="event_download_options_totals",
+    ),
     path(
         "event/<int:event_id>/participants_list",
         views.event_download_participants_list,
@@ -73,10 +79,47 @@ urlpatterns = [
         name="booking_payment_unexempt",
         kwargs={"cancel": True},
     ),
+    path(
+        "event/<int:event_id>/bookings/table",
+        views.event_bookings_table,
+        name="event_bookings_table",
+    ),
+    path(
+        "event/<int:event_id>/waiting_room",
+        views.waiting_room_status,
+        name="waiting_room_status",
+    ),
+    path(
+        "event/<int:event_id>/bookings/changes",
+        views.event_bookings_changes,
+        name="event_bookings_changes",
+    ),
+    path(
+        "event/<int:event_id>/bookings/rate",
+        views.event_booking_rate,
+        name="event_booking_rate",
+    ),
+    path(
+        "event/<int:event_id>/bookings/import",
+        views.event_import_bookings,
+        name="event_import_bookings",
+    ),
+    path(
+        "event/<int:event_id>/bookings/register_members",
+        views.event_register_members,
+        name="event_register_members",
+    ),
+    path(
+        "event/<int:event_id>/bookings/bulk/<str:action>",
+        views.event_bookings_bulk_update,
+        name="event_bookings_bulk_update",
+    ),
     path(
         "booking/<int:booking_id>/send_invite",
         views.booking_send_invite,
         name="booking_send_invite",
     ),
     path("accounts/delete", views.user_delete, name="user_delete"),
+    path("export/jsonl", views.export_json_lines, name="export_json_lines"),
+    path("metrics", views.metrics_export, name="metrics"),
 ]
@@ -0,0 +1,88 @@
+"""
+Content versions of the events, for conditional GET requests.
+
+Each event has a content version, bumped by the signal handlers on any change to
+the event, its bookings, categories, sessions or choices, or to the names and
+groups of its participants and organisers, and by the bulk operations which bypass
+the signals. The version drives the ETag and
+Last-Modified headers of the pages and exports of the event, so that browsers
+refreshing them get a 304 response while nothing changed. It also invalidates the
+pages cached for anonymous visitors, see page_cache.py, and removes the stale
+exports cached on disk, see export_cache.py.
+"""
+from django.contrib.messages import get_messages
+from django.db.models import F
+from django.db.models.aggregates import Count, Max, Sum
+from django.utils import timezone
+
+from . import export_cache, page_cache
+from .models import Event
+
+
+def bump_content_version(event_ids):
+    """
+    Record a change of the content of events
+    @param event_ids: the IDs of the changed events, as an iterable or a
+    queryset of values
+    """
+    Event.objects.filter(id__in=event_ids).update(
+        content_version=F("content_version") + 1,
+        content_updated_at=timezone.now(),
+    )
+    page_cache.events_changed(event_ids)
+    export_cache.events_changed(event_ids)
+
+
+def _has_messages(request):
+    """
+    Pending messages must be shown, so the page can not be served from the cache
+    of the browser
+    """
+    return len(get_messages(request)) > 0
+
+
+def _get_event_version(event_id):
+    """
+    @return: a tuple (content version, content update datetime) of an event, or
+    None if it does not exist
+    """
+    versions = Event.objects.filter(id=event_id)
+    return versions.values_list("content_version", "content_updated_at").first()
+
+
+def event_etag(request, event_id):
+    """
+    ETag of the pages and exports of an event, depending on the user as the pages
+    show their name
+    """
+    version = _get_event_version(event_id)
+    if version is None or _has_messages(request):
+        return None
+    return "event-{0}-{1}-user-{2}".format(event_id, version[0], request.user.pk)
+
+
+def event_last_modified(request, event_id):
+    version = _get_event_version(event_id)
+    if version is None or _has_messages(request):
+        return None
+    return version[1]
+
+
+def events_list_etag(request):
+    """
+    ETag of the lists of events, depending on the versions of all the events and
+    on the user. It also changes every minute, as events open and close over time.
+    """
+    if _has_messages(request):
+        return None
+    versions = Event.objects.aggregate(
+        count=Count("id"), total=Sum("content_version"), last=Max("content_updated_at")
+    )
+    last = versions["last"].timestamp() if versions["last"] is not None else 0
+    return "events-{0}-{1}-{2:.0f}-user-{3}-{4:%Y%m%d%H%M}".format(
+        versions["count"],
+        versions["total"] or 0,
+        last * 1000000,
+        request.user.pk,
+        timezone.now(),
+    )
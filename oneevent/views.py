@@ -2,15 +2,43 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.db.models.query_utils import Q
-from django.http.response import HttpResponse, Http404
+from django.http.response import (
+    FileResponse,
+    HttpResponse,
+    HttpResponseBadRequest,
+    Http404,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.template.defaultfilters import slugify
+from django.template.loader import render_to_string
 from django.contrib import messages
 from django.utils import timezone
+from django.views.decorators.http import condition
+
+from . import (
+    audit,
+    bookings_table,
+    bulk,
+    changes,
+    cloning,
+    db_routing,
+    deletion,
+    export,
+    export_cache,
+    idempotency,
+    importing,
+    metrics,
+    page_cache,
+    unicode_csv,
+    versions,
+    waiting_room,
+)
 
-from . import unicode_csv
-
-from .models import Event, Booking, Choice, BookingOption
+from .models import Event, Booking, BookingLogEntry, Choice, BookingOption
 from .forms import (
+    BookingFilterForm,
+    BookingImportForm,
     EventForm,
     CategoryFormSet,
     CategoryFormSetHelper,
@@ -22,6 +50,7 @@ from .forms import (
     CreateBookingOnBehalfForm,
     BookingChoicesForm,
     BookingSessionForm,
+    EventCloneForm,
 )
 from django.contrib.auth import get_user_model
 from django.urls import reverse
@@ -40,8 +69,10 @@ def index(request):
 
 def events_list(request, events, context, show_archived=False):
     context["events"] = []
+    # All the events are shown as they are at the same time
+    now = timezone.now()
     for evt in events:
-        event_info = {"event": evt, "booking": None}
+        event_info = {"event": evt, "booking": None, "state": evt.get_state(now)}
         # Hide events that the user can not list
         if not evt.user_can_list(request.user, show_archived):
             continue
@@ -65,6 +96,9 @@ def events_list(request, events, context, show_archived=False):
     return render(request, "oneevent/events_list.html", context)
 
 
+@db_routing.use_read_replica
+@page_cache.anonymous_cached("events_list_future")
+@condition(etag_func=versions.events_list_etag)
 def events_list_future(request):
     context = {"events_shown": "fut"}
     now = timezone.now()
@@ -73,6 +107,8 @@ def events_list_future(request):
     return events_list(request, events, context)
 
 
+@db_routing.use_read_replica
+@condition(etag_func=versions.events_list_etag)
 def events_list_past(request):
     context = {"events_shown": "past"}
     now = timezone.now()
@@ -81,11 +117,16 @@ def events_list_past(request):
     return events_list(request, events, context)
 
 
+@db_routing.use_read_replica
+@page_cache.anonymous_cached("events_list_all")
+@condition(etag_func=versions.events_list_etag)
 def events_list_all(request):
     context = {"events_shown": "all"}
     return events_list(request, Event.objects.all(), context)
 
 
+@db_routing.use_read_replica
+@condition(etag_func=versions.events_list_etag)
 def events_list_archived(request):
     context = {"events_shown": "arch"}
     events = Event.objects.filter(pub_status="ARCH")
@@ -93,6 +134,8 @@ def events_list_archived(request):
 
 
 @login_required
+@db_routing.use_read_replica
+@condition(etag_func=versions.events_list_etag)
 def events_list_mine(request):
     context = {"events_shown": "mine"}
     query = Q(bookings__person=request.user, bookings__cancelledOn=None)
@@ -107,6 +150,10 @@ def events_list_mine(request):
 
 
 @login_required
+@waiting_room.admission_required
+@idempotency.idempotent
+@metrics.timed(metrics.VIEW_DURATION, view="booking_create")
+@audit.buffered()
 def booking_create(request, event_id):
     event = get_object_or_404(Event, id=event_id)
 
@@ -114,13 +161,17 @@ def booking_create(request, event_id):
         messages.error(request, "You are not allowed to register to this event")
         return redirect("index")
 
-    if event.is_booking_open():
-        booking, _ = Booking.objects.get_or_create(
+    state = event.get_state()
+    if state.booking_open:
+        booking, created = Booking.objects.get_or_create(
             event=event,
             person=request.user,
             defaults={"cancelledBy": request.user, "cancelledOn": timezone.now()},
         )
-        if booking.is_cancelled() and event.is_fully_booked():
+        if created:
+            metrics.BOOKINGS_CREATED.inc()
+            audit.log(booking, BookingLogEntry.ACTION_CREATE, request.user)
+        if booking.is_cancelled() and state.fully_booked:
             messages.error(request, "Sorry the event is fully booked already")
             return redirect("index")
         messages.warning(request, "Please confirm your registration here!")
@@ -130,7 +181,19 @@ def booking_create(request, event_id):
         return redirect("index")
 
 
+def waiting_room_status(request, event_id):
+    """
+    Position in the waiting room of an event of the ticket given by the "token"
+    query parameter, polled by the waiting page. It does not use the database.
+    """
+    status = waiting_room.get_status(request.GET.get("token", ""), event_id)
+    if status is None:
+        return JsonResponse({"error": "Invalid or expired ticket"}, status=400)
+    return JsonResponse(status)
+
+
 @login_required
+@audit.buffered()
 def booking_create_on_behalf(request, event_id):
     event = get_object_or_404(Event, id=event_id)
 
@@ -146,6 +209,9 @@ def booking_create_on_behalf(request, event_id):
             person=target_user,
             defaults={"cancelledBy": request.user, "cancelledOn": timezone.now()},
         )
+        if created:
+            metrics.BOOKINGS_CREATED.inc()
+            audit.log(booking, BookingLogEntry.ACTION_CREATE, request.user)
 
         if booking.is_cancelled() and event.is_fully_booked():
             messages.error(request, "Sorry the event is fully booked already")
@@ -193,9 +259,12 @@ def _booking_update_session(request, booking, form_target_url):
     """
     Handle the form to select the session for a booking
     """
+    was_cancelled = booking.is_cancelled()
+    previous_session_id = booking.session_id
     session_form = BookingSessionForm(
         form_target_url, request.POST or None, instance=booking
     )
+    idempotency.add_hidden_key(session_form.helper)
     if session_form.is_valid():
         if booking.is_cancelled() and booking.event.is_fully_booked():
             messages.error(request, "Sorry the event is fully booked already")
@@ -216,6 +285,12 @@ def _booking_update_session(request, booking, form_target_url):
         booking.cancelledBy = None
         booking.cancelledOn = None
         booking.save()
+        if was_cancelled:
+            audit.log(booking, BookingLogEntry.ACTION_CONFIRM, request.user)
+        if booking.session_id != previous_session_id:
+            audit.log(
+                booking, BookingLogEntry.ACTION_SESSION, request.user, session.title
+            )
 
         if booking.event.choices.count() > 0:
             messages.warning(
@@ -246,8 +321,10 @@ def _booking_update_with_sessions(request, booking):
     elif booking.event.choices.count() > 0:
         # Step 2: Handling Choices
         choices_form = BookingChoicesForm(booking, request.POST or None)
+        idempotency.add_hidden_key(choices_form.helper)
         if choices_form.is_valid():
             choices_form.save()
+            audit.log(booking, BookingLogEntry.ACTION_CHOICES, request.user)
 
             return _booking_update_finished_redirect(request, booking, "Choices")
         else:
@@ -265,6 +342,7 @@ def _booking_update_no_session(request, booking):
     View to handle the modification of bookings on events without session
     """
     choices_form = BookingChoicesForm(booking, request.POST or None)
+    idempotency.add_hidden_key(choices_form.helper)
 
     if choices_form.is_valid():
         if booking.is_cancelled() and booking.event.is_fully_booked():
@@ -272,10 +350,13 @@ def _booking_update_no_session(request, booking):
             return redirect("index")
 
         choices_form.save()
+        if choices_form.fields:
+            audit.log(booking, BookingLogEntry.ACTION_CHOICES, request.user)
         if booking.is_cancelled():
             booking.confirmedOn = timezone.now()
             booking.cancelledBy = None
             booking.cancelledOn = None
+            audit.log(booking, BookingLogEntry.ACTION_CONFIRM, request.user)
         booking.save()
 
         return _booking_update_finished_redirect(request, booking, "Registration")
@@ -285,6 +366,8 @@ def _booking_update_no_session(request, booking):
 
 
 @login_required
+@idempotency.idempotent
+@audit.buffered()
 def booking_update(request, booking_id):
     """
     Main view for updates to bookings: session and choices selection, or confirmation
@@ -304,6 +387,7 @@ def booking_update(request, booking_id):
 
 
 @login_required
+@audit.buffered()
 def booking_session_update(request, booking_id):
     """
     View to change the session on a booking
@@ -320,6 +404,9 @@ def booking_session_update(request, booking_id):
 
 
 @login_required
+@idempotency.idempotent
+@metrics.timed(metrics.VIEW_DURATION, view="booking_cancel")
+@audit.buffered()
 def booking_cancel(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id)
 
@@ -334,13 +421,16 @@ def booking_cancel(request, booking_id):
         booking.cancelledBy = request.user
         booking.cancelledOn = timezone.now()
         booking.save()
+        metrics.BOOKINGS_CANCELLED.inc()
+        audit.log(booking, BookingLogEntry.ACTION_CANCEL, request.user)
         messages.warning(request, "Registration cancelled")
         if request.user == booking.person:
             return redirect("events_list_mine")
         else:
             return redirect("event_manage", event_id=booking.event.id)
     else:
-        return render(request, "oneevent/booking_cancel.html", {"booking": booking})
+        context = {"booking": booking, "idempotency_key": idempotency.new_key()}
+        return render(request, "oneevent/booking_cancel.html", context)
 
 
 def get_registration_url(request, event_id):
@@ -354,11 +444,13 @@ def get_registration_url(request, event_id):
 
 
 @login_required
+@db_routing.use_read_replica
+@condition(
+    etag_func=versions.event_etag, last_modified_func=versions.event_last_modified
+)
 def event_manage(request, event_id):
     try:
-        event = Event.objects.prefetch_related(
-            "bookings__person", "bookings__options__option"
-        ).get(id=event_id)
+        event = Event.objects.get(id=event_id)
     except Event.DoesNotExist:
         return Http404
 
@@ -369,13 +461,68 @@ def event_manage(request, event_id):
     # Activate the timezone from the event
     timezone.activate(event.timezone)
 
+    filter_form = BookingFilterForm(event, request.GET or None)
+    filters, sort = filter_form.get_filters()
+    page = bookings_table.get_page(event, filters, sort)
+    bookings_table_url = reverse("event_bookings_table", kwargs={"event_id": event_id})
+    if request.GET:
+        bookings_table_url += "?" + request.GET.urlencode()
     context = {
         "event": event,
+        "state": event.get_state(),
+        "filter_form": filter_form,
+        "bookings": page["bookings"],
+        "bookings_more": page["more"],
+        "bookings_next_cursor": page["next_cursor"],
+        "bookings_table_url": bookings_table_url,
+        "has_sessions": event.sessions.exists(),
         "registration_url": get_registration_url(request, event_id),
     }
     return render(request, "oneevent/event_manage.html", context)
 
 
+@login_required
+@db_routing.use_read_replica
+def event_bookings_table(request, event_id):
+    """
+    Page through the rows of the bookings table of the management page of an event
+    The filters and sort are given by the BookingFilterForm GET parameters, with
+    the "cursor" of the page and its "limit".
+    """
+    event = get_object_or_404(Event, id=event_id)
+
+    if not event.user_can_update(request.user):
+        return JsonResponse(
+            {"error": "You are not authorised to list the bookings of this event"},
+            status=403,
+        )
+
+    filter_form = BookingFilterForm(event, request.GET)
+    if not filter_form.is_valid():
+        return JsonResponse({"error": filter_form.errors}, status=400)
+    filters, sort = filter_form.get_filters()
+    try:
+        limit = int(request.GET.get("limit", bookings_table.DEFAULT_LIMIT))
+        page = bookings_table.get_page(
+            event, filters, sort, request.GET.get("cursor"), limit
+        )
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    timezone.activate(event.timezone)
+    context = {
+        "event": event,
+        "bookings": page["bookings"],
+        "has_sessions": event.sessions.exists(),
+    }
+    html = render_to_string(
+        "oneevent/event_manage_bookings_rows.html", context, request
+    )
+    return JsonResponse(
+        {"html": html, "next_cursor": page["next_cursor"], "more": page["more"]}
+    )
+
+
 def _event_edit_form(request, event):
     """
     Handle the edition of an event from the form page
@@ -535,6 +682,120 @@ def event_create(request):
     return _event_edit_form(request, new_event)
 
 
+@login_required
+def event_clone(request, event_id):
+    """
+    Create a new event with the categories, sessions, choices and options of an
+    existing one
+    """
+    event = get_object_or_404(Event, id=event_id)
+
+    if not event.user_can_update(request.user):
+        messages.error(request, "You are not authorised to clone this event !")
+        return redirect("index")
+
+    # Dates in the form are in the timezone of the event
+    timezone.activate(event.timezone)
+
+    form = EventCloneForm(event.id, request.POST or None)
+    if form.is_valid():
+        new_event = cloning.clone_event(
+            event,
+            form.cleaned_data["title"],
+            form.cleaned_data["start"],
+            owner=request.user,
+        )
+        messages.success(request, "Event cloned, please review it before publishing")
+        return redirect("event_update", event_id=new_event.id)
+
+    context = {"form": form, "event": event}
+    return render(request, "oneevent/event_clone.html", context)
+
+
+@login_required
+def event_import_bookings(request, event_id):
+    """
+    Register the participants listed in an uploaded CSV file
+    """
+    event = get_object_or_404(Event, id=event_id)
+
+    if not event.user_is_organiser(request.user):
+        messages.error(request, "You can not create bookings for this event")
+        return redirect("index")
+
+    timezone.activate(event.timezone)
+
+    report = None
+    form = BookingImportForm(event.id, request.POST or None, request.FILES or None)
+    if form.is_valid():
+        dry_run = form.cleaned_data["dry_run"]
+        try:
+            report = importing.import_bookings(
+                event, form.cleaned_data["file"], request.user, dry_run=dry_run
+            )
+        except (ValueError, UnicodeDecodeError) as e:
+            form.add_error("file", str(e))
+        else:
+            if dry_run:
+                messages.info(
+                    request,
+                    "{0} booking(s) would be created, {1} confirmed again".format(
+                        report["created"], report["reactivated"]
+                    ),
+                )
+            else:
+                messages.success(
+                    request,
+                    "{0} booking(s) created, {1} confirmed again".format(
+                        report["created"], report["reactivated"]
+                    ),
+                )
+                if not report["errors"]:
+                    return redirect("event_manage", event_id=event.id)
+
+    context = {"form": form, "event": event, "report": report}
+    return render(request, "oneevent/event_import_bookings.html", context)
+
+
+@login_required
+def event_register_members(request, event_id):
+    """
+    Register all the users matched by the categories of an event
+    """
+    event = get_object_or_404(Event, id=event_id)
+
+    if not event.user_is_organiser(request.user):
+        messages.error(request, "You can not create bookings for this event")
+        return redirect("index")
+
+    if request.method == "POST":
+        try:
+            report = importing.register_category_members(event, request.user)
+        except ValueError as e:
+            messages.error(request, str(e))
+            return redirect("event_manage", event_id=event.id)
+        messages.success(
+            request,
+            "{0} booking(s) created, {1} user(s) already registered".format(
+                report["created"], report["already registered"]
+            ),
+        )
+        if report["full"]:
+            messages.warning(
+                request,
+                "{0} user(s) not registered, the event is fully booked".format(
+                    report["full"]
+                ),
+            )
+        return redirect("event_manage", event_id=event.id)
+
+    timezone.activate(event.timezone)
+    members = event.get_category_members()
+    unregistered = members.exclude(bookings__event=event).count()
+    context = {"event": event, "unregistered": unregistered}
+    return render(request, "oneevent/event_register_members.html", context)
+
+
 @login_required
 def _choice_edit_form(request, choice):
     """
@@ -555,7 +816,9 @@ def _choice_edit_form(request, choice):
         # Update existing bookings with a deleted option to the new default
         for deleted_option in options_formset.deleted_options:
             part_options = BookingOption.objects.filter(option=deleted_option)
-            part_options.update(option=options_formset.new_default)
+            now = timezone.now()
+            Booking.objects.filter(options__in=part_options).update(updated_at=now)
+            part_options.update(option=options_formset.new_default, updated_at=now)
 
         # Save choice changes
         choice_form.save()
@@ -623,6 +886,8 @@ def choice_delete(request, choice_id):
 
 
 @login_required
+@idempotency.idempotent
+@audit.buffered()
 def booking_payment_confirm(request, booking_id, cancel=False):
     booking = get_object_or_404(Booking, id=booking_id)
 
@@ -636,10 +901,13 @@ def booking_payment_confirm(request, booking_id, cancel=False):
         if not cancel:
             booking.paidTo = request.user
             booking.datePaid = timezone.now()
+            action = BookingLogEntry.ACTION_PAY
         else:
             booking.paidTo = None
             booking.datePaid = None
+            action = BookingLogEntry.ACTION_REFUND
         booking.save()
+        audit.log(booking, action, request.user)
 
         if not cancel:
             messages.success(
@@ -655,11 +923,16 @@ def booking_payment_confirm(request, booking_id, cancel=False):
         return redirect("event_manage", event_id=booking.event.id)
     else:
         timezone.activate(booking.event.timezone)
-        context = {"booking": booking, "cancel": cancel}
+        context = {
+            "booking": booking,
+            "cancel": cancel,
+            "idempotency_key": idempotency.new_key(),
+        }
         return render(request, "oneevent/booking_payment_confirm.html", context)
 
 
 @login_required
+@audit.buffered()
 def booking_payment_exempt(request, booking_id, cancel=False):
     booking = get_object_or_404(Booking, id=booking_id)
 
@@ -681,11 +954,14 @@ def booking_payment_exempt(request, booking_id, cancel=False):
             booking.paidTo = request.user
             booking.datePaid = timezone.now()
             booking.exempt_of_payment = True
+            action = BookingLogEntry.ACTION_EXEMPT
         else:
             booking.paidTo = None
             booking.datePaid = None
             booking.exempt_of_payment = False
+            action = BookingLogEntry.ACTION_UNEXEMPT
         booking.save()
+        audit.log(booking, action, request.user)
 
         if not cancel:
             messages.success(
@@ -705,6 +981,11 @@ def booking_payment_exempt(request, booking_id, cancel=False):
 
 
 @login_required
+@db_routing.use_read_replica
+@condition(
+    etag_func=versions.event_etag, last_modified_func=versions.event_last_modified
+)
+@metrics.timed(metrics.CSV_EXPORT_DURATION, export="options_summary")
 def event_download_options_summary(request, event_id):
     event = get_object_or_404(Event, id=event_id)
 
@@ -717,12 +998,23 @@ def event_download_options_summary(request, event_id):
     filename = "{0}_options_{1}.csv".format(
         slugify(event.title), timezone.now().strftime("%Y%m%d%H%M%S")
     )
+    f = export_cache.open_export(
+        event, "options_summary", lambda f: _write_options_summary(event, f)
+    )
+    return _csv_file_response(f, filename)
 
-    # Create the HttpResponse object with the appropriate CSV header.
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = 'attachment; filename="{0}"'.format(filename)
-    writer = unicode_csv.UnicodeWriter(response)
 
+def _csv_file_response(f, filename):
+    """
+    Send a CSV export from an open file, without copying it in memory
+    """
+    return FileResponse(
+        f, as_attachment=True, filename=filename, content_type="text/csv"
+    )
+
+
+def _write_options_summary(event, f):
+    writer = unicode_csv.UnicodeWriter(f)
     summary_values = event.get_options_counts()
     writer.writerow(["Choice", "Options"])
     for choice, options in summary_values.items():
@@ -731,11 +1023,63 @@ def event_download_options_summary(request, event_id):
             row.append(option.title)
             row.append(str(total))
         writer.writerow(row)
+        metrics.CSV_EXPORT_ROWS.inc(export="options_summary")
 
-    return response
+
+@login_required
+@db_routing.use_read_replica
+@condition(
+    etag_func=versions.event_etag, last_modified_func=versions.event_last_modified
+)
+def event_download_options_totals(request, event_id):
+    """
+    Send a long-format CSV with one row per option of the event
+    """
+    event = get_object_or_404(Event, id=event_id)
+
+    if not event.user_can_update(request.user):
+        messages.error(
+            request, "You are not authorised to download options for this event !"
+        )
+        return redirect("index")
+
+    filename = "{0}_options_totals_{1}.csv".format(
+        slugify(event.title), timezone.now().strftime("%Y%m%d%H%M%S")
+    )
+
+    if settings.ONEEVENT_EXPORT_CACHE_DIR is None:
+        # Nothing to keep, the rows are streamed as they are read
+        writer = unicode_csv.UnicodeWriter()
+        response = StreamingHttpResponse(
+            writer.iterrows(_options_totals_rows(event)), content_type="text/csv"
+        )
+        response["Content-Disposition"] = 'attachment; filename="{0}"'.format(
+            filename
+        )
+        return response
+
+    f = export_cache.open_export(
+        event,
+        "options_totals",
+        lambda f: unicode_csv.UnicodeWriter(f).writerows(_options_totals_rows(event)),
+    )
+    return _csv_file_response(f, filename)
+
+
+def _options_totals_rows(event):
+    yield ["Choice", "Option", "Count", "Default"]
+    with metrics.CSV_EXPORT_DURATION.time(export="options_totals"):
+        for choice, option, total, default in event.get_options_totals():
+            yield [choice, option, str(total), "Yes" if default else "No"]
+            metrics.CSV_EXPORT_ROWS.inc(export="options_totals")
 
 
 @login_required
+@db_routing.use_read_replica
+@condition(
+    etag_func=versions.event_etag, last_modified_func=versions.event_last_modified
+)
+@metrics.timed(metrics.CSV_EXPORT_DURATION, export="participants_list")
 def event_download_participants_list(request, event_id):
     event = get_object_or_404(Event, id=event_id)
 
@@ -748,13 +1092,18 @@ def event_download_participants_list(request, event_id):
     filename = "{0}_participants_{1}.csv".format(
         slugify(event.title), timezone.now().strftime("%Y%m%d%H%M%S")
     )
+    f = export_cache.open_export(
+        event, "participants_list", lambda f: _write_participants_list(event, f)
+    )
+    return _csv_file_response(f, filename)
 
-    # Create the HttpResponse object with the appropriate CSV header.
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = 'attachment; filename="{0}"'.format(filename)
-    writer = unicode_csv.UnicodeWriter(response)
 
-    bookings = event.bookings.order_by("person__last_name", "person__first_name")
+def _write_participants_list(event, f):
+    writer = unicode_csv.UnicodeWriter(f)
+
+    bookings = event.get_bookings().order_by(
+        "person__last_name", "person__first_name"
+    )
 
     header_row = [
         "Last name",
@@ -838,29 +1187,136 @@ def event_download_participants_list(request, event_id):
         for option in booking.options.all():
             row.append(option.option.title)
         writer.writerow(row)
+        metrics.CSV_EXPORT_ROWS.inc(export="participants_list")
+
+
+@login_required
+@db_routing.use_read_replica
+def export_json_lines(request):
+    """
+    Stream the export of all events and bookings in the JSON Lines format
+    """
+    if not request.user.is_superuser:
+        messages.error(request, "You are not authorised to export all the data !")
+        return redirect("index")
 
+    try:
+        since = export.parse_since(request.GET.get("since"))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    filename = "oneevent_{0}.jsonl".format(timezone.now().strftime("%Y%m%d%H%M%S"))
+    lines = export.iter_json_lines(since)
+    if request.GET.get("gzip"):
+        filename += ".gz"
+        response = StreamingHttpResponse(
+            export.gzip_stream(lines), content_type="application/gzip"
+        )
+    else:
+        response = StreamingHttpResponse(lines, content_type="application/jsonl")
+    response["Content-Disposition"] = 'attachment; filename="{0}"'.format(filename)
     return response
 
 
+@login_required
+@db_routing.use_read_replica
+def event_bookings_changes(request, event_id):
+    """
+    Page through the changes of the bookings of an event, for incremental syncs
+    """
+    event = get_object_or_404(Event, id=event_id)
+
+    if not event.user_can_update(request.user):
+        return JsonResponse(
+            {"error": "You are not authorised to list the bookings of this event"},
+            status=403,
+        )
+
+    try:
+        limit = int(request.GET.get("limit", 100))
+        page = changes.get_changes(event, request.GET.get("cursor"), limit)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(page)
+
+
+@login_required
+@db_routing.use_read_replica
+def event_booking_rate(request, event_id):
+    """
+    Time series of the number of bookings confirmed per minute for an event
+    """
+    event = get_object_or_404(Event, id=event_id)
+
+    if not event.user_can_update(request.user):
+        return JsonResponse(
+            {"error": "You are not authorised to list the bookings of this event"},
+            status=403,
+        )
+
+    action = request.GET.get("action", BookingLogEntry.ACTION_CONFIRM)
+    if action not in dict(BookingLogEntry.ACTION_CHOICES_LIST):
+        return JsonResponse({"error": "Invalid action: {0}".format(action)}, status=400)
+    series = audit.booking_rate(event, action)
+    return JsonResponse(
+        {"action": action, "series": [[minute, count] for minute, count in series]}
+    )
+
+
+@login_required
+def event_bookings_bulk_update(request, event_id, action):
+    """
+    Apply the same change of state to several bookings of an event at once
+    The IDs of the bookings are given by the "booking" POST parameters.
+    """
+    event = get_object_or_404(Event, id=event_id)
+
+    if not event.user_can_update(request.user):
+        return JsonResponse(
+            {"error": "You are not authorised to manage the bookings of this event"},
+            status=403,
+        )
+    if request.method != "POST":
+        return JsonResponse({"error": "Only POST requests are allowed"}, status=405)
+    if action not in bulk.ACTIONS:
+        return JsonResponse({"error": "Invalid action: {0}".format(action)}, status=400)
+
+    try:
+        booking_ids = [int(value) for value in request.POST.getlist("booking")]
+    except ValueError:
+        return JsonResponse({"error": "Invalid booking ID"}, status=400)
+    summary = bulk.update_bookings(request.user, action, booking_ids, event)
+    return JsonResponse(summary)
+
+
 @login_required
 def booking_send_invite(request, booking_id):
     if settings.ONEEVENT_CALENDAR_INVITE_FROM is not None:
         booking = get_object_or_404(Booking, id=booking_id)
-        if booking.send_calendar_invite():
-            messages.success(request, "Invitation sent to your email")
-        else:
-            messages.error(request, "Failure sending the invitation")
+        booking.enqueue_calendar_invite()
+        messages.success(request, "Invitation will be sent to your email shortly")
     else:
         messages.warning(request, "This site is not configured to send emails.")
 
     return redirect("booking_update", booking_id=booking_id)
 
 
+def metrics_export(request):
+    """
+    Expose the application metrics in the Prometheus text format
+    """
+    if not settings.ONEEVENT_METRICS_ENABLED:
+        raise Http404("Metrics are not enabled")
+    return HttpResponse(
+        metrics.REGISTRY.render(), content_type="text/plain; version=0.0.4"
+    )
+
+
 @login_required
 def user_delete(request):
     if request.method == "POST":
         user = request.user
-        user.delete()
+        deletion.delete_user(user)
         messages.success(request, "Account deleted")
 
         return redirect("index")
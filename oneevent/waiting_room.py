@@ -0,0 +1,170 @@
+"""
+Waiting room of the events opening their bookings to a rush of users.
+
+When the admission_rate of an event is set, the users asking to register get a
+ticket for a second of admission, handed out in order by the Django cache: each
+second admits at most admission_rate tickets, the next tickets get the following
+seconds. Until their second comes, the users wait on a page polling the
+waiting_room_status URL, which reads the signed ticket only, without the database.
+Once admitted, a user can register during ONEEVENT_WAITING_ROOM_ADMISSION_SECONDS
+before needing a new ticket. The registrations, with their permission checks and
+capacity counts, so reach the database at a steady rate whatever the rush.
+
+The cache must be shared by all the processes serving the site and support atomic
+increments, e.g. memcached or redis.
+"""
+import logging
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.shortcuts import render
+from django.urls import reverse
+
+from . import metrics
+from .models import Event
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "oneevent:waiting_room:"
+SESSION_KEY = "oneevent_waiting_room_tickets"
+SALT = "oneevent.waiting_room"
+# How long the admission rate of an event is cached, in seconds
+RATE_TIMEOUT = 10
+# How long the counters of the seconds are kept once past, in seconds
+SLOT_TIMEOUT = 60
+# Attempts at incrementing the counter of a second before admitting the ticket
+MAX_ATTEMPTS = 3
+
+
+def get_admission_rate(event_id):
+    """
+    @return: the admission rate of an event, or 0 if it has no waiting room
+    """
+    key = "{0}{1}:rate".format(KEY_PREFIX, event_id)
+    rate = cache.get(key)
+    if rate is None:
+        rate = (
+            Event.objects.filter(id=event_id)
+            .values_list("admission_rate", flat=True)
+            .first()
+        ) or 0
+        cache.set(key, rate, RATE_TIMEOUT)
+    return rate
+
+
+def _take_second(event_id, rate, now):
+    """
+    Hand out the next ticket of an event
+    @return: the second at which the ticket is admitted
+    """
+    cursor_key = "{0}{1}:cursor".format(KEY_PREFIX, event_id)
+    # The cursor skips the seconds known to be full, it may lag behind under
+    # concurrency as the counters decide
+    second = max(int(now), cache.get(cursor_key, 0))
+    attempts = 0
+    while True:
+        key = "{0}{1}:second:{2}".format(KEY_PREFIX, event_id, second)
+        timeout = max(second - int(now), 0) + SLOT_TIMEOUT
+        cache.add(key, 0, timeout)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # Evicted meanwhile, or the cache does not keep the counters
+            attempts += 1
+            if attempts < MAX_ATTEMPTS:
+                continue
+            logger.error(
+                "The cache does not support atomic increments, the waiting room "
+                "of event %s admits everyone",
+                event_id,
+            )
+            return int(now)
+        if count >= rate:
+            cache.set(cursor_key, second + 1, timeout)
+        if count <= rate:
+            return second
+        second += 1
+
+
+def _load_ticket(token, event_id, user_id=None):
+    """
+    @return: the second of admission of a ticket, or None if it is not valid
+    """
+    try:
+        ticket = signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        return None
+    if ticket.get("e") != event_id or (
+        user_id is not None and ticket.get("u") != user_id
+    ):
+        return None
+    return ticket.get("s")
+
+
+def get_status(token, event_id, now=None):
+    """
+    Get the position in the queue of a ticket
+    @return: a dict telling whether the ticket is "admitted", else the "wait" in
+    seconds and the estimated "position" in the queue, or None if the ticket is not
+    valid or expired
+    """
+    now = now or time.time()
+    second = _load_ticket(token, event_id)
+    admission_seconds = settings.ONEEVENT_WAITING_ROOM_ADMISSION_SECONDS
+    if second is None or now >= second + admission_seconds:
+        return None
+    if now >= second:
+        return {"admitted": True, "wait": 0, "position": 0}
+    rate = get_admission_rate(event_id) or 1
+    return {
+        "admitted": False,
+        "wait": math.ceil(second - now),
+        "position": math.ceil((second - now) * rate),
+    }
+
+
+def admission_required(view):
+    """
+    Decorator of a view taking an event_id, making the users wait for their turn
+    when the event has a waiting room. It must be applied after login_required.
+    """
+
+    @wraps(view)
+    def wrapper(request, event_id, *args, **kwargs):
+        rate = get_admission_rate(event_id)
+        if not rate:
+            return view(request, event_id, *args, **kwargs)
+
+        now = time.time()
+        tickets = request.session.get(SESSION_KEY, {})
+        token = tickets.get(str(event_id))
+        second = None
+        if token is not None:
+            second = _load_ticket(token, event_id, request.user.id)
+        admission_seconds = settings.ONEEVENT_WAITING_ROOM_ADMISSION_SECONDS
+        if second is None or now >= second + admission_seconds:
+            second = _take_second(event_id, rate, now)
+            token = signing.dumps(
+                {"e": event_id, "u": request.user.id, "s": second}, salt=SALT
+            )
+            tickets[str(event_id)] = token
+            request.session[SESSION_KEY] = tickets
+
+        if now >= second:
+            metrics.WAITING_ROOM_REQUESTS.inc(result="admitted")
+            return view(request, event_id, *args, **kwargs)
+        metrics.WAITING_ROOM_REQUESTS.inc(result="queued")
+        context = {
+            "status_url": reverse("waiting_room_status", args=[event_id]),
+            "next_url": request.get_full_path(),
+            "token": token,
+            "wait": math.ceil(second - now),
+            "position": math.ceil((second - now) * rate),
+        }
+        return render(request, "oneevent/waiting_room.html", context)
+
+    return wrapper